@@ -0,0 +1,98 @@
+"""
+Compares the cost per matching entry of testing a templated criterion, as
+done by :py:class:`dirmagic.pattern_criteria.AllMatchCriterion`:
+
+* ``copy + format``: the criterion copied with ``copy.copy`` and the
+  templates expanded on the copy (the implementation before the criteria
+  tested the expanded values directly),
+* ``expand_pattern``: the expanded copy needed for the result trees,
+* ``matches``: testing with the match groups, without copying.
+
+Usage::
+
+    python benchmarks/expand_pattern.py [number of files]
+"""
+
+import copy
+import pathlib
+import re
+import sys
+import tempfile
+import time
+import typing
+
+from dirmagic.core_criteria import Criterion
+from dirmagic.generic_criteria import HasFile
+from dirmagic.pattern_criteria import AllMatchCriterion, SuffixIsIn
+
+
+def copy_and_format(criterion: Criterion, *args: typing.Any) -> Criterion:
+    expanded = copy.copy(criterion)
+    for template_attribute in criterion.template_attributes or []:
+        setattr(
+            expanded,
+            template_attribute,
+            str(getattr(expanded, template_attribute)).format(*args),
+        )
+    return expanded
+
+
+def per_match(
+    test: typing.Callable[[typing.Match[str]], bool],
+    matches: typing.List[typing.Match[str]],
+) -> float:
+    start = time.perf_counter()
+    for match in matches:
+        test(match)
+    return (time.perf_counter() - start) / len(matches) * 1e6
+
+
+def main() -> None:
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    pattern = re.compile(r"(.*)\.txt$")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = pathlib.Path(tmp_dir)
+        for i in range(n_files):
+            (root / f"f{i}.txt").touch()
+        matches = [
+            m
+            for m in map(
+                pattern.search, sorted(p.name for p in root.iterdir())
+            )
+            if m
+        ]
+
+        for criterion in (
+            HasFile("{0[1]}.txt"),
+            SuffixIsIn("{0[0]}", [".txt", ".csv"]),
+        ):
+            print(criterion.describe())
+            for name, test in (
+                (
+                    "copy + format",
+                    lambda m: copy_and_format(criterion, m).matches(root),
+                ),
+                (
+                    "expand_pattern",
+                    lambda m: criterion.expand_pattern(m).matches(root),
+                ),
+                ("matches", lambda m: criterion.matches(root, m)),
+            ):
+                print(
+                    f"  {name:>15}: {per_match(test, matches):6.2f} µs/match"
+                )
+
+        all_match = AllMatchCriterion(r".*\.txt$", HasFile("{0[0]}"))
+        for name, run in (
+            ("test (result tree)", all_match.test),
+            ("matches", all_match.matches),
+        ):
+            start = time.perf_counter()
+            assert run(root)
+            elapsed = time.perf_counter() - start
+            print(f"{all_match.describe()}\n  {name}: {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the sequential and the parallel search of :py:func:`find_projects`
+on a directory tree with a simulated filesystem latency.
+
+The latency is added to every criterion test, which is what dominates the
+search on network filesystems like NFS or SMB mounts.
+
+Usage::
+
+    python benchmarks/find_projects_latency.py [latency in ms]
+"""
+
+import pathlib
+import sys
+import tempfile
+import time
+
+from dirmagic import find_projects
+from dirmagic.core_criteria import CriterionFromTestFun, PathSpec
+
+
+def build_tree(root: pathlib.Path, width: int = 8, depth: int = 3) -> None:
+    dirs = [root]
+    for _ in range(depth):
+        dirs = [d / f"d{i}" for d in dirs for i in range(width)]
+    for d in dirs:
+        d.mkdir(parents=True)
+    # every third leaf directory is a project
+    for d in dirs[::3]:
+        (d / ".git").mkdir()
+
+
+def main() -> None:
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+
+    def slow_has_git(dir: PathSpec) -> bool:
+        time.sleep(latency)
+        return (pathlib.Path(dir) / ".git").is_dir()
+
+    criterion = CriterionFromTestFun(slow_has_git)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = pathlib.Path(tmp_dir)
+        build_tree(root)
+
+        baseline = None
+        for workers in (None, 4, 8, 16, 32):
+            start = time.perf_counter()
+            found = find_projects(
+                root, criterion, maxdepth=-1, workers=workers
+            )
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = elapsed
+                expected = found
+            assert found == expected
+            print(
+                f"workers={workers!s:>4}: {elapsed:7.3f}s"
+                f"  speedup {baseline / elapsed:5.1f}x  ({len(found)} found)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures the search of :py:func:`find_projects` on a process pool for
+growing directory trees. The time per directory should stay the same for
+all tree sizes, i.e. the search scales linearly with the number of
+directories.
+
+Usage::
+
+    python benchmarks/find_projects_processes.py [largest number of dirs]
+"""
+
+import pathlib
+import sys
+import tempfile
+import time
+
+from dirmagic import find_projects
+from dirmagic.project_types import is_vcs_root
+
+
+def build_tree(root: pathlib.Path, n_dirs: int, width: int = 10) -> None:
+    created = 0
+    dirs = [root]
+    while created < n_dirs:
+        next_dirs = []
+        for d in dirs:
+            for i in range(width):
+                sub_dir = d / f"d{i}"
+                sub_dir.mkdir()
+                next_dirs.append(sub_dir)
+                created += 1
+                if created == n_dirs:
+                    break
+            if created == n_dirs:
+                break
+        dirs = next_dirs
+    # every hundredth directory of the deepest level is a project
+    for d in dirs[::100]:
+        (d / ".git").mkdir()
+
+
+def main() -> None:
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    n_dirs = largest // 8
+    while n_dirs <= largest:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            root = pathlib.Path(tmp_dir)
+            build_tree(root, n_dirs)
+            start = time.perf_counter()
+            found = find_projects(
+                root, is_vcs_root, maxdepth=-1, workers=4, pool="process"
+            )
+            elapsed = time.perf_counter() - start
+        print(
+            f"{n_dirs:>8} dirs: {elapsed:7.3f}s"
+            f"  {elapsed / n_dirs * 1e6:6.1f} µs/dir  ({len(found)} found)"
+        )
+        n_dirs *= 2
+
+
+if __name__ == "__main__":
+    main()
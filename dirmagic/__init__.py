@@ -1,6 +1,22 @@
 # this file defines the toplevel namespace for dirmagic
 from . import core_criteria, generic_criteria, pattern_criteria, project_types
-from .functions import find_projects, find_root, identify_project
+from .async_functions import (
+    async_find_projects,
+    async_find_root,
+    async_identify_project,
+    async_iter_projects,
+)
+from .functions import (
+    find_projects,
+    find_root,
+    find_roots,
+    identify_project,
+    identify_projects,
+    IdentifiedProject,
+    iter_projects,
+    RootFinder,
+    scan_projects,
+)
 
 __all__ = [
     "core_criteria",
@@ -9,5 +25,15 @@ __all__ = [
     "project_types",
     "find_projects",
     "find_root",
+    "find_roots",
     "identify_project",
+    "identify_projects",
+    "IdentifiedProject",
+    "iter_projects",
+    "scan_projects",
+    "RootFinder",
+    "async_find_projects",
+    "async_find_root",
+    "async_identify_project",
+    "async_iter_projects",
 ]
@@ -0,0 +1,143 @@
+"""
+Adaptive ordering of the criteria of
+:py:class:`dirmagic.core_criteria.AnyCriteria` and
+:py:class:`dirmagic.core_criteria.AllCriteria`, based on the statistics
+recorded while testing (see
+:py:class:`dirmagic.core_criteria.CriteriaStatistics`).
+
+.. code-block:: python
+
+    adaptive_criterion = enable_adaptive_order(criterion)
+    find_projects(path, adaptive_criterion, maxdepth=-1)
+    with open("statistics.json", "w") as f:
+        json.dump(export_statistics(adaptive_criterion), f)
+
+    # later, e.g. in a new process
+    adaptive_criterion = enable_adaptive_order(criterion)
+    with open("statistics.json") as f:
+        import_statistics(adaptive_criterion, json.load(f))
+
+The statistics are stored in a copy of the criterion, i.e. the criterion
+passed in (e.g. the predefined project type ``is_vcs_root``) is left alone
+and its other uses keep the declared order. The counters are not protected
+by a lock, tests running in parallel can lose a few counts.
+"""
+
+import copy
+import typing
+
+from .core_criteria import (
+    AllCriteria,
+    AnyCriteria,
+    CriteriaStatistics,
+    Criterion,
+    _shallow_copy,
+    criterion_key,
+)
+
+__all__ = [
+    "disable_adaptive_order",
+    "enable_adaptive_order",
+    "export_statistics",
+    "import_statistics",
+]
+
+
+def _iter_nodes(
+    criterion: Criterion,
+) -> typing.Iterator[typing.Union[AnyCriteria, AllCriteria]]:
+    """
+    The Any and All criteria in the criterion tree.
+    """
+    if isinstance(criterion, (AnyCriteria, AllCriteria)):
+        yield criterion
+        for c in criterion.criteria:
+            yield from _iter_nodes(c)
+        return
+    # NotCriterion, ProjectType, AnyMatchCriterion, ...
+    sub_criterion = getattr(criterion, "criterion", None)
+    if isinstance(sub_criterion, Criterion):
+        yield from _iter_nodes(sub_criterion)
+
+
+def enable_adaptive_order(
+    criterion: Criterion, reorder_every: int = 100
+) -> Criterion:
+    """
+    Returns a copy of the criterion with the statistics of all Any and All
+    criteria in the tree enabled. The criteria without Any or All criteria
+    inside are shared with the criterion passed in.
+
+    :param criterion: the criterion
+    :param reorder_every: the number of tests between reordering, see
+        :py:class:`dirmagic.core_criteria.CriteriaStatistics`
+    """
+    if isinstance(criterion, (AnyCriteria, AllCriteria)):
+        node = _shallow_copy(criterion)
+        node.criteria = tuple(
+            enable_adaptive_order(c, reorder_every) for c in criterion.criteria
+        )
+        if criterion.statistics is None:
+            node.statistics = CriteriaStatistics(
+                len(node.criteria),
+                isinstance(node, AnyCriteria),
+                reorder_every,
+            )
+        else:
+            node.statistics = copy.deepcopy(criterion.statistics)
+        return node
+    # NotCriterion, ProjectType, AnyMatchCriterion, ...
+    sub_criterion = getattr(criterion, "criterion", None)
+    if isinstance(sub_criterion, Criterion) and any(
+        True for _ in _iter_nodes(sub_criterion)
+    ):
+        wrapper = _shallow_copy(criterion)
+        setattr(
+            wrapper,
+            "criterion",
+            enable_adaptive_order(sub_criterion, reorder_every),
+        )
+        return wrapper
+    return criterion
+
+
+def disable_adaptive_order(criterion: Criterion) -> None:
+    """
+    Drops the statistics, the criteria are tested in the declared order.
+    """
+    for node in _iter_nodes(criterion):
+        node.statistics = None
+
+
+def export_statistics(
+    criterion: Criterion,
+) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """
+    The statistics of the criterion tree as JSON compatible dictionary,
+    keyed by the :py:func:`dirmagic.core_criteria.criterion_key` of the Any and
+    All criteria.
+
+    Raises ValueError for criteria which can't be serialized.
+    """
+    return {
+        criterion_key(node): node.statistics.export()
+        for node in _iter_nodes(criterion)
+        if node.statistics is not None
+    }
+
+
+def import_statistics(
+    criterion: Criterion,
+    statistics: typing.Dict[str, typing.Dict[str, typing.Any]],
+) -> None:
+    """
+    Restores the statistics exported by :py:func:`export_statistics` for the
+    Any and All criteria with adaptive order enabled. Criteria without
+    statistics exported are left alone.
+
+    Raises ValueError if the statistics don't fit the criteria.
+    """
+    for node in _iter_nodes(criterion):
+        node_statistics = statistics.get(criterion_key(node))
+        if node.statistics is not None and node_statistics is not None:
+            node.statistics.load(node_statistics)
@@ -0,0 +1,249 @@
+"""
+Asynchronous counterparts of the top level functions for use with
+:external+python:py:mod:`asyncio`.
+
+The filesystem is accessed in an executor, i.e. the event loop is not
+blocked. Each call runs at most ``max_concurrency`` filesystem operations at
+once. Pass a shared ``executor`` to limit the threads used by all calls.
+
+Cancelling a call (or running into its ``timeout``) stops it before the next
+filesystem operation, operations already running in the executor complete
+in the background.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import pathlib
+import typing
+
+from .core_criteria import PathSpec, ProjectType
+from .evaluation import evaluation_context
+from .functions import (
+    _identified_types,
+    _project_types_to_test,
+    _root_criteria,
+    _root_result,
+    _Listings,
+    _search_dir,
+    _test_criterion,
+    _test_root,
+)
+from .generic_criteria import as_root_criterion
+from .marker_index import marker_index
+from .utilities import DirectoryFilter, get_start_path, list_search_dirs
+
+__all__ = [
+    "async_find_projects",
+    "async_find_root",
+    "async_identify_project",
+    "async_iter_projects",
+]
+
+T = typing.TypeVar("T")
+
+_SearchResult = typing.Tuple[typing.List[pathlib.Path], typing.List[str], int]
+
+
+class _BlockingRunner:
+    """
+    Runs blocking functions in an executor, limited by a semaphore.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        executor: typing.Optional[concurrent.futures.Executor],
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = executor
+
+    async def run(self, fun: typing.Callable[..., T], *args: typing.Any) -> T:
+        call = functools.partial(fun, *args)
+        if self.executor is None or isinstance(
+            self.executor, concurrent.futures.ThreadPoolExecutor
+        ):
+            # the threads use the task's profiler and evaluation context
+            call = functools.partial(contextvars.copy_context().run, call)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, call)
+
+
+async def async_iter_projects(
+    path: PathSpec,
+    criterion: typing.Any,
+    maxdepth: int = 1,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+    max_concurrency: int = 8,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+) -> typing.AsyncIterator[pathlib.Path]:
+    """
+    Asynchronous generator version of :py:func:`dirmagic.iter_projects`.
+
+    Up to ``max_concurrency`` directories are searched at once, the matches
+    are returned in the same order as for the sequential search.
+    """
+    if maxdepth == 0:
+        return
+
+    runner = _BlockingRunner(max_concurrency, executor)
+    the_criterion = as_root_criterion(criterion)
+    start_dir = os.fspath(await runner.run(get_start_path, path))
+    dir_filter = await runner.run(
+        DirectoryFilter, start_dir, follow_symlinks, prune
+    )
+
+    listings: _Listings = {}
+
+    def search(search_dir: str, depth: int) -> "asyncio.Task[_SearchResult]":
+        async def search_task() -> _SearchResult:
+            dirs_found, other_dirs = await runner.run(
+                _search_dir,
+                search_dir,
+                the_criterion,
+                depth,
+                dir_filter,
+                listings,
+            )
+            return dirs_found, other_dirs, depth
+
+        return asyncio.ensure_future(search_task())
+
+    # the tasks are consumed in the order of the sequential search
+    searches = [search(start_dir, maxdepth)]
+    try:
+        while searches:
+            dirs_found, other_dirs, depth = await searches.pop()
+            for dir in dirs_found:
+                yield dir
+            searches.extend(
+                search(other_dir, depth - 1)
+                for other_dir in reversed(other_dirs)
+            )
+    finally:
+        for pending_search in searches:
+            pending_search.cancel()
+
+
+async def async_find_projects(
+    path: PathSpec,
+    criterion: typing.Any,
+    maxdepth: int = 1,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+    max_concurrency: int = 8,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+    timeout: typing.Optional[float] = None,
+) -> typing.List[pathlib.Path]:
+    """
+    Asynchronous version of :py:func:`dirmagic.find_projects`.
+
+    Raises :external+python:py:exc:`asyncio.TimeoutError` if the search
+    takes longer than ``timeout`` seconds.
+    """
+
+    async def collect() -> typing.List[pathlib.Path]:
+        return [
+            dir
+            async for dir in async_iter_projects(
+                path,
+                criterion,
+                maxdepth,
+                follow_symlinks,
+                prune,
+                max_concurrency,
+                executor,
+            )
+        ]
+
+    return await asyncio.wait_for(collect(), timeout)
+
+
+async def async_find_root(
+    path: PathSpec = ".",
+    criterion: typing.Any = None,
+    return_reason: bool = False,
+    max_concurrency: int = 8,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+    timeout: typing.Optional[float] = None,
+    **kwargs: typing.Any,
+) -> typing.Union[pathlib.Path, typing.Tuple[pathlib.Path, str]]:
+    """
+    Asynchronous version of :py:func:`dirmagic.find_root`.
+
+    The parent directories are tested one after the other.
+
+    Raises :external+python:py:exc:`asyncio.TimeoutError` if the search
+    takes longer than ``timeout`` seconds.
+    """
+    runner = _BlockingRunner(max_concurrency, executor)
+
+    async def search() -> (
+        typing.Union[pathlib.Path, typing.Tuple[pathlib.Path, str]]
+    ):
+        parents = await runner.run(
+            functools.partial(list_search_dirs, path, **kwargs)
+        )
+        the_criteria = _root_criteria(criterion)
+
+        for dir in parents:
+            if return_reason:
+                # the result trees are built while testing
+                result = await runner.run(_root_result, dir, the_criteria)
+                if result is not None:
+                    return dir, result.reason()
+            elif await runner.run(_test_root, dir, the_criteria) is not None:
+                return dir
+
+        raise FileNotFoundError(
+            f"No root directory found in {parents[0]} or its parent"
+            " directories."
+        )
+
+    return await asyncio.wait_for(search(), timeout)
+
+
+async def async_identify_project(
+    path: PathSpec = ".",
+    types_to_test: typing.Optional[typing.Sequence[ProjectType]] = None,
+    max_concurrency: int = 8,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+    timeout: typing.Optional[float] = None,
+) -> typing.List[typing.Tuple[str, str]]:
+    """
+    Asynchronous version of :py:func:`dirmagic.identify_project`.
+
+    Only the project types whose markers are present (or which have no
+    markers) are tested, concurrently. The tests share the directory's
+    snapshot and the results of the criteria tested.
+
+    Raises :external+python:py:exc:`asyncio.TimeoutError` if the
+    identification takes longer than ``timeout`` seconds.
+    """
+    runner = _BlockingRunner(max_concurrency, executor)
+
+    async def identify() -> typing.List[typing.Tuple[str, str]]:
+        dir = await runner.run(get_start_path, path)
+        index = marker_index(tuple(_project_types_to_test(types_to_test)))
+        with evaluation_context():
+            # the executor's threads run in copies of the task's context
+            the_types = await runner.run(index.types_to_test, dir)
+            results: typing.List[bool] = await asyncio.gather(
+                *(
+                    runner.run(_test_criterion, project_type, dir)
+                    for project_type in the_types
+                )
+            )
+        return _identified_types(
+            project_type
+            for project_type, result in zip(the_types, results)
+            if result
+        )
+
+    return await asyncio.wait_for(identify(), timeout)
@@ -1,6 +1,13 @@
 import abc
+import contextlib
+import contextvars
 import copy
+import enum
+import functools
+import json
+import os
 import pathlib
+import time
 import typing
 
 # todo: revisit need for trying to import this
@@ -10,12 +17,33 @@ try:
 except ImportError:
     pass
 
+from .parallel import active_parallel_evaluation
+from .profiling import active_profiler
+
 PathSpec = typing.Union[str, pathlib.Path]
 """
 Path types expected by the functions in this package.
 """
 
 
+class Cost(enum.IntEnum):
+    """
+    Estimated costs of testing a criterion, see
+    :py:meth:`Criterion.estimated_cost`.
+    """
+
+    NAME = 1
+    "compares names, no filesystem access"
+    STAT = 2
+    "looks up an entry (a ``stat`` call)"
+    LISTING = 3
+    "lists the directory"
+    CONTENT = 4
+    "reads the contents of files"
+    WALK = 5
+    "lists the directory tree recursively"
+
+
 class CriterionResult(typing.NamedTuple):
     """
     Returns the result of the check and the tests the result is based on.
@@ -124,11 +152,13 @@ class CriterionResult(typing.NamedTuple):
                 result_string += (
                     "true for at least one entry matching"
                     f" {self.criterion.pattern.pattern}"
+                    f"{self.criterion.describe_bounds()}"
                 )
             elif isinstance(self.criterion, AllMatchCriterion):
                 result_string += (
                     "true for all entries matching"
                     f" {self.criterion.pattern.pattern}"
+                    f"{self.criterion.describe_bounds()}"
                 )
             elif isinstance(self.criterion, NotCriterion):
                 result_string += "NOT"
@@ -178,11 +208,13 @@ class CriterionResult(typing.NamedTuple):
                 result_string += (
                     "true for at least one entry matching"
                     f" {self.criterion.pattern.pattern}"
+                    f"{self.criterion.describe_bounds()}"
                 )
             elif isinstance(self.criterion, AllMatchCriterion):
                 result_string += (
                     "true for all entries matching"
                     f" {self.criterion.pattern.pattern}"
+                    f"{self.criterion.describe_bounds()}"
                 )
             elif isinstance(self.criterion, ProjectType):
                 result_string += f"`{self.criterion.name}` project type"
@@ -197,6 +229,66 @@ class CriterionResult(typing.NamedTuple):
         return result_tree
 
 
+_criterion_types: typing.Dict[str, typing.Type["Criterion"]] = {}
+
+
+def _type_name(cls: type) -> str:
+    """
+    The name of the criterion type used by :py:meth:`Criterion.to_dict`:
+    the class name for the criteria of dirmagic, the qualified name
+    including the module for other criteria.
+    """
+    if cls.__module__.split(".")[0] == "dirmagic":
+        return cls.__name__
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+_Criterion = typing.TypeVar("_Criterion", bound="Criterion")
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_names(cls: type) -> typing.Optional[typing.Tuple[str, ...]]:
+    """
+    The names of the slots of the class and its bases, None if the
+    instances have a ``__dict__``.
+    """
+    names: typing.List[str] = []
+    for base in cls.__mro__[:-1]:
+        slots = base.__dict__.get("__slots__")
+        if slots is None or "__dict__" in slots:
+            return None
+        if isinstance(slots, str):
+            slots = (slots,)
+        names.extend(name for name in slots if name != "__weakref__")
+    return tuple(names)
+
+
+def _shallow_copy(criterion: _Criterion) -> _Criterion:
+    """
+    Same as :external+python:py:func:`copy.copy`, copies the slots directly.
+    The hash cached is dropped, the copy can be changed before it's used.
+    """
+    cls = type(criterion)
+    names = _slot_names(cls)
+    if names is None:
+        copied = copy.copy(criterion)
+        try:
+            del copied._hash
+        except AttributeError:
+            pass
+        return copied
+    copied = cls.__new__(cls)
+    for name in names:
+        if name == "_hash":
+            continue
+        try:
+            setattr(copied, name, getattr(criterion, name))
+        except AttributeError:
+            # slot not set
+            pass
+    return copied
+
+
 class Criterion(abc.ABC):
     """
     Abstract base class of a test criterion for a directory.
@@ -204,8 +296,21 @@ class Criterion(abc.ABC):
     The :py:meth:`Criterion.test` method returns the result of a test.
 
     Criteria can be combined wiht the logical operators ``&``, ``|``, ``~``.
+
+    Criteria are not changed after construction, the hash is computed once.
     """
 
+    # the hash cached by __hash__
+    __slots__ = ("_hash",)
+    _hash: int
+
+    def __init_subclass__(cls, **kwargs: typing.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        # the criteria types known by :py:func:`from_dict`, a subclass named
+        # like a criterion of dirmagic doesn't replace it
+        _criterion_types[f"{cls.__module__}.{cls.__qualname__}"] = cls
+        _criterion_types[_type_name(cls)] = cls
+
     def describe(self) -> str:
         """
         Describes the test criterion.
@@ -227,6 +332,136 @@ class Criterion(abc.ABC):
         """
         ...
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        """
+        Same as ``bool(criterion.test(dir))``, but without building the
+        result tree. Use :py:meth:`test` to get the reason of the result.
+
+        Criteria implement this method to avoid creating the
+        :py:class:`CriterionResult` objects, the default tests the criterion.
+        """
+        return bool(self.test(dir, *args, **kwargs))
+
+    def equality_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """
+        The attributes defining the criterion. Criteria of the same type with
+        equal keys are equal (and have the same hash), i.e. they are tested
+        once per directory by :py:func:`evaluate`. None (the default) if
+        the criterion is only equal to itself.
+        """
+        return None
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return False
+        assert isinstance(other, Criterion)
+        key = self.equality_key()
+        return key is not None and key == other.equality_key()
+
+    def __hash__(self) -> int:
+        try:
+            return self._hash
+        except AttributeError:
+            pass
+        key = self.equality_key()
+        if key is None:
+            self._hash = object.__hash__(self)
+        else:
+            self._hash = hash((type(self), key))
+        return self._hash
+
+    def estimated_cost(self) -> float:
+        """
+        The estimated cost of testing the criterion, one of :py:class:`Cost`
+        for simple criteria. Unknown criteria, e.g. test functions, are
+        assumed to read files.
+        """
+        return Cost.CONTENT
+
+    def optimize(self) -> "Criterion":
+        """
+        Returns an equivalent criterion, which is cheaper to test:
+
+        * nested :py:class:`AnyCriteria` (:py:class:`AllCriteria`) are
+          flattened,
+        * duplicate criteria are removed,
+        * double negations are cancelled,
+        * the criteria are tested in the order of their
+          :py:meth:`estimated_cost`, cheap ones first. The order of criteria
+          with the same cost is kept.
+
+        The test results are the same. The simple criteria are kept, i.e.
+        the reasons of the results refer to the original criteria, only the
+        order and nesting can differ.
+
+        .. code-block:: python
+
+            criterion = HasFile("x", contents="^y") | HasDir(".git")
+            fast_criterion = criterion.optimize()
+        """
+        return self
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        """
+        The names of the entries inside the directory tested, of which at
+        least one must exist for the criterion to be met. None if there is
+        no such set of names, e.g. the criterion matches patterns.
+
+        Used to skip criteria which can't be met, see
+        :py:class:`dirmagic.marker_index.MarkerIndex`.
+        """
+        return None
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        The arguments to create the criterion with
+        :py:meth:`from_parameters`, None if the criterion can't be
+        serialized (the default).
+        """
+        return None
+
+    @classmethod
+    def from_parameters(cls, **parameters: typing.Any) -> "Criterion":
+        """
+        Creates the criterion from its :py:meth:`parameters`.
+        """
+        return cls(**parameters)
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """
+        The criterion as JSON compatible dictionary, the ``type`` item is
+        the name of the criterion's class, including the module for
+        criteria defined outside of dirmagic. See :py:func:`from_dict`.
+
+        .. code-block:: python
+
+            >>> (HasDir(".git") | HasBasename("src")).to_dict()
+            {'type': 'AnyCriteria', 'criteria': [
+                {'type': 'HasDir', 'dirname': '.git'},
+                {'type': 'HasBasename', 'basename': 'src'}]}
+
+        Raises :external+python:py:exc:`TypeError` if the criterion can't be
+        serialized, e.g. for test functions not registered with
+        :py:func:`register_test_function`.
+        """
+        parameters = self.parameters()
+        if parameters is None:
+            raise TypeError(f"{self!r} can't be serialized")
+        return {
+            "type": _type_name(type(self)),
+            **{
+                name: _encode_parameter(value)
+                for name, value in parameters.items()
+            },
+        }
+
     template_attributes: typing.Optional[typing.List[str]] = None
 
     def expand_pattern(
@@ -238,21 +473,38 @@ class Criterion(abc.ABC):
         Finalizes the criterion by expanding the templated attributes
         using :external+python:py:meth:`str.format` with the arguments
         supplied.
+
+        Only needed for the result trees, :py:meth:`matches` uses the
+        expanded values directly, see :py:meth:`template_value`.
         """
         if not self.template_attributes:
             return self
 
-        expanded = copy.copy(self)
+        expanded = _shallow_copy(self)
         for template_attribute in self.template_attributes:
             setattr(
                 expanded,
                 template_attribute,
-                str(getattr(expanded, template_attribute)).format(
-                    *args, **kwargs
-                ),
+                self.template_value(template_attribute, args, kwargs),
             )
         return expanded
 
+    def template_value(
+        self,
+        attribute: str,
+        args: typing.Tuple[typing.Any, ...],
+        kwargs: typing.Dict[str, typing.Any],
+    ) -> typing.Any:
+        """
+        The value of the templated attribute, expanded with the arguments
+        (if any) like by :py:meth:`expand_pattern`, without copying the
+        criterion.
+        """
+        value = getattr(self, attribute)
+        if not (args or kwargs):
+            return value
+        return str(value).format(*args, **kwargs)
+
     def __or__(self, other: "Criterion") -> "AnyCriteria":
         """
         Support ``|`` operator for logical or.
@@ -294,8 +546,11 @@ class AnyCriteria(Criterion):
     Criteria can be linked together with ``|`` to form :py:class:`AnyCriteria`.
     """
 
+    __slots__ = ("criteria", "statistics")
+
     def __init__(self, *criteria: Criterion):
         self.criteria = criteria
+        self.statistics: typing.Optional[CriteriaStatistics] = None
         super().__init__()
 
     def describe(self) -> str:
@@ -308,13 +563,20 @@ class AnyCriteria(Criterion):
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
         results = []
-        for c in self.criteria:
-            r = c.test(dir, *args, **kwargs)
+        for r in _iter_results(self, dir, *args, **kwargs):
             results.append(r)
             if r:
                 return CriterionResult(True, self, dir, tuple(results))
         return CriterionResult(False, self, dir, tuple(results))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        return any(_iter_matches(self, dir, *args, **kwargs))
+
     def expand_pattern(
         self,
         *args: typing.Tuple[typing.Any, ...],
@@ -328,6 +590,35 @@ class AnyCriteria(Criterion):
             *(c.expand_pattern(*args, **kwargs) for c in self.criteria)
         )
 
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        # any of the criteria's markers
+        all_markers: typing.Set[str] = set()
+        for c in self.criteria:
+            c_markers = c.markers()
+            if c_markers is None:
+                return None
+            all_markers.update(c_markers)
+        return frozenset(all_markers)
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return self.criteria
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"criteria": list(self.criteria)}
+
+    @classmethod
+    def from_parameters(cls, **parameters: typing.Any) -> "AnyCriteria":
+        return cls(*parameters["criteria"])
+
+    def estimated_cost(self) -> float:
+        return sum(c.estimated_cost() for c in self.criteria)
+
+    def optimize(self) -> Criterion:
+        criteria = _optimized_criteria(self.criteria, AnyCriteria)
+        if len(criteria) == 1:
+            return criteria[0]
+        return AnyCriteria(*criteria)
+
     def __or__(self, other: Criterion) -> "AnyCriteria":
         if isinstance(other, AnyCriteria):
             return AnyCriteria(*self.criteria, *other.criteria)
@@ -350,8 +641,11 @@ class AllCriteria(Criterion):
     Criteria can be linked together with ``&`` to form :py:class:`AllCriteria`.
     """
 
+    __slots__ = ("criteria", "statistics")
+
     def __init__(self, *criteria: Criterion):
         self.criteria = criteria
+        self.statistics: typing.Optional[CriteriaStatistics] = None
         super().__init__()
 
     def describe(self) -> str:
@@ -371,13 +665,20 @@ class AllCriteria(Criterion):
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
         results = []
-        for c in self.criteria:
-            r = c.test(dir, *args, **kwargs)
+        for r in _iter_results(self, dir, *args, **kwargs):
             results.append(r)
             if not r:
                 return CriterionResult(False, self, dir, tuple(results))
         return CriterionResult(True, self, dir, tuple(results))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        return all(_iter_matches(self, dir, *args, **kwargs))
+
     def expand_pattern(
         self,
         *args: typing.Tuple[typing.Any, ...],
@@ -391,6 +692,34 @@ class AllCriteria(Criterion):
             *(c.expand_pattern(*args, **kwargs) for c in self.criteria)
         )
 
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        # all criteria must be met: the smallest set of markers will do
+        all_markers = [c.markers() for c in self.criteria]
+        return min(
+            (m for m in all_markers if m is not None),
+            key=len,
+            default=None,
+        )
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return self.criteria
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"criteria": list(self.criteria)}
+
+    @classmethod
+    def from_parameters(cls, **parameters: typing.Any) -> "AllCriteria":
+        return cls(*parameters["criteria"])
+
+    def estimated_cost(self) -> float:
+        return sum(c.estimated_cost() for c in self.criteria)
+
+    def optimize(self) -> Criterion:
+        criteria = _optimized_criteria(self.criteria, AllCriteria)
+        if len(criteria) == 1:
+            return criteria[0]
+        return AllCriteria(*criteria)
+
     def __and__(self, other: Criterion) -> "AllCriteria":
         if isinstance(other, AllCriteria):
             return AllCriteria(*self.criteria, *other.criteria)
@@ -407,6 +736,8 @@ class AllCriteria(Criterion):
 
 
 class NotCriterion(Criterion):
+    __slots__ = ("criterion",)
+
     def __init__(self, criterion: Criterion):
         self.criterion = criterion
         super().__init__()
@@ -420,9 +751,17 @@ class NotCriterion(Criterion):
         *args: typing.Tuple[typing.Any, ...],
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
-        result = self.criterion.test(dir, *args, **kwargs)
+        result = evaluate(self.criterion, dir, *args, **kwargs)
         return CriterionResult(not result.result, self, dir, (result,))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        return not evaluate_matches(self.criterion, dir, *args, **kwargs)
+
     def expand_pattern(
         self,
         *args: typing.Tuple[typing.Any, ...],
@@ -433,6 +772,21 @@ class NotCriterion(Criterion):
         """
         return NotCriterion(self.criterion.expand_pattern(*args, **kwargs))
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.criterion,)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"criterion": self.criterion}
+
+    def estimated_cost(self) -> float:
+        return self.criterion.estimated_cost()
+
+    def optimize(self) -> Criterion:
+        criterion = self.criterion.optimize()
+        if isinstance(criterion, NotCriterion):
+            return criterion.criterion
+        return NotCriterion(criterion)
+
     def __invert__(self) -> "Criterion":
         """
         Convert double not to original criterion.
@@ -453,6 +807,8 @@ class CriterionFromTestFun(Criterion):
     Create a criterion by providing a test function and optional description.
     """
 
+    __slots__ = ("testfun", "description")
+
     def __init__(
         self,
         testfun: typing.Callable[[PathSpec], bool],
@@ -470,13 +826,45 @@ class CriterionFromTestFun(Criterion):
     def describe(self) -> str:
         return self.description
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.testfun, self.description)
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        name = registered_name(self.testfun)
+        if name is None:
+            return None
+        return {"testfun": name, "description": self.description}
+
+    @classmethod
+    def from_parameters(
+        cls, **parameters: typing.Any
+    ) -> "CriterionFromTestFun":
+        return cls(
+            get_test_function(parameters["testfun"]),
+            parameters.get("description"),
+        )
+
+    def __reduce_ex__(self, protocol: typing.Any) -> typing.Any:
+        # registered test functions are pickled by name, e.g. lambdas
+        if registered_name(self.testfun) is None:
+            return super().__reduce_ex__(protocol)
+        return (from_dict, (self.to_dict(),))
+
     def test(
         self,
         dir: PathSpec,
         *args: typing.Tuple[typing.Any, ...],
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
-        return CriterionResult(self.testfun(dir, *args, **kwargs), self, dir)
+        return CriterionResult(self.matches(dir, *args, **kwargs), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        return bool(self.testfun(dir, *args, **kwargs))
 
 
 class ProjectType(Criterion):
@@ -497,6 +885,9 @@ class ProjectType(Criterion):
     The criterion to test the directory
     """
 
+    # the instances have their own docstring
+    __slots__ = ("name", "category", "criterion", "__dict__")
+
     def __init__(self, name: str, category: str, criterion: Criterion):
         self.criterion = criterion
         self.name = name
@@ -512,9 +903,36 @@ class ProjectType(Criterion):
         *args: typing.Tuple[typing.Any, ...],
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
-        result = self.criterion.test(dir, *args, **kwargs)
+        result = evaluate(self.criterion, dir, *args, **kwargs)
         return CriterionResult(result.result, self, dir, (result,))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        return evaluate_matches(self.criterion, dir, *args, **kwargs)
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        return self.criterion.markers()
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.name, self.category, self.criterion)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "criterion": self.criterion,
+        }
+
+    def estimated_cost(self) -> float:
+        return self.criterion.estimated_cost()
+
+    def optimize(self) -> "ProjectType":
+        return ProjectType(self.name, self.category, self.criterion.optimize())
+
     def rich_tree(self) -> "rich.tree.Tree":
         from rich.tree import Tree
 
@@ -522,3 +940,475 @@ class ProjectType(Criterion):
         t.add(self.criterion.rich_tree())
 
         return t
+
+
+_test_functions: typing.Dict[str, typing.Callable[..., bool]] = {}
+
+_TestFunction = typing.TypeVar(
+    "_TestFunction", bound=typing.Callable[..., bool]
+)
+
+
+def register_test_function(
+    testfun: _TestFunction, name: typing.Optional[str] = None
+) -> _TestFunction:
+    """
+    Registers the test function under its name (or ``name``), so that the
+    criteria using it can be serialized and pickled, see
+    :py:meth:`Criterion.to_dict`. Can be used as decorator:
+
+    .. code-block:: python
+
+        @register_test_function
+        def has_readme(dir):
+            return any(pathlib.Path(dir).glob("README*"))
+
+        register_test_function(lambda dir: True, "always")
+    """
+    _test_functions[testfun.__name__ if name is None else name] = testfun
+    return testfun
+
+
+def get_test_function(name: str) -> typing.Callable[..., bool]:
+    """
+    The test function registered under the name, raises
+    :external+python:py:exc:`KeyError` if unknown.
+    """
+    try:
+        return _test_functions[name]
+    except KeyError:
+        raise KeyError(f"test function `{name}` is not registered") from None
+
+
+def registered_name(
+    testfun: typing.Callable[..., bool],
+) -> typing.Optional[str]:
+    """
+    The name the test function is registered under, None if not registered.
+    """
+    for name, registered in _test_functions.items():
+        if registered is testfun:
+            return name
+    return None
+
+
+def from_dict(data: typing.Dict[str, typing.Any]) -> Criterion:
+    """
+    Creates the criterion from the dictionary created by
+    :py:meth:`Criterion.to_dict`.
+
+    Raises :external+python:py:exc:`ValueError` for unknown criteria types.
+    """
+    # make sure all criteria types are known
+    from . import generic_criteria, pattern_criteria  # noqa: F401
+
+    try:
+        criterion_type = _criterion_types[data["type"]]
+    except KeyError:
+        raise ValueError(
+            f"unknown criterion type `{data.get('type')}`"
+        ) from None
+    return criterion_type.from_parameters(
+        **{
+            name: _decode_parameter(value)
+            for name, value in data.items()
+            if name != "type"
+        }
+    )
+
+
+def _encode_parameter(value: typing.Any) -> typing.Any:
+    if isinstance(value, Criterion):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_encode_parameter(v) for v in value]
+    if isinstance(value, pathlib.PurePath):
+        return os.fspath(value)
+    return value
+
+
+def _decode_parameter(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict):
+        return from_dict(value)
+    if isinstance(value, list):
+        return [_decode_parameter(v) for v in value]
+    return value
+
+
+def criterion_key(criterion: Criterion) -> str:
+    """
+    The key identifying the criterion, e.g. its results in
+    :py:class:`dirmagic.scan_index.ScanIndex` or its statistics in
+    :py:func:`dirmagic.adaptive.export_statistics`: the JSON text of
+    :py:meth:`Criterion.to_dict`, equal for equal criteria.
+
+    Raises :external+python:py:exc:`ValueError` for criteria which can't be
+    serialized, e.g. with test functions not registered: they can't be told
+    apart from other criteria.
+    """
+    try:
+        data = criterion.to_dict()
+    except TypeError as error:
+        raise ValueError(f"the criterion has no stable key: {error}") from None
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+# the result, or only the boolean if tested with :py:meth:`Criterion.matches`
+_ResultMemo = typing.Dict[
+    typing.Tuple[Criterion, str], typing.Union[CriterionResult, bool]
+]
+
+_result_memo: "contextvars.ContextVar[typing.Optional[_ResultMemo]]" = (
+    contextvars.ContextVar("dirmagic_result_memo", default=None)
+)
+
+
+@contextlib.contextmanager
+def result_memo() -> typing.Iterator[None]:
+    """
+    Remembers the results of :py:func:`evaluate` while the context is active
+    (for the current thread or task). A memo already active is kept.
+
+    Criteria shared by several criteria, like ``is_git_root`` in
+    ``is_vcs_root``, or equal criteria, like ``HasFile("setup.py")`` in
+    several project types, are tested once per directory.
+
+    The top level functions activate the memo while testing a directory,
+    see :py:func:`dirmagic.evaluation.evaluation_context`.
+    """
+    if _result_memo.get() is not None:
+        yield
+        return
+    token = _result_memo.set({})
+    try:
+        yield
+    finally:
+        _result_memo.reset(token)
+
+
+_Result = typing.TypeVar("_Result", CriterionResult, bool)
+
+
+def _call(
+    method: typing.Callable[..., _Result],
+    criterion: Criterion,
+    dir: PathSpec,
+    args: typing.Tuple[typing.Any, ...],
+    kwargs: typing.Dict[str, typing.Any],
+) -> _Result:
+    """
+    Calls the criterion's ``test`` or ``matches`` method, recorded by the
+    active profiler (if any).
+    """
+    profiler = active_profiler()
+    if profiler is None:
+        return method(dir, *args, **kwargs)
+    return profiler.call(method, criterion, dir, args, kwargs)
+
+
+def evaluate(
+    criterion: Criterion,
+    dir: PathSpec,
+    *args: typing.Any,
+    **kwargs: typing.Any,
+) -> CriterionResult:
+    """
+    Tests the criterion, using the result remembered by an active
+    :py:func:`result_memo` for an equal criterion and directory.
+
+    Tests with template arguments are not remembered.
+    """
+    memo = _result_memo.get()
+    if memo is None or args or kwargs:
+        return _call(criterion.test, criterion, dir, args, kwargs)
+    key = (criterion, os.fspath(dir))
+    try:
+        result = memo.get(key)
+    except TypeError:
+        # attributes not hashable
+        return _call(criterion.test, criterion, dir, (), {})
+    if isinstance(result, CriterionResult):
+        _record_hit(criterion, result)
+        return result
+    # not tested or the result tree wasn't built
+    result = _call(criterion.test, criterion, dir, (), {})
+    memo[key] = result
+    return result
+
+
+def evaluate_matches(
+    criterion: Criterion,
+    dir: PathSpec,
+    *args: typing.Any,
+    **kwargs: typing.Any,
+) -> bool:
+    """
+    Same as :py:func:`evaluate`, but returns the boolean result of
+    :py:meth:`Criterion.matches`. The results are shared with
+    :py:func:`evaluate`.
+    """
+    memo = _result_memo.get()
+    if memo is None or args or kwargs:
+        return _call(criterion.matches, criterion, dir, args, kwargs)
+    key = (criterion, os.fspath(dir))
+    try:
+        result = memo.get(key)
+    except TypeError:
+        # attributes not hashable
+        return _call(criterion.matches, criterion, dir, (), {})
+    if result is not None:
+        _record_hit(criterion, result)
+        return bool(result)
+    is_match = _call(criterion.matches, criterion, dir, (), {})
+    memo[key] = is_match
+    return is_match
+
+
+def _is_remembered(
+    criterion: Criterion,
+    dir: PathSpec,
+    args: typing.Tuple[typing.Any, ...],
+    kwargs: typing.Dict[str, typing.Any],
+    result_tree: bool,
+) -> bool:
+    """
+    Whether :py:func:`evaluate` (``result_tree``) or
+    :py:func:`evaluate_matches` reuses a result remembered by the memo.
+    """
+    memo = _result_memo.get()
+    if memo is None or args or kwargs:
+        return False
+    try:
+        result = memo.get((criterion, os.fspath(dir)))
+    except TypeError:
+        return False
+    if result_tree:
+        return isinstance(result, CriterionResult)
+    return result is not None
+
+
+def _record_hit(
+    criterion: Criterion, result: typing.Union[CriterionResult, bool]
+) -> None:
+    profiler = active_profiler()
+    if profiler is not None:
+        profiler.hit(criterion, result)
+
+
+class CriteriaStatistics:
+    """
+    Records how often each criterion of an :py:class:`AnyCriteria` (or
+    :py:class:`AllCriteria`) ends the evaluation and how long it takes, and
+    reorders the criteria accordingly.
+
+    The criteria are tested in the order of the expected cost: the mean
+    duration divided by the probability to end the evaluation, i.e. to be
+    met for :py:class:`AnyCriteria` or not to be met for
+    :py:class:`AllCriteria`. Criteria not tested yet come first.
+
+    The result of the test does not depend on the order, only the results of
+    the criteria tested (and hence the reasons) can differ. The order changes
+    only every ``reorder_every`` tests, never if 0. The results reused from
+    the result memo (see :py:func:`result_memo`) are not recorded.
+
+    See :py:mod:`dirmagic.adaptive` to enable the statistics.
+
+    :param size: the number of criteria
+    :param stop_result: the result ending the evaluation
+    :param reorder_every: the number of tests between reordering
+    """
+
+    def __init__(self, size: int, stop_result: bool, reorder_every: int = 100):
+        self.stop_result = stop_result
+        self.reorder_every = reorder_every
+        self.tests = [0] * size
+        self.stops = [0] * size
+        self.seconds = [0.0] * size
+        self.order = tuple(range(size))
+        self.count = 0
+
+    def expected_cost(self, position: int) -> float:
+        tests = self.tests[position]
+        if tests == 0:
+            return 0.0
+        # with Laplace smoothing, no criterion gets a zero probability
+        stop_probability = (self.stops[position] + 1) / (tests + 2)
+        return self.seconds[position] / tests / stop_probability
+
+    def reorder(self) -> None:
+        """
+        Sorts the criteria by their expected cost, ties keep the declared
+        order.
+        """
+        self.order = tuple(
+            sorted(
+                range(len(self.tests)),
+                key=lambda position: (self.expected_cost(position), position),
+            )
+        )
+
+    def iter_results(
+        self,
+        criteria: typing.Sequence[Criterion],
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> typing.Iterator[CriterionResult]:
+        """
+        Tests the criteria in the current order and records the results.
+        """
+        return self._iter_recorded(evaluate, criteria, dir, args, kwargs)
+
+    def iter_matches(
+        self,
+        criteria: typing.Sequence[Criterion],
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> typing.Iterator[bool]:
+        """
+        Same as :py:meth:`iter_results`, but yields the boolean results of
+        :py:meth:`Criterion.matches`.
+        """
+        return self._iter_recorded(
+            evaluate_matches, criteria, dir, args, kwargs
+        )
+
+    def _iter_recorded(
+        self,
+        evaluator: typing.Callable[..., _Result],
+        criteria: typing.Sequence[Criterion],
+        dir: PathSpec,
+        args: typing.Tuple[typing.Any, ...],
+        kwargs: typing.Dict[str, typing.Any],
+    ) -> typing.Iterator[_Result]:
+        self.count += 1
+        if self.reorder_every and self.count % self.reorder_every == 0:
+            self.reorder()
+        result_tree = evaluator is evaluate
+        for position in self.order:
+            criterion = criteria[position]
+            if _is_remembered(criterion, dir, args, kwargs, result_tree):
+                # taken from the result memo, not a test of the criterion
+                yield evaluator(criterion, dir, *args, **kwargs)
+                continue
+            start = time.perf_counter()
+            result = evaluator(criterion, dir, *args, **kwargs)
+            self.seconds[position] += time.perf_counter() - start
+            self.tests[position] += 1
+            if bool(result) == self.stop_result:
+                self.stops[position] += 1
+            yield result
+
+    def export(self) -> typing.Dict[str, typing.Any]:
+        """
+        The statistics as JSON compatible dictionary.
+        """
+        return {
+            "tests": list(self.tests),
+            "stops": list(self.stops),
+            "seconds": list(self.seconds),
+            "order": list(self.order),
+        }
+
+    def load(self, statistics: typing.Dict[str, typing.Any]) -> None:
+        """
+        Restores exported statistics, raises ValueError if they don't fit.
+        """
+        size = len(self.tests)
+        if sorted(statistics["order"]) != list(range(size)) or not all(
+            len(statistics[name]) == size
+            for name in ("tests", "stops", "seconds")
+        ):
+            raise ValueError("the statistics don't match the criteria")
+        self.tests = [int(n) for n in statistics["tests"]]
+        self.stops = [int(n) for n in statistics["stops"]]
+        self.seconds = [float(t) for t in statistics["seconds"]]
+        self.order = tuple(int(p) for p in statistics["order"])
+
+
+def _iter_results(
+    node: typing.Union[AnyCriteria, AllCriteria],
+    dir: PathSpec,
+    *args: typing.Any,
+    **kwargs: typing.Any,
+) -> typing.Iterator[CriterionResult]:
+    """
+    Tests the node's criteria one after the other (or in parallel, see
+    :py:mod:`dirmagic.parallel`).
+    """
+    parallel = active_parallel_evaluation()
+    if parallel is not None:
+        yield from parallel.iter_evaluated(
+            evaluate, _ordered_criteria(node), dir, args, kwargs
+        )
+        return
+    if node.statistics is not None:
+        yield from node.statistics.iter_results(
+            node.criteria, dir, *args, **kwargs
+        )
+        return
+    for c in node.criteria:
+        yield evaluate(c, dir, *args, **kwargs)
+
+
+def _iter_matches(
+    node: typing.Union[AnyCriteria, AllCriteria],
+    dir: PathSpec,
+    *args: typing.Any,
+    **kwargs: typing.Any,
+) -> typing.Iterator[bool]:
+    """
+    Same as :py:func:`_iter_results`, but yields the boolean results.
+    """
+    parallel = active_parallel_evaluation()
+    if parallel is not None:
+        yield from parallel.iter_evaluated(
+            evaluate_matches, _ordered_criteria(node), dir, args, kwargs
+        )
+        return
+    if node.statistics is not None:
+        yield from node.statistics.iter_matches(
+            node.criteria, dir, *args, **kwargs
+        )
+        return
+    for c in node.criteria:
+        yield evaluate_matches(c, dir, *args, **kwargs)
+
+
+def _ordered_criteria(
+    node: typing.Union[AnyCriteria, AllCriteria],
+) -> typing.Sequence[Criterion]:
+    """
+    The node's criteria in the adaptive order, if enabled, without updating
+    the statistics.
+    """
+    if node.statistics is None:
+        return node.criteria
+    return [node.criteria[position] for position in node.statistics.order]
+
+
+def _optimized_criteria(
+    criteria: typing.Iterable[Criterion],
+    node_type: typing.Type[typing.Union[AnyCriteria, AllCriteria]],
+) -> typing.List[Criterion]:
+    """
+    Optimizes the criteria, flattens nested nodes of the same type, removes
+    duplicates and sorts by the estimated cost.
+    """
+    flat_criteria: typing.List[Criterion] = []
+    for c in criteria:
+        optimized = c.optimize()
+        if type(optimized) is node_type:
+            assert isinstance(optimized, (AnyCriteria, AllCriteria))
+            flat_criteria.extend(optimized.criteria)
+        else:
+            flat_criteria.append(optimized)
+
+    unique_criteria: typing.List[Criterion] = []
+    for c in flat_criteria:
+        if c not in unique_criteria:
+            unique_criteria.append(c)
+
+    # sorted is stable: criteria of the same cost keep their order
+    return sorted(unique_criteria, key=lambda c: c.estimated_cost())
@@ -0,0 +1,27 @@
+"""
+The scope of testing a directory: the criteria share the directory's
+snapshot (see :py:mod:`dirmagic.snapshot`) and the results of equal criteria
+(see :py:func:`dirmagic.core_criteria.result_memo`).
+"""
+
+import contextlib
+import typing
+
+from .core_criteria import result_memo
+from .snapshot import snapshot_cache
+
+__all__ = ["evaluation_context"]
+
+
+@contextlib.contextmanager
+def evaluation_context() -> typing.Iterator[None]:
+    """
+    Activates the snapshot cache and the result memo.
+
+    .. code-block:: python
+
+        with evaluation_context():
+            results = [evaluate(t, dir) for t in many_project_types]
+    """
+    with snapshot_cache(), result_memo():
+        yield
@@ -1,14 +1,524 @@
+import concurrent.futures
+import contextvars
+import functools
+import itertools
+import os
 import pathlib
+import time
 import typing
 
-from .core_criteria import PathSpec, ProjectType
+from .core_criteria import (
+    Criterion,
+    CriterionResult,
+    evaluate,
+    evaluate_matches,
+    PathSpec,
+    ProjectType,
+)
 from . import project_types
 from .generic_criteria import as_root_criterion, HasDir, HasEntryGlob, HasFile
-from .utilities import list_search_dirs, get_start_path
+from .marker_index import marker_index, MarkerIndex
+from .scan_index import ScanIndex
+from .evaluation import evaluation_context
+from .profiling import count_operation
+from .snapshot import get_snapshot
+from .utilities import (
+    DirectoryFilter,
+    get_start_path,
+    list_search_dirs,
+    PruneList,
+)
+
+_Result = typing.TypeVar("_Result")
+
+
+def _submit(
+    executor: concurrent.futures.Executor,
+    fn: typing.Callable[..., _Result],
+    *args: typing.Any,
+) -> "concurrent.futures.Future[_Result]":
+    """
+    Submits the call, on a thread pool in a copy of the current context: the
+    worker threads use the profiler, the parallel evaluation and the
+    evaluation context of the caller.
+    """
+    if isinstance(executor, concurrent.futures.ThreadPoolExecutor):
+        # a fresh copy for each call, a context can't be entered by two
+        # threads at a time
+        return executor.submit(contextvars.copy_context().run, fn, *args)
+    return executor.submit(fn, *args)
+
+
+# the directories listed while testing them, by path, see _list_sub_dirs
+_Listings = typing.Dict[str, typing.List["os.DirEntry[str]"]]
+
+
+def _list_sub_dirs(
+    search_dir: str,
+    dir_filter: DirectoryFilter,
+    listings: typing.Optional[_Listings],
+) -> typing.List[str]:
+    """
+    The sub-directories of ``search_dir`` to enter, from the listing taken
+    while testing ``search_dir`` if available.
+    """
+    entries = None if listings is None else listings.pop(search_dir, None)
+    if entries is None:
+        count_operation("listings")
+        with os.scandir(search_dir) as scanned_entries:
+            entries = list(scanned_entries)
+    return [
+        entry.path
+        for entry in entries
+        if entry.is_dir() and dir_filter.enter(entry)
+    ]
+
+
+def _keep_listing(sub_dir: str, listings: typing.Optional[_Listings]) -> None:
+    """
+    Keeps the listing of the directory to be searched next, taken by the
+    snapshot while testing it. Call inside the directory's evaluation
+    context.
+    """
+    if listings is None:
+        return
+    snapshot = get_snapshot(sub_dir)
+    if snapshot is not None:
+        listings[sub_dir] = list(snapshot.entries.values())
+
+
+def _search_dir(
+    search_dir: str,
+    criterion: Criterion,
+    depth: int,
+    dir_filter: DirectoryFilter,
+    listings: typing.Optional[_Listings] = None,
+) -> typing.Tuple[typing.List[pathlib.Path], typing.List[str]]:
+    """
+    Tests the sub-directories of ``search_dir`` against the criterion.
+
+    Returns the directories matched and the directories to be searched next.
+
+    ``listings``: the directories to be searched next are listed once, by
+    the snapshot of testing them. The listings are kept in this dict until
+    the directory is searched.
+    """
+    sub_dirs = _list_sub_dirs(search_dir, dir_filter, listings)
+
+    dirs_found = []
+    other_dirs = []
+    for sub_dir in sub_dirs:
+        dir = pathlib.Path(sub_dir)
+        with evaluation_context():
+            is_match = evaluate_matches(criterion, dir)
+            if not is_match and depth != 1:
+                _keep_listing(sub_dir, listings)
+        if is_match:
+            dirs_found.append(dir)
+        elif depth != 1:
+            other_dirs.append(sub_dir)
+
+    return dirs_found, other_dirs
+
+
+_ProjectRecords = typing.List[
+    typing.Tuple[pathlib.Path, typing.List[typing.Tuple[str, str]]]
+]
+
+DirId = typing.Tuple[int, int]
+
+# the sub-directories tested by a thread pool worker (the path, the directory
+# id and whether it matched) and the listings of the directories not matched
+_TestedDirs = typing.Tuple[
+    typing.List[typing.Tuple[str, DirId, bool]], _Listings
+]
+
+
+def _test_sub_dirs(
+    search_dir: str,
+    criterion: Criterion,
+    depth: int,
+    dir_filter: DirectoryFilter,
+    entries: typing.Optional[typing.List["os.DirEntry[str]"]],
+) -> _TestedDirs:
+    """
+    Tests the sub-directories of ``search_dir`` on a thread pool worker,
+    like :py:func:`_search_dir`, but without recording the directories
+    visited: the directories entered before are dropped by the caller, in
+    the order of the sequential search.
+
+    Returns the directories tested and the listings of the directories not
+    matched, to be searched next.
+    """
+    if entries is None:
+        count_operation("listings")
+        with os.scandir(search_dir) as scanned_entries:
+            entries = list(scanned_entries)
+
+    tested_dirs = []
+    listings: _Listings = {}
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        dir_stat = dir_filter.followed_stat(entry)
+        if dir_stat is None:
+            continue
+        with evaluation_context():
+            is_match = evaluate_matches(criterion, pathlib.Path(entry.path))
+            if not is_match and depth != 1:
+                _keep_listing(entry.path, listings)
+        dir_id = (dir_stat.st_dev, dir_stat.st_ino)
+        tested_dirs.append((entry.path, dir_id, is_match))
+    return tested_dirs, listings
+
+
+def _iter_projects_parallel(
+    start_dir: str,
+    criterion: Criterion,
+    maxdepth: int,
+    dir_filter: DirectoryFilter,
+    workers: int,
+) -> typing.Iterator[pathlib.Path]:
+    """
+    Searches the directories next on the stack of the sequential search on
+    the thread pool, at most a few per worker at any time. The results are
+    merged in the order of the sequential search, which decides the
+    directories entered.
+    """
+    max_pending = 4 * workers
+    listings: _Listings = {}
+    # the last directory on the stack is searched next
+    dirs_to_search = [(start_dir, maxdepth)]
+    searches: typing.Dict[str, "concurrent.futures.Future[_TestedDirs]"] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while dirs_to_search:
+                # the directory searched next is submitted in any case
+                for i, (search_dir, depth) in enumerate(
+                    reversed(dirs_to_search[-max_pending:])
+                ):
+                    if search_dir in searches:
+                        continue
+                    if i > 0 and len(searches) >= max_pending:
+                        break
+                    searches[search_dir] = _submit(
+                        pool,
+                        _test_sub_dirs,
+                        search_dir,
+                        criterion,
+                        depth,
+                        dir_filter,
+                        listings.pop(search_dir, None),
+                    )
+
+                search_dir, depth = dirs_to_search.pop()
+                tested_dirs, sub_listings = searches.pop(search_dir).result()
+                other_dirs = []
+                for sub_dir, dir_id, is_match in tested_dirs:
+                    if dir_id in dir_filter.visited:
+                        continue
+                    dir_filter.visited.add(dir_id)
+                    if is_match:
+                        yield pathlib.Path(sub_dir)
+                    elif depth != 1:
+                        other_dirs.append(sub_dir)
+                        if sub_dir in sub_listings:
+                            listings[sub_dir] = sub_listings[sub_dir]
+                dirs_to_search.extend(
+                    (d, depth - 1) for d in reversed(other_dirs)
+                )
+        finally:
+            # the consumer stopped early or a search failed
+            for search in searches.values():
+                search.cancel()
+
+
+_SearchToken = typing.Tuple[str, str, int, DirId]
+
+# the criterion and the directory filter settings of a process pool worker
+_worker_search: typing.Optional[
+    typing.Tuple[Criterion, str, str, typing.Optional[PruneList]]
+] = None
+
+# number of directories searched by a process pool task, the remaining
+# directories are handed back to be searched by the next free worker
+_PROCESS_TASK_MAX_DIRS = 256
+
+
+def _init_search_worker(
+    criterion: Criterion,
+    root: str,
+    follow_symlinks: str,
+    prune_list: typing.Optional[PruneList],
+) -> None:
+    global _worker_search
+    _worker_search = (criterion, root, follow_symlinks, prune_list)
+
+
+def _dir_id(path: PathSpec) -> DirId:
+    dir_stat = os.stat(path)
+    return dir_stat.st_dev, dir_stat.st_ino
+
+
+def _search_subtree(
+    start_dir: str, depth: int, max_dirs: int
+) -> typing.List[_SearchToken]:
+    """
+    Searches up to ``max_dirs`` directories of the subtree in a process pool
+    worker. Each directory of the subtree is entered once, the directories
+    entered by other tasks are dropped when merging the results.
+
+    Returns the tokens ``(kind, path, depth, dir_id)`` in the order of the
+    sequential search: ``searched`` and ``match`` for the directories
+    searched or matched, ``defer`` for the directories still to search.
+    """
+    assert _worker_search is not None
+    criterion, root, follow_symlinks, prune_list = _worker_search
+    dir_filter = DirectoryFilter(root, follow_symlinks, prune_list)
+
+    tokens = []
+    listings: _Listings = {}
+    dirs_to_search = [(start_dir, depth)]
+    while dirs_to_search and max_dirs > 0:
+        search_dir, depth = dirs_to_search.pop()
+        dir_id = _dir_id(search_dir)
+        dir_filter.visited.add(dir_id)
+        tokens.append(("searched", search_dir, depth, dir_id))
+        dirs_found, other_dirs = _search_dir(
+            search_dir, criterion, depth, dir_filter, listings
+        )
+        tokens.extend(
+            ("match", os.fspath(dir), depth, _dir_id(dir))
+            for dir in dirs_found
+        )
+        dirs_to_search.extend((d, depth - 1) for d in reversed(other_dirs))
+        max_dirs -= 1
+
+    tokens.extend(
+        ("defer", dir, depth, _dir_id(dir))
+        for dir, depth in reversed(dirs_to_search)
+    )
+    return tokens
+
+
+def _has_ancestor_in(
+    path: str, start_dir: str, ancestors: typing.AbstractSet[str]
+) -> bool:
+    """
+    Whether a parent directory of ``path`` below ``start_dir`` is one of the
+    ``ancestors``.
+    """
+    parent = os.path.dirname(path)
+    while len(parent) > len(start_dir):
+        if parent in ancestors:
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+
+def _iter_projects_processes(
+    start_dir: str,
+    criterion: Criterion,
+    maxdepth: int,
+    dir_filter: DirectoryFilter,
+    workers: int,
+) -> typing.Iterator[pathlib.Path]:
+    """
+    Searches the subtrees on a process pool.
+
+    Each task searches a limited number of directories, the directories
+    remaining are submitted as new tasks. Deep subtrees are split this way
+    and spread across all workers.
+
+    The tasks' results are merged in the order of the sequential search.
+    Like the sequential search, a directory reachable via several paths
+    (e.g. via symbolic links) is entered via the path listed first: the
+    directories entered are recorded when merging, the subtrees of the
+    directories entered again by a task are dropped. The tasks are sent
+    their start directory only, i.e. the cost of a task doesn't grow with
+    the number of directories searched before.
+    """
+    # the directories entered, in the order of the sequential search
+    visited = set(dir_filter.visited)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_search_worker,
+        initargs=(
+            criterion,
+            start_dir,
+            dir_filter.follow_symlinks,
+            dir_filter.prune_list,
+        ),
+    ) as pool:
+        # the first task lists the top level subtrees only
+        start_search = pool.submit(_search_subtree, start_dir, maxdepth, 1)
+        # search results still to process, the last one is processed next
+        items: typing.List[typing.Tuple[str, typing.Any]] = [
+            ("search", start_search)
+        ]
+        try:
+            while items:
+                kind, payload = items.pop()
+                if kind == "match":
+                    yield pathlib.Path(payload)
+                    continue
+                tokens = payload.result()
+                # the first token is the task's start directory, entered when
+                # it was deferred
+                task_dir = tokens[0][1]
+                # the directories of the task entered before via another
+                # path, their subtrees are dropped
+                entered_before: typing.Set[str] = set()
+                new_items: typing.List[typing.Tuple[str, typing.Any]] = []
+                for token_kind, path, depth, dir_id in tokens[1:]:
+                    if entered_before and _has_ancestor_in(
+                        path, task_dir, entered_before
+                    ):
+                        continue
+                    if dir_id in visited:
+                        if token_kind == "searched":
+                            entered_before.add(path)
+                        continue
+                    visited.add(dir_id)
+                    if token_kind == "match":
+                        new_items.append(("match", path))
+                    elif token_kind == "defer":
+                        search = pool.submit(
+                            _search_subtree,
+                            path,
+                            depth,
+                            _PROCESS_TASK_MAX_DIRS,
+                        )
+                        new_items.append(("search", search))
+                items.extend(reversed(new_items))
+        finally:
+            for kind, payload in items:
+                if kind == "search":
+                    payload.cancel()
+
+
+def iter_projects(
+    path: PathSpec,
+    criterion: typing.Any,
+    maxdepth: int = 1,
+    workers: typing.Optional[int] = None,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+    pool: str = "thread",
+    index: typing.Optional[ScanIndex] = None,
+) -> typing.Iterator[pathlib.Path]:
+    """
+    Iterate through all sub-directories inside ``path`` yielding the
+    directories matching the criterion as soon as they are found.
+
+    The search order and ``maxdepth`` are the same as for
+    :py:func:`find_projects`.
+
+    The directories are listed with :external+python:py:func:`os.scandir`,
+    which provides the entry type without an extra ``stat`` call for most
+    filesystems. The directories still to be searched are kept on an explicit
+    stack, i.e. the depth of the tree is not limited by python's recursion
+    limit.
+
+    ``workers``: if set, the directories are listed and tested on a
+    :external+python:py:class:`concurrent.futures.ThreadPoolExecutor` with
+    this number of threads. This helps on filesystems with a high latency,
+    like network mounts. The directories next in the order of the
+    sequential search are searched ahead, at most four per thread. The
+    matches are returned in the same order as for the sequential search.
+
+    ``pool``: ``thread`` (default) or ``process``. A
+    :external+python:py:class:`concurrent.futures.ProcessPoolExecutor` helps
+    when testing the criterion is CPU bound, e.g. matching the contents of
+    files. Each worker process searches a part of a subtree and hands the
+    remaining directories back to be searched by the next free worker. The
+    criterion must be picklable, e.g.
+    :py:class:`dirmagic.core_criteria.CriterionFromTestFun` needs a module
+    level function.
+
+    ``index``: a :py:class:`dirmagic.scan_index.ScanIndex` recording the
+    directories and criterion results. Directories not modified since the
+    last search are not listed or tested again. Can't be combined with
+    ``workers``.
+
+    ``follow_symlinks``: ``always`` (default), ``within-root`` or ``never``
+    search symbolically linked directories, see
+    :py:data:`dirmagic.utilities.FOLLOW_SYMLINKS_POLICIES`. Each directory is
+    visited once, identified by its device and inode number. This protects
+    against cyclic symbolic links and avoids searching the same directory
+    twice (via links or bind mounts). A directory reachable via several
+    paths is reported via the path listed first, also by the parallel
+    searches.
+
+    ``prune``: directories neither tested nor searched, e.g. ``True`` for
+    :py:data:`dirmagic.utilities.DEFAULT_PRUNE_LIST` (``node_modules``,
+    ``.git``, ``__pycache__``, ...), a list of names and glob patterns or a
+    :py:class:`dirmagic.utilities.PruneList`. The directories are pruned by
+    name, i.e. without any filesystem access.
+
+    Use :external+python:py:func:`itertools.islice` to stop after the first
+    ``n`` matches:
+
+    .. code-block:: python
+
+        first_projects = list(itertools.islice(iter_projects(path, c), n))
+    """
+    if maxdepth == 0:
+        return
+
+    the_criterion = as_root_criterion(criterion)
+    start_dir = os.fspath(get_start_path(path))
+    dir_filter = DirectoryFilter(start_dir, follow_symlinks, prune)
+
+    if workers is not None and index is not None:
+        raise ValueError("a search using an index can't use workers")
+
+    if workers is not None:
+        if pool == "thread":
+            yield from _iter_projects_parallel(
+                start_dir, the_criterion, maxdepth, dir_filter, workers
+            )
+        elif pool == "process":
+            yield from _iter_projects_processes(
+                start_dir, the_criterion, maxdepth, dir_filter, workers
+            )
+        else:
+            raise ValueError(f"pool must be thread or process, not `{pool}`")
+        return
+
+    search: typing.Callable[
+        [str, Criterion, int, DirectoryFilter],
+        typing.Tuple[typing.List[pathlib.Path], typing.List[str]],
+    ]
+    if index is None:
+        search = functools.partial(_search_dir, listings={})
+    else:
+        search = index.search_dir
+    # the last directory on the stack is searched next
+    dirs_to_search = [(start_dir, maxdepth)]
+    try:
+        while dirs_to_search:
+            search_dir, depth = dirs_to_search.pop()
+            dirs_found, other_dirs = search(
+                search_dir, the_criterion, depth, dir_filter
+            )
+            yield from dirs_found
+            # reversed: the first directory found is searched first
+            dirs_to_search.extend((d, depth - 1) for d in reversed(other_dirs))
+    finally:
+        if index is not None:
+            index.finish_search()
 
 
 def find_projects(
-    path: PathSpec, criterion: typing.Any, maxdepth: int = 1
+    path: PathSpec,
+    criterion: typing.Any,
+    maxdepth: int = 1,
+    workers: typing.Optional[int] = None,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+    pool: str = "thread",
+    index: typing.Optional[ScanIndex] = None,
 ) -> typing.List[pathlib.Path]:
     """
     Search through all sub-directories inside ``path`` returning the
@@ -18,30 +528,124 @@ def find_projects(
     Once a directory is matched, it is not searched for sub-projects.
 
     ``maxdepth``: the maximal iteration depth, unlimited if negative, will
-    always return [] when 0. Warning: The function is not protected against
-    cyclic symbolic links.
+    always return [] when 0.
+
+    ``workers``: number of threads (or processes with ``pool="process"``)
+    searching the directories in parallel, see :py:func:`iter_projects`.
+
+    ``follow_symlinks``: whether to search symbolically linked directories,
+    see :py:func:`iter_projects`. Each directory is searched once.
+
+    ``prune``: directories to skip, e.g. ``True`` for a default list of
+    vendored and generated directories, see :py:func:`iter_projects`.
+
+    ``index``: a :py:class:`dirmagic.scan_index.ScanIndex` to speed up
+    repeated searches, see :py:func:`iter_projects`.
+
+    See :py:func:`iter_projects` to process the matches as they are found.
     """
-    if maxdepth == 0:
-        return []
+    return list(
+        iter_projects(
+            path,
+            criterion,
+            maxdepth,
+            workers,
+            follow_symlinks,
+            prune,
+            pool,
+            index,
+        )
+    )
 
-    the_criterion = as_root_criterion(criterion)
-    start_path = get_start_path(path)
+
+def _classify_dir(
+    search_dir: str,
+    index: MarkerIndex,
+    depth: int,
+    dir_filter: DirectoryFilter,
+    descend_into_matches: bool,
+    listings: typing.Optional[_Listings] = None,
+) -> typing.Tuple[_ProjectRecords, typing.List[str]]:
+    """
+    Tests the sub-directories of ``search_dir`` against the project types of
+    the marker index.
+
+    Returns the directories identified with their types and the directories
+    to be searched next, see :py:func:`_search_dir` for ``listings``.
+    """
+    sub_dirs = _list_sub_dirs(search_dir, dir_filter, listings)
 
     dirs_found = []
     other_dirs = []
-    for dir in start_path.iterdir():
-        if not dir.is_dir():
-            continue
-        if the_criterion.test(dir):
-            dirs_found.append(dir)
-        else:
-            other_dirs.append(dir)
+    for sub_dir in sub_dirs:
+        dir = pathlib.Path(sub_dir)
+        with evaluation_context():
+            identified = _identified_types(
+                project_type
+                for project_type in index.types_to_test(dir)
+                if evaluate_matches(project_type, dir)
+            )
+            if (descend_into_matches or not identified) and depth != 1:
+                _keep_listing(sub_dir, listings)
+        if identified:
+            dirs_found.append((dir, identified))
+        if (descend_into_matches or not identified) and depth != 1:
+            other_dirs.append(sub_dir)
+
+    return dirs_found, other_dirs
+
+
+def scan_projects(
+    path: PathSpec,
+    types_to_test: typing.Optional[typing.Sequence[ProjectType]] = None,
+    maxdepth: int = 1,
+    descend_into_matches: bool = False,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+) -> _ProjectRecords:
+    """
+    Searches the sub-directories inside ``path`` like
+    :py:func:`find_projects` and identifies the projects in the same pass.
+
+    Returns a list of (directory, [(project category, project name), ...])
+    for the directories matching any of the project types, in the order of
+    :py:func:`find_projects`. This is the same as calling
+    :py:func:`identify_project` on each directory found by
+    :py:func:`find_projects` with all project types combined, without
+    listing and testing the directories found a second time.
 
-    if maxdepth != 1:
-        for dir in other_dirs:
-            dirs_found.extend(find_projects(dir, criterion, maxdepth - 1))
+    ``types_to_test``: the project types, all project types defined in
+    :py:mod:`dirmagic.project_types` if None (default).
 
-    return dirs_found
+    ``descend_into_matches``: if True, the projects are searched for nested
+    projects, e.g. packages inside a git repository.
+
+    See :py:func:`find_projects` for ``maxdepth``, ``follow_symlinks`` and
+    ``prune``.
+    """
+    if maxdepth == 0:
+        return []
+
+    index = marker_index(tuple(_project_types_to_test(types_to_test)))
+    start_dir = os.fspath(get_start_path(path))
+    dir_filter = DirectoryFilter(start_dir, follow_symlinks, prune)
+
+    projects = []
+    listings: _Listings = {}
+    dirs_to_search = [(start_dir, maxdepth)]
+    while dirs_to_search:
+        search_dir, depth = dirs_to_search.pop()
+        dirs_found, other_dirs = _classify_dir(
+            search_dir,
+            index,
+            depth,
+            dir_filter,
+            descend_into_matches,
+            listings,
+        )
+        projects.extend(dirs_found)
+        dirs_to_search.extend((d, depth - 1) for d in reversed(other_dirs))
+    return projects
 
 
 def find_root(
@@ -77,9 +681,28 @@ def find_root(
     Raises FileNotFoundError if no criteria were met.
     """
     parents = list_search_dirs(path, **kwargs)
+    the_criteria = _root_criteria(criterion)
 
+    for dir in parents:
+        if return_reason:
+            # the result trees are built while testing
+            root_result = _root_result(dir, the_criteria)
+            if root_result is not None:
+                return dir, root_result.reason()
+        elif _test_root(dir, the_criteria) is not None:
+            return dir
+
+    raise FileNotFoundError(
+        f"No root directory found in {parents[0]} or its parent directories."
+    )
+
+
+def _root_criteria(criterion: typing.Any) -> typing.List[Criterion]:
+    """
+    Converts the ``criterion`` argument of :py:func:`find_root`.
+    """
     if criterion is None:
-        the_criteria = [
+        return [
             # use a reasonable default from pyprojroot.here
             HasFile(".here"),
             HasDir(".git"),
@@ -92,49 +715,422 @@ def find_root(
             HasDir(".idea"),
             HasDir(".vscode"),
         ]
-    elif isinstance(criterion, (list, tuple)):
-        the_criteria = [as_root_criterion(c) for c in criterion]
-    else:
-        the_criteria = [as_root_criterion(criterion)]
+    if isinstance(criterion, (list, tuple)):
+        return [as_root_criterion(c) for c in criterion]
+    return [as_root_criterion(criterion)]
 
-    for dir in parents:
-        for the_criterion in the_criteria:
-            result = the_criterion.test(dir)
+
+def _test_root(
+    dir: pathlib.Path, criteria: typing.List[Criterion]
+) -> typing.Optional[Criterion]:
+    """
+    Returns the first criterion met, None if none is met.
+    """
+    with evaluation_context():
+        for the_criterion in criteria:
+            if evaluate_matches(the_criterion, dir):
+                return the_criterion
+    return None
+
+
+def _root_result(
+    dir: pathlib.Path, criteria: typing.List[Criterion]
+) -> typing.Optional[CriterionResult]:
+    """
+    Returns the result of the first criterion met, None if none is met.
+    """
+    with evaluation_context():
+        for the_criterion in criteria:
+            result = evaluate(the_criterion, dir)
             if result:
-                if return_reason:
-                    return dir, result.reason()
+                return result
+    return None
+
+
+class RootFinder:
+    """
+    Finds the project roots like :py:func:`find_root`, remembering the
+    criteria results of each directory tested.
+
+    Finding the roots of many files tests the same parent directories over
+    and over again. A root finder tests each directory against each
+    criterion once, later searches use the results recorded:
+
+    .. code-block:: python
+
+        root_finder = RootFinder()
+        roots = {file: root_finder.find_root(file) for file in files}
+
+    The results are keyed by the directory and the criterion object.
+
+    :param criterion: the criterion or list of criteria, see
+        :py:func:`find_root`
+    :param ttl: the seconds a result is used for, forever if None
+    """
+
+    def __init__(
+        self, criterion: typing.Any = None, ttl: typing.Optional[float] = None
+    ):
+        self.criteria = _root_criteria(criterion)
+        self.ttl = ttl
+        # (directory, criterion) -> (time tested, result)
+        self.results: typing.Dict[
+            typing.Tuple[str, Criterion], typing.Tuple[float, bool]
+        ] = {}
+
+    def _recorded(
+        self, key: typing.Tuple[str, Criterion], now: float
+    ) -> typing.Optional[bool]:
+        """
+        The result recorded, None if none or if it expired.
+        """
+        if key in self.results:
+            tested, result = self.results[key]
+            if self.ttl is None or now - tested < self.ttl:
+                return result
+        return None
+
+    def matches(self, dir: pathlib.Path, criterion: Criterion) -> bool:
+        """
+        Tests whether the directory matches the criterion unless there is a
+        result recorded.
+        """
+        key = (os.fspath(dir), criterion)
+        now = time.monotonic()
+        result = self._recorded(key, now)
+        if result is None:
+            result = evaluate_matches(criterion, dir)
+            self.results[key] = (now, result)
+        return result
+
+    def test_root(self, dir: pathlib.Path) -> typing.Optional[Criterion]:
+        """
+        Returns the first criterion met, None if none is met.
+        """
+        with evaluation_context():
+            for the_criterion in self.criteria:
+                if self.matches(dir, the_criterion):
+                    return the_criterion
+        return None
+
+    def _root_result(
+        self, dir: pathlib.Path
+    ) -> typing.Optional[CriterionResult]:
+        """
+        Returns the result of the first criterion met, None if none is met.
+        The criteria recorded as not met are skipped.
+        """
+        now = time.monotonic()
+        with evaluation_context():
+            for the_criterion in self.criteria:
+                key = (os.fspath(dir), the_criterion)
+                if self._recorded(key, now) is False:
+                    continue
+                result = evaluate(the_criterion, dir)
+                self.results[key] = (now, bool(result))
+                if result:
+                    return result
+        return None
+
+    def find_root(
+        self,
+        path: PathSpec = ".",
+        return_reason: bool = False,
+        **kwargs: typing.Any,
+    ) -> typing.Union[pathlib.Path, typing.Tuple[pathlib.Path, str]]:
+        """
+        Same as :py:func:`find_root` with the root finder's criteria.
+        """
+        parents = list_search_dirs(path, **kwargs)
+
+        for dir in parents:
+            if return_reason:
+                root_result = self._root_result(dir)
+                if root_result is not None:
+                    return dir, root_result.reason()
+            elif self.test_root(dir) is not None:
                 return dir
 
-    raise FileNotFoundError(
-        f"No root directory found in {parents[0]} or its parent directories."
-    )
+        raise FileNotFoundError(
+            f"No root directory found in {parents[0]} or its parent"
+            " directories."
+        )
+
+    def find_roots(
+        self, paths: typing.Iterable[PathSpec]
+    ) -> typing.Dict[PathSpec, typing.Optional[pathlib.Path]]:
+        """
+        Same as :py:func:`find_roots` with the root finder's criteria.
+        """
+        # the root of each directory seen, shared by all paths
+        dir_roots: typing.Dict[str, typing.Optional[pathlib.Path]] = {}
+        roots = {}
+        for path in paths:
+            dir = _existing_dir(path)
+            # the directories without a root recorded, from bottom to top
+            new_dirs = []
+            while dir not in dir_roots:
+                new_dirs.append(dir)
+                if self.test_root(pathlib.Path(dir)) is not None:
+                    root: typing.Optional[pathlib.Path] = pathlib.Path(dir)
+                    break
+                parent = os.path.dirname(dir)
+                if parent == dir:
+                    root = None
+                    break
+                dir = parent
+            else:
+                root = dir_roots[dir]
+            for new_dir in new_dirs:
+                dir_roots[new_dir] = root
+            roots[path] = root
+        return roots
+
+    def invalidate(self, path: typing.Optional[PathSpec] = None) -> None:
+        """
+        Forgets the results of the directory and the directories below, all
+        results if ``path`` is None.
+        """
+        if path is None:
+            self.results.clear()
+            return
+        dir = os.path.abspath(path)
+        prefix = os.path.join(dir, "")
+        for key in list(self.results):
+            if key[0] == dir or key[0].startswith(prefix):
+                del self.results[key]
+
+
+def _existing_dir(path: PathSpec) -> str:
+    """
+    The absolute path of the directory, the parent directory for files and
+    the nearest existing parent directory for paths not existing (anymore).
+    """
+    dir = os.path.abspath(path)
+    while not os.path.isdir(dir) and os.path.dirname(dir) != dir:
+        dir = os.path.dirname(dir)
+    return dir
+
+
+def find_roots(
+    paths: typing.Iterable[PathSpec], criterion: typing.Any = None
+) -> typing.Dict[PathSpec, typing.Optional[pathlib.Path]]:
+    """
+    Finds the project roots of many paths, e.g. the files changed in a
+    commit.
+
+    Returns a dictionary mapping each path (as passed) to its root, None if
+    no root was found.
+
+    Each directory is tested once: the parent directories are tested until
+    a root is found or a directory seen before is reached, the directories
+    visited on the way share the root. Paths not existing, like deleted
+    files, start from their nearest existing parent directory.
+
+    ``paths`` can be any iterable, e.g. the lines read from
+    ``git diff --name-only``:
+
+    .. code-block:: python
+
+        find_roots(line.rstrip("\\n") for line in sys.stdin)
+
+    See :py:func:`find_root` for ``criterion`` and :py:class:`RootFinder` to
+    keep the results across calls.
+    """
+    return RootFinder(criterion).find_roots(paths)
 
 
 def identify_project(
     path: PathSpec = ".",
     types_to_test: typing.Optional[typing.Sequence[ProjectType]] = None,
+    workers: typing.Optional[int] = None,
+    pool: str = "thread",
 ) -> typing.List[typing.Tuple[str, str]]:
     """
     Determines which criteria matche on path.
 
     Returns list of (project category, project name).
+
+    The directory is listed once, only the project types whose markers
+    (see :py:class:`dirmagic.marker_index.MarkerIndex`) are present or which
+    have no markers are tested.
+
+    ``workers``: if set, the project types are tested in parallel on a
+    ``thread`` or ``process`` ``pool`` with this number of workers. The
+    threads share the directory's snapshot and the results of the criteria
+    tested. The project types must be picklable for a process pool.
     """
     dir = get_start_path(path)
+    index = marker_index(tuple(_project_types_to_test(types_to_test)))
+
+    with evaluation_context():
+        the_types = index.types_to_test(dir)
+        if workers is None:
+            return _identified_types(
+                project_type
+                for project_type in the_types
+                if evaluate_matches(project_type, dir)
+            )
+
+        with _make_executor(pool, workers) as executor:
+            tests = [
+                _submit(executor, _test_criterion, project_type, dir)
+                for project_type in the_types
+            ]
+            results = [test.result() for test in tests]
+    return _identified_types(
+        project_type
+        for project_type, result in zip(the_types, results)
+        if result
+    )
+
+
+def _make_executor(
+    pool: str,
+    workers: int,
+    initializer: typing.Optional[typing.Callable[..., None]] = None,
+    initargs: typing.Tuple[typing.Any, ...] = (),
+) -> concurrent.futures.Executor:
+    if pool == "thread":
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, initializer=initializer, initargs=initargs
+        )
+    if pool == "process":
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=initializer, initargs=initargs
+        )
+    raise ValueError(f"pool must be thread or process, not `{pool}`")
+
+
+class IdentifiedProject(typing.NamedTuple):
+    """
+    A result of :py:func:`identify_projects`.
+    """
+
+    path: PathSpec
+    "the path as passed"
+
+    types: typing.List[typing.Tuple[str, str]]
+    "the (project category, project name) identified, empty on error"
+
+    error: typing.Optional[Exception] = None
+    "the exception raised while identifying the path"
+
+
+# the project types tested by a process pool worker
+_worker_types: typing.Sequence[ProjectType] = ()
+
+
+def _init_identify_worker(types: typing.Sequence[ProjectType]) -> None:
+    global _worker_types
+    _worker_types = types
+
+
+def _identify_dir(
+    path: PathSpec, types: typing.Optional[typing.Sequence[ProjectType]]
+) -> IdentifiedProject:
+    """
+    Identifies the path, the worker's project types are used if ``types`` is
+    None.
+    """
+    try:
+        return IdentifiedProject(
+            path,
+            identify_project(path, _worker_types if types is None else types),
+        )
+    except Exception as error:
+        return IdentifiedProject(path, [], error)
+
+
+def identify_projects(
+    paths: typing.Iterable[PathSpec],
+    types_to_test: typing.Optional[typing.Sequence[ProjectType]] = None,
+    workers: int = 4,
+    pool: str = "thread",
+    max_pending: typing.Optional[int] = None,
+) -> typing.Iterator[IdentifiedProject]:
+    """
+    Identifies many directories in parallel, like calling
+    :py:func:`identify_project` for each path.
+
+    Yields an :py:class:`IdentifiedProject` for each path as soon as it is
+    identified, i.e. not in the order of ``paths``. Errors (e.g.
+    :external+python:py:exc:`PermissionError`) are reported in the result's
+    ``error``, the remaining paths are still identified.
+
+    ``paths`` can be any iterable, it is consumed as the results are
+    returned: at most ``max_pending`` paths (default: 4 times ``workers``)
+    are submitted to the pool at any time. This keeps the memory used flat
+    for any number of paths.
+
+    ``workers`` and ``pool``: the number of threads (``thread``, default) or
+    processes (``process``) identifying the directories.
+    """
+    the_types = tuple(_project_types_to_test(types_to_test))
+    if max_pending is None:
+        max_pending = 4 * workers
+    if max_pending < 1:
+        raise ValueError("max_pending must be at least 1")
+
+    if pool == "process":
+        # the project types are sent to each worker process once
+        executor = _make_executor(
+            pool, workers, _init_identify_worker, (the_types,)
+        )
+        task_types: typing.Optional[typing.Sequence[ProjectType]] = None
+    else:
+        executor = _make_executor(pool, workers)
+        task_types = the_types
+
+    paths_iterator = iter(paths)
+    with executor:
+        pending: typing.Set["concurrent.futures.Future[IdentifiedProject]"]
+        pending = set()
+        try:
+            while True:
+                for path in itertools.islice(
+                    paths_iterator, max_pending - len(pending)
+                ):
+                    pending.add(
+                        _submit(executor, _identify_dir, path, task_types)
+                    )
+                if not pending:
+                    return
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _test_criterion(criterion: Criterion, dir: PathSpec) -> bool:
+    return evaluate_matches(criterion, dir)
+
+
+def _project_types_to_test(
+    types_to_test: typing.Optional[typing.Sequence[ProjectType]],
+) -> typing.Sequence[ProjectType]:
+    """
+    All project types defined in :py:mod:`dirmagic.project_types` if
+    ``types_to_test`` is None.
+    """
     if types_to_test is None:
-        types_to_test = [
+        return [
             project_type
             for project_type in project_types.__dict__.values()
             if isinstance(project_type, ProjectType)
         ]
+    return types_to_test
 
-    types_matched = []
-    for project_type in types_to_test:
-        result = project_type.test(dir)
-        if result:
-            types_matched.append(result)
 
+def _identified_types(
+    types_matched: typing.Iterable[Criterion],
+) -> typing.List[typing.Tuple[str, str]]:
     return sorted(
-        (type_matched.criterion.category, type_matched.criterion.name)
+        (type_matched.category, type_matched.name)
         for type_matched in types_matched
-        if isinstance(type_matched.criterion, ProjectType)
+        if isinstance(type_matched, ProjectType)
     )
@@ -1,15 +1,44 @@
 import itertools
+import os
 import pathlib
 import re
 import typing
 
 from .core_criteria import (
     AnyCriteria,
+    Cost,
     CriterionFromTestFun,
     PathSpec,
     Criterion,
     CriterionResult,
+    register_test_function,
 )
+from .pattern_criteria import _pattern_string
+from .profiling import count_operation
+from .snapshot import entry_name, get_snapshot, snapshot_for_entry
+
+
+def _path_markers(name: PathSpec) -> typing.Optional[typing.FrozenSet[str]]:
+    """
+    The first component of a relative path, None for templates.
+    """
+    path = pathlib.PurePath(name)
+    if (
+        path.is_absolute()
+        or not path.parts
+        or path.parts[0] == ".."
+        or "{" in str(name)
+    ):
+        return None
+    return frozenset(path.parts[:1])
+
+
+def _is_file(dir: PathSpec, filename: PathSpec) -> bool:
+    snapshot, name = snapshot_for_entry(dir, filename)
+    if snapshot is not None:
+        return snapshot.is_file(name)
+    count_operation("stats")
+    return (pathlib.Path(dir) / filename).is_file()
 
 
 class HasFile(Criterion):
@@ -31,6 +60,8 @@ class HasFile(Criterion):
     This is the reimplementation of ``has_file`` from ``rprojroot``.
     """
 
+    __slots__ = ("filename", "contents", "fixed", "max_lines_to_search")
+
     def __init__(
         self,
         filename: PathSpec,
@@ -51,7 +82,9 @@ class HasFile(Criterion):
         newline character at the end.
         """
         with open(file, "rt") as txt_file:
-            yield from (line.rstrip("\n") for line in txt_file)
+            for line in txt_file:
+                count_operation("bytes_read", len(line))
+                yield line.rstrip("\n")
 
     def check_file_contents(self, file: PathSpec) -> bool:
         """
@@ -113,17 +146,51 @@ class HasFile(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
+        return CriterionResult(self.matches(dir), self, dir)
 
-        full_filename = pathlib.Path(dir) / self.filename
-        return CriterionResult(
-            full_filename.is_file()
-            and self.check_file_contents(full_filename),
-            self,
-            dir,
-        )
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        filename: PathSpec = self.template_value("filename", args, kwargs)
+        if not _is_file(dir, filename):
+            return False
+        if self.contents is None:
+            return True
+        # the path is only needed to read the file
+        return self.check_file_contents(pathlib.Path(dir) / filename)
 
     template_attributes = ["filename"]
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (
+            os.fspath(self.filename),
+            self.contents,
+            self.max_lines_to_search,
+            self.fixed,
+        )
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        contents: typing.Any = self.contents
+        if isinstance(contents, re.Pattern):
+            contents = _pattern_string(contents)
+            if contents is None:
+                return None
+        return {
+            "filename": self.filename,
+            "contents": contents,
+            "n": self.max_lines_to_search,
+            "fixed": self.fixed,
+        }
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        return _path_markers(self.filename)
+
+    def estimated_cost(self) -> float:
+        return Cost.STAT if self.contents is None else Cost.CONTENT
+
     def describe(self) -> str:
         pattern_description = f"has a file `{self.filename}`"
         if self.contents is not None:
@@ -147,6 +214,8 @@ class HasFilePattern(HasFile):
     <https://rprojroot.r-lib.org/reference/root_criterion.html>`_).
     """
 
+    __slots__ = ()
+
     def __init__(
         self,
         pattern: str,
@@ -165,17 +234,48 @@ class HasFilePattern(HasFile):
         *args: typing.Any,
         **kwargs: typing.Any,
     ) -> CriterionResult:
+        return CriterionResult(self.matches(dir, *args, **kwargs), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
         assert not (args or kwargs)
         pattern = re.compile(str(self.filename))
-        for full_filename in pathlib.Path(dir).iterdir():
-            if (
-                full_filename.is_file()
-                and pattern.search(full_filename.name)
-                and self.check_file_contents(full_filename)
-            ):
-                # todo: how to communicate the matching filename?
-                return CriterionResult(True, self, dir)
-        return CriterionResult(False, self, dir)
+        snapshot = get_snapshot(dir)
+        if snapshot is not None:
+            files = [
+                pathlib.Path(dir) / name
+                for name in snapshot.names()
+                if pattern.search(name) and snapshot.is_file(name)
+            ]
+        else:
+            count_operation("listings")
+            files = [
+                full_filename
+                for full_filename in pathlib.Path(dir).iterdir()
+                if pattern.search(full_filename.name)
+                and full_filename.is_file()
+            ]
+        # todo: how to communicate the matching filename?
+        return any(
+            self.check_file_contents(full_filename) for full_filename in files
+        )
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        # the names are matched against a pattern
+        return None
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        parameters = super().parameters()
+        if parameters is not None:
+            parameters["pattern"] = parameters.pop("filename")
+        return parameters
+
+    def estimated_cost(self) -> float:
+        return Cost.LISTING if self.contents is None else Cost.CONTENT
 
     def describe(self) -> str:
         pattern_description = (
@@ -202,6 +302,8 @@ class HasFileGlob(HasFile):
     See :py:class:`HasFile` for the parameters matching the contents.
     """
 
+    __slots__ = ()
+
     def __init__(
         self,
         pattern: str,
@@ -220,14 +322,36 @@ class HasFileGlob(HasFile):
         *args: typing.Any,
         **kwargs: typing.Any,
     ) -> CriterionResult:
+        return CriterionResult(self.matches(dir, *args, **kwargs), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
         assert not (args or kwargs)
-        for full_filename in pathlib.Path(dir).glob(str(self.filename)):
-            if full_filename.is_file() and self.check_file_contents(
-                full_filename
-            ):
-                # todo: how to communicate the matching filename?
-                return CriterionResult(True, self, dir)
-        return CriterionResult(False, self, dir)
+        count_operation("listings")
+        # todo: how to communicate the matching filename?
+        return any(
+            full_filename.is_file() and self.check_file_contents(full_filename)
+            for full_filename in pathlib.Path(dir).glob(str(self.filename))
+        )
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        # the names are matched against a pattern
+        return None
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        parameters = super().parameters()
+        if parameters is not None:
+            parameters["pattern"] = parameters.pop("filename")
+        return parameters
+
+    def estimated_cost(self) -> float:
+        if self.contents is not None:
+            return Cost.CONTENT
+        return Cost.WALK if "**" in str(self.filename) else Cost.LISTING
 
     def describe(self) -> str:
         pattern_description = f"has a file matching `{self.filename}`"
@@ -241,6 +365,8 @@ class HasDir(Criterion):
     Match if a directory of the given name is present.
     """
 
+    __slots__ = ("dirname",)
+
     def __init__(self, dirname: PathSpec):
         self.dirname = dirname
         super().__init__()
@@ -253,12 +379,35 @@ class HasDir(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            (pathlib.Path(dir) / self.dirname).is_dir(), self, dir
-        )
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        dirname: PathSpec = self.template_value("dirname", args, kwargs)
+        snapshot, name = snapshot_for_entry(dir, dirname)
+        if snapshot is not None:
+            return snapshot.is_dir(name)
+        count_operation("stats")
+        return (pathlib.Path(dir) / dirname).is_dir()
 
     template_attributes = ["dirname"]
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (os.fspath(self.dirname),)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"dirname": self.dirname}
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        return _path_markers(self.dirname)
+
+    def estimated_cost(self) -> float:
+        return Cost.STAT
+
     def describe(self) -> str:
         return f"contains the directory `{self.dirname}`"
 
@@ -274,6 +423,8 @@ class HasEntry(Criterion):
     ``pathlib.Path.joinpath``. Consider using ``HasDir`` instead.
     """
 
+    __slots__ = ("entryname",)
+
     def __init__(self, entryname: PathSpec):
         self.entryname = entryname
         super().__init__()
@@ -286,12 +437,35 @@ class HasEntry(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            (pathlib.Path(dir) / self.entryname).exists(), self, dir
-        )
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        entryname: PathSpec = self.template_value("entryname", args, kwargs)
+        snapshot, name = snapshot_for_entry(dir, entryname)
+        if snapshot is not None:
+            return snapshot.exists(name)
+        count_operation("stats")
+        return (pathlib.Path(dir) / entryname).exists()
 
     template_attributes = ["entryname"]
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (os.fspath(self.entryname),)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"entryname": self.entryname}
+
+    def markers(self) -> typing.Optional[typing.FrozenSet[str]]:
+        return _path_markers(self.entryname)
+
+    def estimated_cost(self) -> float:
+        return Cost.STAT
+
     def describe(self) -> str:
         return f"contains the entry `{self.entryname}`"
 
@@ -303,6 +477,8 @@ class HasEntryGlob(Criterion):
     The glob pattern allows searching in subdirectories.
     """
 
+    __slots__ = ("pattern",)
+
     def __init__(
         self,
         pattern: str,
@@ -316,11 +492,34 @@ class HasEntryGlob(Criterion):
         *args: typing.Any,
         **kwargs: typing.Any,
     ) -> CriterionResult:
+        return CriterionResult(self.matches(dir, *args, **kwargs), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
         assert not (args or kwargs)
-        for _ in pathlib.Path(dir).glob(self.pattern):
-            # TODO return the entry found
-            return CriterionResult(True, self, dir)
-        return CriterionResult(False, self, dir)
+        snapshot = None
+        if entry_name(self.pattern) is not None and "**" not in self.pattern:
+            snapshot = get_snapshot(dir)
+        if snapshot is not None:
+            return any(
+                snapshot.exists(name) for name in snapshot.glob(self.pattern)
+            )
+        count_operation("listings")
+        # TODO return the entry found
+        return any(True for _ in pathlib.Path(dir).glob(self.pattern))
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.pattern,)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"pattern": self.pattern}
+
+    def estimated_cost(self) -> float:
+        return Cost.WALK if "**" in self.pattern else Cost.LISTING
 
     def describe(self) -> str:
         return f"has a file matching `{self.pattern}`"
@@ -336,6 +535,8 @@ class HasBasename(Criterion):
     :param basename: expected basename
     """
 
+    __slots__ = ("basename",)
+
     def __init__(self, basename: str):
         self.basename = basename
         super().__init__()
@@ -348,16 +549,50 @@ class HasBasename(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            self.basename == pathlib.Path(dir).name, self, dir
-        )
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        basename = self.template_value("basename", args, kwargs)
+        return bool(basename == pathlib.Path(dir).name)
 
     template_attributes = ["basename"]
 
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.basename,)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"basename": self.basename}
+
+    def estimated_cost(self) -> float:
+        return Cost.NAME
+
     def describe(self) -> str:
         return f"has the basename `{self.basename}`"
 
 
+def not_empty(path: PathSpec) -> bool:
+    """
+    Test function: the file is not empty or the directory has entries.
+
+    Registered as ``not_empty``, see
+    :py:func:`dirmagic.core_criteria.register_test_function`.
+    """
+    path = pathlib.Path(path)
+    if path.is_dir():
+        count_operation("listings")
+        return any(True for _ in path.iterdir())
+    count_operation("stats")
+    return path.stat().st_size > 0
+
+
+register_test_function(not_empty)
+
+
 def as_root_criterion(criterion: typing.Any) -> "Criterion":
     """
     Converts its input into a Criterion.
@@ -0,0 +1,74 @@
+"""
+Most project types are recognised by a marker entry, like ``.git`` or
+``DESCRIPTION``. The marker index maps the marker names to the project types,
+so that identifying a directory needs to test only the project types whose
+markers are present in the directory listing.
+"""
+
+import functools
+import typing
+
+from .core_criteria import PathSpec, ProjectType
+from .snapshot import get_snapshot
+
+__all__ = ["MarkerIndex", "marker_index"]
+
+
+class MarkerIndex:
+    """
+    Index of the project types by their marker names, see
+    :py:meth:`dirmagic.core_criteria.Criterion.markers`.
+
+    Project types without markers are always tested.
+
+    The names are compared case insensitively, i.e. project types are not
+    skipped wrongly on case insensitive filesystems.
+
+    :param types: the project types to index
+    """
+
+    def __init__(self, types: typing.Sequence[ProjectType]):
+        self.types = tuple(types)
+        self.by_marker: typing.Dict[str, typing.List[int]] = {}
+        self.always: typing.List[int] = []
+        for position, project_type in enumerate(self.types):
+            markers = project_type.markers()
+            if markers is None:
+                self.always.append(position)
+                continue
+            for marker in markers:
+                self.by_marker.setdefault(marker.lower(), []).append(position)
+
+    def candidates(
+        self, names: typing.Iterable[str]
+    ) -> typing.List[ProjectType]:
+        """
+        The project types which can be met by a directory with these entries,
+        in the order of the index's project types.
+        """
+        positions = set(self.always)
+        for name in names:
+            positions.update(self.by_marker.get(name.lower(), ()))
+        return [self.types[position] for position in sorted(positions)]
+
+    def types_to_test(self, dir: PathSpec) -> typing.Sequence[ProjectType]:
+        """
+        The candidate project types for the directory. All project types if
+        the directory can't be listed.
+
+        Needs an active :py:func:`dirmagic.snapshot.snapshot_cache`, the
+        snapshot is used by the criteria tested as well.
+        """
+        snapshot = get_snapshot(dir)
+        if snapshot is None:
+            return self.types
+        return self.candidates(snapshot.names())
+
+
+@functools.lru_cache(maxsize=16)
+def marker_index(types: typing.Tuple[ProjectType, ...]) -> MarkerIndex:
+    """
+    The marker index of the project types, built once for each set of
+    project types.
+    """
+    return MarkerIndex(types)
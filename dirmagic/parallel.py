@@ -0,0 +1,188 @@
+"""
+Parallel evaluation tests the criteria of
+:py:class:`dirmagic.core_criteria.AnyCriteria` and
+:py:class:`dirmagic.core_criteria.AllCriteria` speculatively on a shared
+thread pool, which helps on filesystems with a high latency (e.g. SMB or NFS
+shares), where every ``stat`` call takes a round trip:
+
+.. code-block:: python
+
+    with parallel_evaluation(max_workers=4):
+        root = find_root(path, is_vcs_root)
+
+The criteria are started in the declared order (or the adaptive order, see
+:py:mod:`dirmagic.adaptive`), at most ``max_workers`` at a time for each
+Any or All criterion. The results are taken in the same order, the
+evaluation ends with the first result deciding the outcome, like testing the
+criteria one after the other: results and reasons don't change. The criteria
+not started yet are cancelled, the criteria running are left to finish in
+the background. The adaptive order isn't updated while testing in parallel.
+
+Criteria not accessing the filesystem (with an estimated cost below
+:py:attr:`dirmagic.core_criteria.Cost.STAT`) are tested directly. The
+criteria tested on a worker thread test their own criteria one after the
+other, i.e. only the outermost Any and All criteria are parallelized and the
+pool can't run out of threads.
+
+The worker threads share the result memo, the snapshot cache (see
+:py:func:`dirmagic.evaluation.evaluation_context`) and the profiler (see
+:py:mod:`dirmagic.profiling`) of the calling thread. The profiler records
+the operations of the criteria tested on worker threads for these criteria
+only, not for the Any or All criterion starting them.
+
+The parallel evaluation is active for the current thread (or task) and the
+worker threads of the top level functions, e.g. of
+:py:func:`dirmagic.find_projects` with ``workers``: each directory searched
+tests its criteria on the shared pool. A criterion not started when its
+result is needed is tested by the waiting thread, i.e. the evaluation
+doesn't wait for a thread of the pool to become free.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import typing
+
+if typing.TYPE_CHECKING:
+    from .core_criteria import Criterion, PathSpec
+
+__all__ = [
+    "active_parallel_evaluation",
+    "parallel_evaluation",
+    "ParallelEvaluation",
+]
+
+_Result = typing.TypeVar("_Result")
+
+
+class ParallelEvaluation:
+    """
+    Tests criteria on the executor, ``max_workers`` at a time.
+
+    :param executor: the executor running the tests
+    :param max_workers: the maximum number of criteria tested at a time by
+        one Any or All criterion
+    :param min_cost: criteria with a lower estimated cost (see
+        :py:meth:`dirmagic.core_criteria.Criterion.estimated_cost`) are
+        tested directly
+    """
+
+    def __init__(
+        self,
+        executor: concurrent.futures.Executor,
+        max_workers: int = 4,
+        min_cost: float = 2,
+    ):
+        if max_workers < 1:
+            raise ValueError(
+                f"max_workers must be positive, not {max_workers}"
+            )
+        self.executor = executor
+        self.max_workers = max_workers
+        self.min_cost = min_cost
+
+    def _submit(
+        self,
+        evaluator: typing.Callable[..., _Result],
+        criterion: "Criterion",
+        dir: "PathSpec",
+        args: typing.Tuple[typing.Any, ...],
+        kwargs: typing.Dict[str, typing.Any],
+    ) -> "concurrent.futures.Future[_Result]":
+        # each task needs its own context: a context can't be entered by two
+        # threads at a time
+        context = contextvars.copy_context()
+        context.run(_parallel_evaluation.set, None)
+        return self.executor.submit(
+            context.run, evaluator, criterion, dir, *args, **kwargs
+        )
+
+    def iter_evaluated(
+        self,
+        evaluator: typing.Callable[..., _Result],
+        criteria: typing.Sequence["Criterion"],
+        dir: "PathSpec",
+        args: typing.Tuple[typing.Any, ...],
+        kwargs: typing.Dict[str, typing.Any],
+    ) -> typing.Iterator[_Result]:
+        """
+        Yields the results of ``evaluator(criterion, dir, *args, **kwargs)``
+        in the order of the criteria. The criteria ahead are started while
+        waiting, closing the iterator cancels them.
+        """
+        running: typing.Dict[int, "concurrent.futures.Future[_Result]"] = {}
+        ahead = collections.deque(
+            position
+            for position, c in enumerate(criteria)
+            if c.estimated_cost() >= self.min_cost
+        )
+        try:
+            for position, criterion in enumerate(criteria):
+                while ahead and len(running) < self.max_workers:
+                    next_position = ahead.popleft()
+                    running[next_position] = self._submit(
+                        evaluator, criteria[next_position], dir, args, kwargs
+                    )
+                future = running.pop(position, None)
+                if future is None or future.cancel():
+                    # not started yet (e.g. all threads of a shared executor
+                    # busy), tested here instead of waiting for a thread
+                    yield evaluator(criterion, dir, *args, **kwargs)
+                else:
+                    yield future.result()
+        finally:
+            for future in running.values():
+                future.cancel()
+
+
+_parallel_evaluation: (
+    "contextvars.ContextVar[typing.Optional[ParallelEvaluation]]"
+) = contextvars.ContextVar("dirmagic_parallel_evaluation", default=None)
+
+
+def active_parallel_evaluation() -> typing.Optional[ParallelEvaluation]:
+    """
+    The parallel evaluation active for the current thread (or task), None if
+    none (or on the worker threads).
+    """
+    return _parallel_evaluation.get()
+
+
+@contextlib.contextmanager
+def parallel_evaluation(
+    max_workers: int = 4,
+    executor: typing.Optional[concurrent.futures.Executor] = None,
+    min_cost: float = 2,
+) -> typing.Iterator[ParallelEvaluation]:
+    """
+    Activates the parallel evaluation for the current thread (or task).
+
+    Without ``executor``, a thread pool with ``max_workers`` threads is used
+    while the context is active, shared by the worker threads of the top
+    level functions. Pass a shared
+    :external+python:py:class:`concurrent.futures.ThreadPoolExecutor` to
+    limit the concurrent tests of several threads each activating the
+    evaluation. The executor should run the tests only: tasks waiting for
+    other tasks of the same executor can block its threads.
+
+    :param max_workers: the maximum number of criteria tested at a time by
+        one Any or All criterion
+    :param executor: the thread pool to use
+    :param min_cost: criteria with a lower estimated cost are tested
+        directly
+    """
+    own_executor = executor is None
+    if executor is None:
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="dirmagic-evaluation",
+        )
+    evaluation = ParallelEvaluation(executor, max_workers, min_cost)
+    token = _parallel_evaluation.set(evaluation)
+    try:
+        yield evaluation
+    finally:
+        _parallel_evaluation.reset(token)
+        if own_executor:
+            executor.shutdown(wait=True)
@@ -1,4 +1,6 @@
+import collections
 import mimetypes
+import os
 import pathlib
 import re
 import typing
@@ -10,7 +12,23 @@ try:
 except ImportError:
     pass
 
-from .core_criteria import Criterion, CriterionResult, PathSpec
+from .core_criteria import (
+    Cost,
+    Criterion,
+    CriterionResult,
+    evaluate,
+    evaluate_matches,
+    from_dict,
+    get_test_function,
+    PathSpec,
+    registered_name,
+)
+from .profiling import count_operation
+from .utilities import (
+    as_prune_list,
+    DirectoryFilter,
+    FOLLOW_SYMLINKS_POLICIES,
+)
 
 try:
     re_pattern_type = re.Pattern[str]
@@ -24,13 +42,29 @@ __all__ = [
     "AnyMatchCriterion",
     "AllMatchCriterion",
     "FileMimeType",
+    "FileTest",
     "MatchesPattern",
     "IsIn",
     "SuffixIsIn",
     "SpyCriterion",
     "translate",
+    "ENTRY_TYPES",
 ]
 
+ENTRY_TYPES = ("file", "dir")
+"""
+The entry types the match criteria can be limited to.
+"""
+
+
+def _pattern_string(pattern: re_pattern_type) -> typing.Optional[str]:
+    """
+    The pattern's string, None if compiled with flags (they would be lost).
+    """
+    if pattern.flags != re.compile(pattern.pattern).flags:
+        return None
+    return str(pattern.pattern)
+
 
 # helper function
 def iter_matching_entries(
@@ -39,6 +73,9 @@ def iter_matching_entries(
     pattern: re_pattern_type,
     subpath: pathlib.Path = pathlib.Path(),
     maxdepth: int = -1,
+    follow_symlinks: str = "always",
+    prune: typing.Any = None,
+    entry_type: typing.Optional[str] = None,
 ) -> typing.Iterator[re_match_type]:
     """
     Search through all sub-directories inside ``start_path/sub_path``
@@ -46,10 +83,6 @@ def iter_matching_entries(
     The sub-directories are searched breadth first.
     If a directory's name matches, the directory entries are not searched.
 
-    .. warning::
-
-        The function is not protected against cyclic symbolic links.
-
     :param start_path: the directory to start the search at
 
     :param pattern: The pattern is matched with
@@ -60,26 +93,92 @@ def iter_matching_entries(
 
     :param maxdepth: the maximal iteration depth, unlimited if negative, will
         always return immediately when 0.
-    """
 
+    :param follow_symlinks: ``always`` (default), ``within-root`` or
+        ``never`` search symbolically linked directories, see
+        :py:data:`dirmagic.utilities.FOLLOW_SYMLINKS_POLICIES`. Each
+        directory is searched once, which protects against cyclic symbolic
+        links.
+
+    :param prune: directories neither matched nor searched, e.g. ``True``
+        for :py:data:`dirmagic.utilities.DEFAULT_PRUNE_LIST`, see
+        :py:func:`dirmagic.utilities.as_prune_list`.
+
+    :param entry_type: one of :py:data:`ENTRY_TYPES` to match files or
+        directories only, all entries if None (default). The directories
+        not matched are searched.
+    """
+    if entry_type is not None and entry_type not in ENTRY_TYPES:
+        raise ValueError(
+            f"entry_type must be one of {ENTRY_TYPES}, not `{entry_type}`"
+        )
+    if follow_symlinks not in FOLLOW_SYMLINKS_POLICIES:
+        raise ValueError(
+            f"follow_symlinks must be one of {FOLLOW_SYMLINKS_POLICIES},"
+            f" not `{follow_symlinks}`"
+        )
     if maxdepth == 0:
         return
 
-    other_dirs = []
-    for entry in (start_path / subpath).iterdir():
-        rel_entry = entry.relative_to(start_path)
-        m = pattern.search(str(rel_entry))
-        if m:
-            yield m
-        else:
-            # really? Maybe I should do this independent of matches...
-            if entry.is_dir() and maxdepth != 1:
-                other_dirs.append(rel_entry)
-
-    while other_dirs:
-        yield from iter_matching_entries(
-            start_path, pattern, other_dirs.pop(0), maxdepth - 1
+    prune_list = as_prune_list(prune)
+    # The filter resolves and stats the start path, it's created for the
+    # first directory pruned or entered: most searches by the criteria list
+    # a single directory.
+    dir_filter: typing.Optional[DirectoryFilter] = None
+
+    def get_dir_filter() -> DirectoryFilter:
+        nonlocal dir_filter
+        if dir_filter is None:
+            dir_filter = DirectoryFilter(
+                start_path, follow_symlinks, prune_list
+            )
+        return dir_filter
+
+    rel_subpath = os.fspath(subpath)
+    prefix = "" if rel_subpath == "." else rel_subpath + os.sep
+    # Each directory's entries come first, then the sub-directories are
+    # searched in the order listed, each one before the next sibling: a stack
+    # of the sub-directories pending on each level (the relative path prefix,
+    # the path to list and the depth left) replaces the recursion.
+    pending: typing.List[typing.Deque[typing.Tuple[str, str, int]]] = [
+        collections.deque(
+            [(prefix, os.fspath(start_path / subpath), maxdepth)]
+        )
+    ]
+    while pending:
+        siblings = pending[-1]
+        if not siblings:
+            pending.pop()
+            continue
+        prefix, path, depth = siblings.popleft()
+
+        count_operation("listings")
+        with os.scandir(path) as entries:
+            dir_entries = list(entries)
+
+        sub_dirs: typing.Deque[typing.Tuple[str, str, int]] = (
+            collections.deque()
         )
+        for entry in dir_entries:
+            # the entry type is known from listing the directory
+            is_dir = entry.is_dir()
+            if (
+                is_dir
+                and prune_list is not None
+                and get_dir_filter().is_pruned(entry)
+            ):
+                continue
+            rel_entry = prefix + entry.name
+            m = pattern.search(rel_entry)
+            if m and (
+                entry_type is None
+                or (is_dir if entry_type == "dir" else entry.is_file())
+            ):
+                yield m
+            elif is_dir and depth != 1 and get_dir_filter().enter(entry):
+                sub_dirs.append((rel_entry + os.sep, entry.path, depth - 1))
+        if sub_dirs:
+            pending.append(sub_dirs)
 
 
 class MatchesPattern(Criterion):
@@ -91,6 +190,8 @@ class MatchesPattern(Criterion):
     :param pattern: pattern to match against
     """
 
+    __slots__ = ("name_template", "pattern")
+
     def __init__(
         self, name_template: str, pattern: typing.Union[str, re_pattern_type]
     ):
@@ -108,9 +209,28 @@ class MatchesPattern(Criterion):
         # nothing really done with dir?!
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            self.pattern.search(self.name_template) is not None, self, dir
-        )
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        name = self.template_value("name_template", args, kwargs)
+        return self.pattern.search(name) is not None
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.name_template, self.pattern.pattern, self.pattern.flags)
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        pattern = _pattern_string(self.pattern)
+        if pattern is None:
+            return None
+        return {"name_template": self.name_template, "pattern": pattern}
+
+    def estimated_cost(self) -> float:
+        return Cost.NAME
 
     def describe(self) -> str:
         return f"`{self.name_template}` matches `{self.pattern.pattern}`"
@@ -124,6 +244,8 @@ class IsIn(Criterion):
     :param names: names expected
     """
 
+    __slots__ = ("names", "name_template")
+
     def __init__(self, name_template: str, names: typing.List[str]):
         self.names = list(names)
         self.name_template = str(name_template)
@@ -137,10 +259,27 @@ class IsIn(Criterion):
         **kwargs: typing.Dict[str, typing.Any],
     ) -> CriterionResult:
         if args or kwargs:
-            self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            pathlib.Path(self.name_template).name in self.names, self, dir
-        )
+            return self.expand_pattern(*args, **kwargs).test(dir)
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        name = self.template_value("name_template", args, kwargs)
+        return pathlib.Path(name).name in self.names
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        # the order of the names doesn't matter
+        return (self.name_template, frozenset(self.names))
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"name_template": self.name_template, "names": self.names}
+
+    def estimated_cost(self) -> float:
+        return Cost.NAME
 
     def describe(self) -> str:
         return f"`{self.name_template}` is in {self.names}"
@@ -155,6 +294,8 @@ class SuffixIsIn(Criterion):
     :param suffixes: suffixes expected, contains the dot (like ``.txt``)
     """
 
+    __slots__ = ("name_template", "suffixes")
+
     def __init__(self, name_template: str, suffixes: typing.List[str]):
         self.name_template = str(name_template)
         self.suffixes = list(suffixes)
@@ -169,9 +310,26 @@ class SuffixIsIn(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
-        return CriterionResult(
-            pathlib.Path(self.name_template).suffix in self.suffixes, self, dir
-        )
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        name = self.template_value("name_template", args, kwargs)
+        return pathlib.Path(name).suffix in self.suffixes
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        # the order of the suffixes doesn't matter
+        return (self.name_template, frozenset(self.suffixes))
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"name_template": self.name_template, "suffixes": self.suffixes}
+
+    def estimated_cost(self) -> float:
+        return Cost.NAME
 
     def describe(self) -> str:
         return f"the suffix of `{self.name_template}` is in {self.suffixes}"
@@ -186,6 +344,8 @@ class FileMimeType(Criterion):
     :param mimetype: the mime type expected
     """
 
+    __slots__ = ("filename", "mimetype")
+
     def __init__(self, filename: PathSpec, mimetype: str):
         self.filename = str(filename)
         self.mimetype = str(mimetype)
@@ -197,13 +357,26 @@ class FileMimeType(Criterion):
     ) -> CriterionResult:
         if args or kwargs:
             return self.expand_pattern(*args, **kwargs).test(dir)
+        return CriterionResult(self.matches(dir), self, dir)
 
-        mimetype, _ = mimetypes.guess_type(str(self.filename))
-        return CriterionResult(
-            mimetype is not None and mimetype == self.mimetype,
-            self,
-            dir,
-        )
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        filename = self.template_value("filename", args, kwargs)
+        mimetype, _ = mimetypes.guess_type(str(filename))
+        return mimetype is not None and mimetype == self.mimetype
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.filename, self.mimetype)
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {"filename": self.filename, "mimetype": self.mimetype}
+
+    def estimated_cost(self) -> float:
+        return Cost.NAME
 
     def describe(self) -> str:
         return (
@@ -211,11 +384,81 @@ class FileMimeType(Criterion):
         )
 
 
+class FileTest(Criterion):
+    """
+    Tests the entry ``filename`` inside the directory with the test
+    function, e.g. to check the file's contents. Fails if the entry doesn't
+    exist.
+
+    :param filename: the entry's name, expanded if used with pattern
+        matching
+    :param test: the test function called with the entry's path, or the
+        name it is registered under (see
+        :py:func:`dirmagic.core_criteria.register_test_function`)
+    """
+
+    __slots__ = ("filename", "test_function")
+
+    def __init__(
+        self,
+        filename: PathSpec,
+        test: typing.Union[str, typing.Callable[[pathlib.Path], bool]],
+    ):
+        self.filename = str(filename)
+        if isinstance(test, str):
+            test = get_test_function(test)
+        self.test_function = test
+
+    template_attributes = ["filename"]
+
+    def test(
+        self, dir: PathSpec, *args: typing.Any, **kwargs: typing.Any
+    ) -> CriterionResult:
+        if args or kwargs:
+            return self.expand_pattern(*args, **kwargs).test(dir)
+        return CriterionResult(self.matches(dir), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        path = pathlib.Path(dir) / self.template_value(
+            "filename", args, kwargs
+        )
+        count_operation("stats")
+        return path.exists() and bool(self.test_function(path))
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (self.filename, self.test_function)
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        name = registered_name(self.test_function)
+        if name is None:
+            return None
+        return {"filename": self.filename, "test": name}
+
+    def __reduce_ex__(self, protocol: typing.Any) -> typing.Any:
+        # registered test functions are pickled by name, e.g. lambdas
+        if registered_name(self.test_function) is None:
+            return super().__reduce_ex__(protocol)
+        return (from_dict, (self.to_dict(),))
+
+    def describe(self) -> str:
+        name = registered_name(self.test_function) or getattr(
+            self.test_function, "__name__", "test"
+        )
+        return f"`{self.filename}` passes the test `{name}`"
+
+
 class SpyCriterion(Criterion):
     """
     Helps debugging criteria by printing all test arguments.
     """
 
+    __slots__ = ()
+
     def test(
         self, dir: PathSpec, *args: typing.Any, **kwargs: typing.Any
     ) -> CriterionResult:
@@ -223,26 +466,152 @@ class SpyCriterion(Criterion):
         This test prints the test arguments to stdout and returns True.
         Link this crtierion with ``&`` to the criteria you want to debug.
         """
+        return CriterionResult(self.matches(dir, *args, **kwargs), self, dir)
+
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
         print("spy output", dir, args, kwargs)
-        return CriterionResult(True, self, dir)
+        return True
+
+    def parameters(self) -> typing.Dict[str, typing.Any]:
+        return {}
 
     def describe(self) -> str:
         return "SpyCriterion: always True and prints out the test parameters"
 
 
-class AnyMatchCriterion(Criterion):
+class _MatchCriterion(Criterion):
+    """
+    The entries matching the pattern, searched by
+    :py:class:`AnyMatchCriterion` and :py:class:`AllMatchCriterion`.
+    """
+
+    __slots__ = ("pattern", "criterion", "maxdepth", "subdir", "entry_type")
+
+    def __init__(
+        self,
+        pattern: typing.Union[str, re_pattern_type],
+        criterion: Criterion,
+        maxdepth: int = -1,
+        subdir: typing.Optional[str] = None,
+        entry_type: typing.Optional[str] = None,
+    ):
+        # for now pattern only regular expressions
+        self.pattern = re.compile(pattern)
+        self.criterion = criterion
+        if subdir is not None and os.path.isabs(subdir):
+            raise ValueError(f"subdir must be a relative path, not `{subdir}`")
+        if entry_type is not None and entry_type not in ENTRY_TYPES:
+            raise ValueError(
+                f"entry_type must be one of {ENTRY_TYPES}, not `{entry_type}`"
+            )
+        self.maxdepth = maxdepth
+        self.subdir = subdir
+        self.entry_type = entry_type
+        super().__init__()
+
+    def iter_matches(
+        self, dir: pathlib.Path
+    ) -> typing.Iterator[re_match_type]:
+        """
+        The matching entries inside the directory (and the bounds), none if
+        the sub-directory doesn't exist.
+        """
+        if self.subdir is None:
+            return iter_matching_entries(
+                dir,
+                self.pattern,
+                maxdepth=self.maxdepth,
+                entry_type=self.entry_type,
+            )
+        subpath = pathlib.Path(self.subdir)
+        if not (dir / subpath).is_dir():
+            return iter(())
+        return iter_matching_entries(
+            dir,
+            self.pattern,
+            subpath,
+            maxdepth=self.maxdepth,
+            entry_type=self.entry_type,
+        )
+
+    def describe_bounds(self) -> str:
+        """
+        The bounds of the search, an empty string if the whole tree is
+        searched.
+        """
+        bounds = []
+        if self.entry_type == "file":
+            bounds.append("files only")
+        elif self.entry_type == "dir":
+            bounds.append("directories only")
+        if self.subdir is not None:
+            bounds.append(f"inside `{self.subdir}`")
+        if self.maxdepth >= 0:
+            levels = "level" if self.maxdepth == 1 else "levels"
+            bounds.append(f"at most {self.maxdepth} {levels} deep")
+        if not bounds:
+            return ""
+        return f" ({', '.join(bounds)})"
+
+    def equality_key(self) -> typing.Tuple[typing.Any, ...]:
+        return (
+            self.pattern.pattern,
+            self.pattern.flags,
+            self.criterion,
+            self.maxdepth,
+            self.subdir,
+            self.entry_type,
+        )
+
+    def parameters(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        pattern = _pattern_string(self.pattern)
+        if pattern is None:
+            return None
+        return {
+            "pattern": pattern,
+            "criterion": self.criterion,
+            "maxdepth": self.maxdepth,
+            "subdir": self.subdir,
+            "entry_type": self.entry_type,
+        }
+
+    def estimated_cost(self) -> float:
+        if 0 <= self.maxdepth <= 1:
+            # one directory listing
+            return Cost.LISTING
+        return Cost.WALK
+
+    def optimize(self) -> Criterion:
+        return type(self)(
+            self.pattern,
+            self.criterion.optimize(),
+            self.maxdepth,
+            self.subdir,
+            self.entry_type,
+        )
+
+
+class AnyMatchCriterion(_MatchCriterion):
     """
     Tests a criterion on entries matching. Is successful when any matching
     entry is tested successfully.
 
     :param pattern: regular expression pattern to match entries
     :param criterion: criterion to test on each match
+    :param maxdepth: the maximal search depth, unlimited if negative, 1 for
+        the entries directly inside the directory (or ``subdir``)
+    :param subdir: a relative path to limit the search to, the paths matched
+        are still relative to the directory tested
+    :param entry_type: one of :py:data:`ENTRY_TYPES` to match files or
+        directories only, all entries if None
     """
 
-    def __init__(self, pattern: str, criterion: Criterion):
-        self.pattern = re.compile(pattern)
-        self.criterion = criterion
-        super().__init__()
+    __slots__ = ()
 
     def test(
         self,
@@ -252,8 +621,8 @@ class AnyMatchCriterion(Criterion):
     ) -> CriterionResult:
         all_res = []
         dir = pathlib.Path(dir)
-        for match in iter_matching_entries(dir, self.pattern, maxdepth=-1):
-            res = self.criterion.test(dir, match, *args, **kwargs)
+        for match in self.iter_matches(dir):
+            res = evaluate(self.criterion, dir, match, *args, **kwargs)
             all_res.append(res)
             if res:
                 # early exit
@@ -261,10 +630,26 @@ class AnyMatchCriterion(Criterion):
 
         return CriterionResult(False, self, dir, tuple(all_res))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        dir = pathlib.Path(dir)
+        # no per-entry results are kept
+        return any(
+            evaluate_matches(self.criterion, dir, match, *args, **kwargs)
+            for match in self.iter_matches(dir)
+        )
+
     def rich_tree(self) -> "rich.tree.Tree":
         from rich.tree import Tree
 
-        t = Tree(f"for at least one file matching `{self.pattern.pattern}`")
+        t = Tree(
+            f"for at least one file matching `{self.pattern.pattern}`"
+            f"{self.describe_bounds()}"
+        )
         t.add(self.criterion.rich_tree())
 
         return t
@@ -273,23 +658,26 @@ class AnyMatchCriterion(Criterion):
         return (
             f"Tests whether the criterion `{self.criterion.describe()}` is "
             f"true for at least one entry matching `{self.pattern.pattern}`"
+            f"{self.describe_bounds()}"
         )
 
 
-class AllMatchCriterion(Criterion):
+class AllMatchCriterion(_MatchCriterion):
     """
     Tests a criterion on entries matching. Is successful when all
     matching entries are tested successfully.
 
     :param pattern: regular expression pattern to match entries
     :param criterion: criterion to test on each match
+    :param maxdepth: the maximal search depth, unlimited if negative, 1 for
+        the entries directly inside the directory (or ``subdir``)
+    :param subdir: a relative path to limit the search to, the paths matched
+        are still relative to the directory tested
+    :param entry_type: one of :py:data:`ENTRY_TYPES` to match files or
+        directories only, all entries if None
     """
 
-    def __init__(self, pattern: str, criterion: Criterion):
-        # for now pattern only regular expressions
-        self.pattern = re.compile(pattern)
-        self.criterion = criterion
-        super().__init__()
+    __slots__ = ()
 
     def test(
         self,
@@ -300,8 +688,8 @@ class AllMatchCriterion(Criterion):
         all_res = []
         dir = pathlib.Path(dir)
 
-        for match in iter_matching_entries(dir, self.pattern, maxdepth=-1):
-            res = self.criterion.test(dir, match, *args, **kwargs)
+        for match in self.iter_matches(dir):
+            res = evaluate(self.criterion, dir, match, *args, **kwargs)
             all_res.append(res)
             if not res:
                 # early exit
@@ -309,10 +697,26 @@ class AllMatchCriterion(Criterion):
 
         return CriterionResult(True, self, dir, tuple(all_res))
 
+    def matches(
+        self,
+        dir: PathSpec,
+        *args: typing.Any,
+        **kwargs: typing.Any,
+    ) -> bool:
+        dir = pathlib.Path(dir)
+        # no per-entry results are kept
+        return all(
+            evaluate_matches(self.criterion, dir, match, *args, **kwargs)
+            for match in self.iter_matches(dir)
+        )
+
     def rich_tree(self) -> "rich.tree.Tree":
         from rich.tree import Tree
 
-        t = Tree(f"for all files matching `{self.pattern.pattern}`")
+        t = Tree(
+            f"for all files matching `{self.pattern.pattern}`"
+            f"{self.describe_bounds()}"
+        )
         t.add(self.criterion.rich_tree())
 
         return t
@@ -321,6 +725,7 @@ class AllMatchCriterion(Criterion):
         return (
             f"Tests whether the criterion `{self.criterion.describe()}` is "
             f"true for all entries matching `{self.pattern.pattern}`"
+            f"{self.describe_bounds()}"
         )
 
 
@@ -0,0 +1,223 @@
+"""
+Profiling shows which criteria take the time when testing directories:
+
+.. code-block:: python
+
+    with Profiler() as profiler:
+        identify_project(path)
+    print(profiler.table())
+
+For each criterion the profiler records the number of tests, the results
+reused from the result memo (see
+:py:func:`dirmagic.core_criteria.result_memo`), the number of tests met,
+the time taken and the filesystem operations performed. Equal criteria
+share a record. The time and the operations include the sub-criteria. The
+profiler's :py:attr:`Profiler.operations` count all operations, e.g. the
+directory listings shared by the criteria, see :py:mod:`dirmagic.snapshot`.
+
+The criteria tested with :py:func:`dirmagic.core_criteria.evaluate` (or
+:py:func:`dirmagic.core_criteria.evaluate_matches`) are recorded: the
+criteria tested by the top level functions and the sub-criteria of the
+combined criteria. Nothing is recorded without an active profiler.
+
+The profiler is active for the current thread (or task) and the worker
+threads of the top level functions (e.g. :py:func:`dirmagic.find_projects`
+with ``workers``), the directories tested by worker processes are not
+recorded.
+"""
+
+import contextvars
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from .core_criteria import Criterion, PathSpec
+
+__all__ = [
+    "active_profiler",
+    "count_operation",
+    "CriterionProfile",
+    "OPERATIONS",
+    "Profiler",
+]
+
+OPERATIONS = ("stats", "listings", "bytes_read")
+"""
+The filesystem operations counted: the ``stat`` calls, the directory
+listings (a glob counts as one listing) and the characters of text read.
+"""
+
+_Result = typing.TypeVar("_Result")
+
+
+class CriterionProfile:
+    """
+    The records of a criterion.
+    """
+
+    def __init__(self, criterion: "Criterion"):
+        self.criterion = criterion
+        self.calls = 0
+        self.cache_hits = 0
+        self.met = 0
+        self.seconds = 0.0
+        self.operations = dict.fromkeys(OPERATIONS, 0)
+
+    def export(self) -> typing.Dict[str, typing.Any]:
+        """
+        The records as JSON compatible dictionary.
+        """
+        return {
+            "criterion": self.criterion.describe(),
+            "type": type(self.criterion).__name__,
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "met": self.met,
+            "seconds": self.seconds,
+            **self.operations,
+        }
+
+
+class Profiler:
+    """
+    Records the tests of the criteria while active as context manager.
+    """
+
+    def __init__(self) -> None:
+        self.profiles: typing.Dict[typing.Any, CriterionProfile] = {}
+        self.operations = dict.fromkeys(OPERATIONS, 0)
+        "all operations counted while active"
+        # the criteria being tested, per thread
+        self._local = threading.local()
+        # the records are updated by worker threads as well
+        self._lock = threading.Lock()
+        self._tokens: typing.List["contextvars.Token[typing.Any]"] = []
+
+    def __enter__(self) -> "Profiler":
+        self._tokens.append(_profiler.set(self))
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        _profiler.reset(self._tokens.pop())
+
+    def profile(self, criterion: "Criterion") -> CriterionProfile:
+        """
+        The record of the criterion, created on first use.
+        """
+        key: typing.Any = criterion
+        try:
+            hash(key)
+        except TypeError:
+            # attributes not hashable
+            key = id(criterion)
+        with self._lock:
+            profile = self.profiles.get(key)
+            if profile is None:
+                profile = CriterionProfile(criterion)
+                self.profiles[key] = profile
+        return profile
+
+    def _stack(self) -> typing.List[CriterionProfile]:
+        stack: typing.Optional[typing.List[CriterionProfile]]
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def call(
+        self,
+        method: typing.Callable[..., _Result],
+        criterion: "Criterion",
+        dir: "PathSpec",
+        args: typing.Tuple[typing.Any, ...],
+        kwargs: typing.Dict[str, typing.Any],
+    ) -> _Result:
+        """
+        Calls the criterion's ``test`` (or ``matches``) method and records
+        the test.
+        """
+        profile = self.profile(criterion)
+        stack = self._stack()
+        stack.append(profile)
+        start = time.perf_counter()
+        try:
+            result = method(dir, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                profile.seconds += seconds
+                profile.calls += 1
+        if result:
+            with self._lock:
+                profile.met += 1
+        return result
+
+    def hit(self, criterion: "Criterion", result: typing.Any) -> None:
+        """
+        Records a result reused.
+        """
+        profile = self.profile(criterion)
+        with self._lock:
+            profile.cache_hits += 1
+            if result:
+                profile.met += 1
+
+    def count(self, operation: str, amount: int = 1) -> None:
+        """
+        Adds the filesystem operations to the criteria being tested.
+        """
+        stack = self._stack()
+        with self._lock:
+            self.operations[operation] += amount
+            for profile in stack:
+                profile.operations[operation] += amount
+
+    def export(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        The records as JSON compatible list, the slowest criteria first.
+        """
+        return [
+            profile.export()
+            for profile in sorted(
+                self.profiles.values(),
+                key=lambda profile: profile.seconds,
+                reverse=True,
+            )
+        ]
+
+    def table(self) -> str:
+        """
+        The records as text table, the slowest criteria first.
+        """
+        columns = ("seconds", "calls", "cache_hits", "met", *OPERATIONS)
+        lines = [" ".join(f"{c:>10}" for c in columns) + " criterion"]
+        for record in self.export():
+            cells = [f"{record['seconds']:>10.6f}"]
+            cells.extend(f"{record[c]:>10}" for c in columns[1:])
+            lines.append(" ".join(cells) + f" {record['criterion']}")
+        return "\n".join(lines)
+
+
+_profiler: "contextvars.ContextVar[typing.Optional[Profiler]]" = (
+    contextvars.ContextVar("dirmagic_profiler", default=None)
+)
+
+
+def active_profiler() -> typing.Optional[Profiler]:
+    """
+    The profiler active for the current thread (or task), None if none.
+    """
+    return _profiler.get()
+
+
+def count_operation(operation: str, amount: int = 1) -> None:
+    """
+    Counts a filesystem operation (one of :py:data:`OPERATIONS`) for the
+    criteria being tested, if a profiler is active. Criteria and test
+    functions accessing the filesystem can report their operations.
+    """
+    profiler = _profiler.get()
+    if profiler is not None:
+        profiler.count(operation, amount)
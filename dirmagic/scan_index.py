@@ -0,0 +1,257 @@
+import json
+import os
+import pathlib
+import sqlite3
+import typing
+
+from .core_criteria import (
+    Criterion,
+    criterion_key,
+    evaluate_matches,
+    PathSpec,
+)
+from .generic_criteria import as_root_criterion
+from .evaluation import evaluation_context
+from .utilities import DirectoryFilter
+
+__all__ = ["ScanIndex", "default_index_path"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    sub_dirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL,
+    criterion TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    result INTEGER NOT NULL,
+    PRIMARY KEY (path, criterion)
+);
+"""
+
+
+def default_index_path() -> pathlib.Path:
+    """
+    The default location of the index file, ``dirmagic/scan_index.sqlite``
+    in ``$XDG_CACHE_HOME`` (or ``~/.cache``).
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return pathlib.Path(cache_dir, "dirmagic", "scan_index.sqlite")
+
+
+def _path_range(path: str) -> typing.Tuple[str, str]:
+    # all paths below `path` sort between `path/` and `path0`
+    return os.path.join(path, ""), path.rstrip(os.sep) + chr(ord(os.sep) + 1)
+
+
+class ScanIndex:
+    """
+    Persistent index of the directories searched by
+    :py:func:`dirmagic.find_projects`, stored in a SQLite database.
+
+    The index records each directory's modification time, its
+    sub-directories and the criteria results for the directory. When a
+    search is repeated with ``index=...``, a directory with an unchanged
+    modification time is not listed again and the criterion is not tested
+    again, its results are taken from the index. This reduces the search of
+    a mostly static tree to one ``stat`` call per directory.
+
+    .. note::
+
+        A directory's modification time changes when entries are added,
+        removed or renamed, but not when the contents of a file (or a nested
+        directory) is changed. Criteria depending on file contents or nested
+        entries, e.g. ``HasFile(".vscode/settings.json")``, may return
+        outdated results. Use :py:meth:`clear` to start over.
+
+    The results are recorded by
+    :py:func:`dirmagic.core_criteria.criterion_key`, i.e. the criteria
+    searched for must be serializable, e.g. test functions must be
+    registered with
+    :py:func:`dirmagic.core_criteria.register_test_function`.
+
+    The index can be used by one search at a time, it is not thread safe.
+
+    :param path: the index file, defaults to :py:func:`default_index_path`
+    """
+
+    def __init__(self, path: typing.Optional[PathSpec] = None):
+        if path is None:
+            path = default_index_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(os.fspath(path))
+        self.connection.executescript(_SCHEMA)
+        # modification times of the directories still to be searched
+        self.dir_mtimes: typing.Dict[str, int] = {}
+        # the keys of the criteria searched for, serialized once
+        self._keys: typing.Dict[Criterion, str] = {}
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self) -> "ScanIndex":
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        self.close()
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the index.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM directories")
+            self.connection.execute("DELETE FROM results")
+
+    def _key(self, criterion: Criterion) -> str:
+        """
+        The criterion's key, see
+        :py:func:`dirmagic.core_criteria.criterion_key`.
+        """
+        try:
+            return self._keys[criterion]
+        except KeyError:
+            key = self._keys[criterion] = criterion_key(criterion)
+        except TypeError:
+            # attributes not hashable
+            key = criterion_key(criterion)
+        return key
+
+    def finish_search(self) -> None:
+        """
+        Commits the search's updates to the index.
+        """
+        self.dir_mtimes.clear()
+        self.connection.commit()
+
+    def cached_result(
+        self, dir: PathSpec, criterion: typing.Any
+    ) -> typing.Optional[bool]:
+        """
+        The result of the criterion recorded for the directory, None if
+        there is none. The filesystem is not accessed.
+        """
+        row = self.connection.execute(
+            "SELECT result FROM results WHERE path = ? AND criterion = ?",
+            (
+                os.path.abspath(dir),
+                self._key(as_root_criterion(criterion)),
+            ),
+        ).fetchone()
+        return None if row is None else bool(row[0])
+
+    def cached_projects(
+        self, path: PathSpec, criterion: typing.Any
+    ) -> typing.List[pathlib.Path]:
+        """
+        The directories inside ``path`` recorded as matching the criterion,
+        sorted by path. The filesystem is not accessed.
+        """
+        lower, upper = _path_range(os.path.abspath(path))
+        rows = self.connection.execute(
+            "SELECT path FROM results"
+            " WHERE criterion = ? AND result AND path >= ? AND path < ?"
+            " ORDER BY path",
+            (
+                self._key(as_root_criterion(criterion)),
+                lower,
+                upper,
+            ),
+        )
+        return [pathlib.Path(path) for path, in rows]
+
+    def forget(self, path: PathSpec) -> None:
+        """
+        Removes the directory and everything below from the index.
+        """
+        dir = os.path.abspath(path)
+        lower, upper = _path_range(dir)
+        for table in ("directories", "results"):
+            self.connection.execute(
+                f"DELETE FROM {table}"
+                " WHERE path = ? OR (path >= ? AND path < ?)",
+                (dir, lower, upper),
+            )
+
+    def list_sub_dirs(self, search_dir: str) -> typing.List[str]:
+        """
+        The names of the sub-directories, from the index if the
+        directory's modification time did not change.
+        """
+        mtime_ns = self.dir_mtimes.pop(search_dir, None)
+        if mtime_ns is None:
+            mtime_ns = os.stat(search_dir).st_mtime_ns
+
+        row = self.connection.execute(
+            "SELECT mtime_ns, sub_dirs FROM directories WHERE path = ?",
+            (search_dir,),
+        ).fetchone()
+        if row is not None and row[0] == mtime_ns:
+            sub_dirs: typing.List[str] = json.loads(row[1])
+            return sub_dirs
+
+        with os.scandir(search_dir) as entries:
+            sub_dirs = [entry.name for entry in entries if entry.is_dir()]
+
+        if row is not None:
+            for removed_dir in set(json.loads(row[1])) - set(sub_dirs):
+                self.forget(os.path.join(search_dir, removed_dir))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+            (search_dir, mtime_ns, json.dumps(sub_dirs)),
+        )
+        return sub_dirs
+
+    def search_dir(
+        self,
+        search_dir: str,
+        criterion: Criterion,
+        depth: int,
+        dir_filter: DirectoryFilter,
+    ) -> typing.Tuple[typing.List[pathlib.Path], typing.List[str]]:
+        """
+        Tests the sub-directories of ``search_dir`` against the criterion,
+        using and updating the index.
+
+        Returns the directories matched and the directories to be searched
+        next.
+        """
+        key = self._key(criterion)
+
+        dirs_found = []
+        other_dirs = []
+        for sub_dir_name in self.list_sub_dirs(search_dir):
+            sub_dir = os.path.join(search_dir, sub_dir_name)
+            dir = pathlib.Path(sub_dir)
+            dir_stat = dir_filter.enter_stat(dir)
+            if dir_stat is None:
+                continue
+
+            row = self.connection.execute(
+                "SELECT mtime_ns, result FROM results"
+                " WHERE path = ? AND criterion = ?",
+                (sub_dir, key),
+            ).fetchone()
+            if row is not None and row[0] == dir_stat.st_mtime_ns:
+                result = bool(row[1])
+            else:
+                with evaluation_context():
+                    result = evaluate_matches(criterion, dir)
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (sub_dir, key, dir_stat.st_mtime_ns, result),
+                )
+
+            if result:
+                dirs_found.append(dir)
+            elif depth != 1:
+                other_dirs.append(sub_dir)
+                self.dir_mtimes[sub_dir] = dir_stat.st_mtime_ns
+
+        return dirs_found, other_dirs
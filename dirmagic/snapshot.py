@@ -0,0 +1,209 @@
+"""
+Directory snapshots let the criteria tested on the same directory share one
+directory listing.
+
+While a snapshot cache is active (see :py:func:`snapshot_cache`), the
+criteria :py:class:`dirmagic.generic_criteria.HasFile`,
+:py:class:`dirmagic.generic_criteria.HasDir`,
+:py:class:`dirmagic.generic_criteria.HasEntry`,
+:py:class:`dirmagic.generic_criteria.HasEntryGlob` and
+:py:class:`dirmagic.generic_criteria.HasFilePattern` look up the entries
+directly inside the directory tested in its snapshot. Testing a directory
+against many criteria then costs one :external+python:py:func:`os.scandir`
+call (plus a ``stat`` call for the entries which are symbolic links).
+
+The top level functions activate the cache while testing directories, the
+snapshots are dropped when the function returns (or moves on to the next
+directory searched). Changes to the filesystem made in the meantime are not
+seen. The search functions (e.g. :py:func:`dirmagic.find_projects`) search
+a directory tested before using the listing of its snapshot, i.e. each
+directory is listed once.
+"""
+
+import contextlib
+import contextvars
+import fnmatch
+import os
+import typing
+
+from .core_criteria import PathSpec
+from .profiling import count_operation
+
+__all__ = [
+    "DirectorySnapshot",
+    "entry_name",
+    "get_snapshot",
+    "snapshot_for_entry",
+    "snapshot_cache",
+]
+
+
+class DirectorySnapshot:
+    """
+    The entries of a directory, listed once.
+
+    The entry types are provided by the listing for most filesystems, the
+    ``stat`` results are fetched (once) on demand. On case-insensitive
+    filesystems, an entry is found by any case variant of its name, like
+    when accessing the filesystem directly.
+
+    Raises :external+python:py:exc:`OSError` if the directory can't be
+    listed.
+    """
+
+    def __init__(self, path: PathSpec):
+        self.path = os.fspath(path)
+        count_operation("listings")
+        with os.scandir(self.path) as entries:
+            self.entries: typing.Dict[str, "os.DirEntry[str]"] = {
+                entry.name: entry for entry in entries
+            }
+        # the names by casefolded name, built on the first lookup missed
+        self._casefolded: typing.Optional[typing.Dict[str, str]] = None
+
+    def _entry(self, name: str) -> typing.Optional["os.DirEntry[str]"]:
+        """
+        The entry of the name, also of a case variant of the name if the
+        filesystem finds the entry by it.
+        """
+        entry = self.entries.get(name)
+        if entry is not None:
+            return entry
+        if self._casefolded is None:
+            self._casefolded = {}
+            for entry_name in self.entries:
+                self._casefolded.setdefault(entry_name.casefold(), entry_name)
+        variant = self._casefolded.get(name.casefold())
+        if variant is None:
+            return None
+        # the filesystem decides whether the names are the same
+        count_operation("stats")
+        try:
+            os.lstat(os.path.join(self.path, name))
+        except OSError:
+            return None
+        return self.entries[variant]
+
+    def names(self) -> typing.KeysView[str]:
+        return self.entries.keys()
+
+    def exists(self, name: str) -> bool:
+        """
+        Same as :external+python:py:meth:`pathlib.Path.exists`, i.e. False
+        for broken symbolic links.
+        """
+        entry = self._entry(name)
+        if entry is None:
+            return False
+        if not entry.is_symlink():
+            return True
+        count_operation("stats")
+        try:
+            entry.stat()
+        except OSError:
+            return False
+        return True
+
+    def is_file(self, name: str) -> bool:
+        entry = self._entry(name)
+        return entry is not None and entry.is_file()
+
+    def is_dir(self, name: str) -> bool:
+        entry = self._entry(name)
+        return entry is not None and entry.is_dir()
+
+    def stat(self, name: str) -> os.stat_result:
+        """
+        The entry's ``stat`` result (following symbolic links), raises
+        :external+python:py:exc:`FileNotFoundError` for unknown entries.
+        """
+        entry = self._entry(name)
+        if entry is None:
+            raise FileNotFoundError(os.path.join(self.path, name))
+        count_operation("stats")
+        return entry.stat()
+
+    def glob(self, pattern: str) -> typing.Iterator[str]:
+        """
+        The names matching the glob pattern (without ``/``).
+        """
+        return (
+            name for name in self.entries if fnmatch.fnmatch(name, pattern)
+        )
+
+
+_SnapshotCache = typing.Dict[str, typing.Optional[DirectorySnapshot]]
+
+_snapshots: "contextvars.ContextVar[typing.Optional[_SnapshotCache]]" = (
+    contextvars.ContextVar("dirmagic_snapshots", default=None)
+)
+
+
+@contextlib.contextmanager
+def snapshot_cache() -> typing.Iterator[None]:
+    """
+    Activates the snapshot cache for the current thread (or task). The
+    snapshots are dropped when leaving the context, a cache already active
+    is kept.
+
+    .. code-block:: python
+
+        with snapshot_cache():
+            results = [t.test(dir) for t in many_project_types]
+    """
+    if _snapshots.get() is not None:
+        yield
+        return
+    token = _snapshots.set({})
+    try:
+        yield
+    finally:
+        _snapshots.reset(token)
+
+
+def get_snapshot(dir: PathSpec) -> typing.Optional[DirectorySnapshot]:
+    """
+    The snapshot of the directory if the cache is active, None if not or if
+    the directory can't be listed.
+    """
+    snapshots = _snapshots.get()
+    if snapshots is None:
+        return None
+    path = os.fspath(dir)
+    if path not in snapshots:
+        try:
+            snapshots[path] = DirectorySnapshot(path)
+        except OSError:
+            # the criteria access the filesystem directly
+            snapshots[path] = None
+    return snapshots[path]
+
+
+def entry_name(name: PathSpec) -> typing.Optional[str]:
+    """
+    Returns the name if it refers to an entry directly inside a directory
+    (i.e. it can be looked up in a snapshot), None otherwise.
+    """
+    name = os.fspath(name)
+    if (
+        not name
+        or name in (os.curdir, os.pardir)
+        or os.sep in name
+        or (os.altsep is not None and os.altsep in name)
+    ):
+        return None
+    return name
+
+
+def snapshot_for_entry(
+    dir: PathSpec, name: PathSpec
+) -> typing.Tuple[typing.Optional[DirectorySnapshot], str]:
+    """
+    Returns the directory's snapshot (if available) and the entry's name as
+    string. The snapshot is None if the entry is not directly inside the
+    directory.
+    """
+    snapshot_name = entry_name(name)
+    if snapshot_name is None:
+        return None, os.fspath(name)
+    return get_snapshot(dir), snapshot_name
@@ -0,0 +1,166 @@
+"""
+Criteria can be defined declaratively, e.g. in configuration files, by
+mapping the entries inside the directory tested to tests:
+
+.. code-block:: python
+
+    criterion = load_criterion(
+        {
+            "a/b.xml": "not_empty",
+            "src/*.c": "is_c_code",
+            ".git": True,
+            "build": False,
+        }
+    )
+
+* the key is the path of an entry, relative to the directory tested, or a
+  glob pattern (matched against the relative paths like
+  :external+python:py:func:`fnmatch.fnmatch`, i.e. ``*`` matches ``/``
+  as well),
+* the value is the name of a test function called with the entry's path
+  (see :py:func:`dirmagic.core_criteria.register_test_function`) or the
+  registered test function itself, ``True``
+  if the entry must exist or ``False`` if the entry must not exist. For
+  glob patterns, one matching entry passing the test is enough, the search
+  starts in the directory before the first wildcard.
+
+All items must be met. A dictionary with a ``type`` item is read as
+criterion created with :py:meth:`dirmagic.core_criteria.Criterion.to_dict`.
+
+The specification is compiled and optimized (see
+:py:meth:`dirmagic.core_criteria.Criterion.optimize`) once, loading the
+same specification again returns the criterion compiled before.
+"""
+
+import hashlib
+import json
+import typing
+
+from .core_criteria import (
+    AllCriteria,
+    Criterion,
+    from_dict,
+    registered_name,
+)
+from .generic_criteria import HasEntry
+from .pattern_criteria import AnyMatchCriterion, FileTest, translate
+
+__all__ = ["clear_cache", "compile_spec", "load_criterion"]
+
+Spec = typing.Union[str, typing.Dict[str, typing.Any]]
+"""
+The specification as dictionary or JSON text.
+"""
+
+_compiled_specs: typing.Dict[str, Criterion] = {}
+
+
+def _entry_criterion(path: str, test: typing.Any) -> Criterion:
+    is_glob = any(c in path for c in "*?[")
+    if isinstance(test, bool):
+        entry_criterion: Criterion
+        if is_glob:
+            # matched like the globs with tests, `*` matching `/` as well
+            entry_criterion = AnyMatchCriterion(
+                f"^{translate(path)}",
+                HasEntry("{0[0]}"),
+                subdir=_literal_prefix(path),
+            )
+        else:
+            entry_criterion = HasEntry(path)
+        return entry_criterion if test else ~entry_criterion
+    if not isinstance(test, str):
+        raise ValueError(
+            f"expected a test function name or a boolean for `{path}`,"
+            f" got {test!r}"
+        )
+    if is_glob:
+        return AnyMatchCriterion(
+            f"^{translate(path)}",
+            FileTest("{0[0]}", test),
+            subdir=_literal_prefix(path),
+        )
+    return FileTest(path, test)
+
+
+def _literal_prefix(pattern: str) -> typing.Optional[str]:
+    """
+    The directories of the glob pattern before the first wildcard, where the
+    search for matches starts. None if the pattern starts with one.
+    """
+    parts = pattern.split("/")[:-1]
+    prefix = []
+    for part in parts:
+        if any(c in part for c in "*?["):
+            break
+        prefix.append(part)
+    return "/".join(prefix) or None
+
+
+def _spec_dict(spec: Spec) -> typing.Dict[str, typing.Any]:
+    """
+    The specification as dictionary, with the registered test functions
+    replaced by their names.
+    """
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if not isinstance(spec, dict):
+        raise ValueError(f"expected a dictionary, got {type(spec)}")
+    if "type" in spec:
+        return spec
+    spec_dict = {}
+    for path, test in spec.items():
+        if callable(test):
+            name = registered_name(test)
+            if name is None:
+                raise ValueError(
+                    f"the test function for `{path}` is not registered"
+                )
+            test = name
+        spec_dict[path] = test
+    return spec_dict
+
+
+def compile_spec(spec: Spec) -> Criterion:
+    """
+    Compiles the specification into an optimized criterion, without using
+    the compiled criteria of :py:func:`load_criterion`.
+
+    Raises :external+python:py:exc:`ValueError` for invalid specifications
+    and :external+python:py:exc:`KeyError` for test functions not
+    registered.
+    """
+    spec = _spec_dict(spec)
+    if "type" in spec:
+        return from_dict(spec).optimize()
+    criteria = [_entry_criterion(path, test) for path, test in spec.items()]
+    return AllCriteria(*criteria).optimize()
+
+
+def load_criterion(spec: Spec) -> Criterion:
+    """
+    The criterion of the specification, compiled once for each content.
+
+    Raises :external+python:py:exc:`ValueError` for invalid specifications
+    and :external+python:py:exc:`KeyError` for test functions not
+    registered.
+    """
+    spec = _spec_dict(spec)
+    try:
+        text = json.dumps(spec, sort_keys=True, separators=(",", ":"))
+    except TypeError as error:
+        raise ValueError(f"invalid specification: {error}") from None
+    content_hash = hashlib.sha256(text.encode()).hexdigest()
+    criterion = _compiled_specs.get(content_hash)
+    if criterion is None:
+        criterion = compile_spec(spec)
+        _compiled_specs[content_hash] = criterion
+    return criterion
+
+
+def clear_cache() -> None:
+    """
+    Forgets the criteria compiled, e.g. after registering test functions
+    under names used before.
+    """
+    _compiled_specs.clear()
@@ -1,5 +1,8 @@
+import fnmatch
 import os
 import pathlib
+import re
+import threading
 import typing
 
 from .core_criteria import PathSpec
@@ -45,3 +48,263 @@ def list_search_dirs(
     start_path = get_start_path(path, resolve_path)
     # slicing pathlib.Path.parents is supportered since python-3.10 only
     return [start_path, *list(start_path.parents)[slice(limit_parents)]]
+
+
+FOLLOW_SYMLINKS_POLICIES = ("never", "within-root", "always")
+"""
+Policies for searching symbolically linked directories:
+
+* ``never``: linked directories are skipped,
+* ``within-root``: only links pointing into the search's start directory are
+  followed,
+* ``always``: all links are followed.
+"""
+
+
+class PruneList:
+    """
+    Directories excluded from a search, the search does not enter them.
+
+    :param names: exact directory names, like ``node_modules``
+    :param globs: glob patterns (see :external+python:py:mod:`fnmatch`),
+        matched against the directory name. Patterns containing a ``/`` are
+        matched against the trailing components of the path relative to the
+        search's start directory, like ``.git/objects``.
+    :param patterns: regular expressions searched (with
+        :external+python:py:func:`re.search`) in the path relative to the
+        search's start directory.
+
+    The names and patterns are compiled once, checking a directory needs
+    no filesystem access.
+
+    Prune lists can be combined with ``|``.
+    """
+
+    def __init__(
+        self,
+        names: typing.Iterable[str] = (),
+        globs: typing.Iterable[str] = (),
+        patterns: typing.Iterable[str] = (),
+    ):
+        self.names = frozenset(names)
+        self.globs = tuple(globs)
+        self.patterns = tuple(patterns)
+
+        name_regexps = [
+            fnmatch.translate(glob) for glob in self.globs if "/" not in glob
+        ]
+        path_regexps = [
+            f"(?:.*/)?{fnmatch.translate(glob)}"
+            for glob in self.globs
+            if "/" in glob
+        ]
+        path_regexps.extend(f".*?(?:{pattern})" for pattern in self.patterns)
+        self.name_pattern = (
+            re.compile("|".join(name_regexps)) if name_regexps else None
+        )
+        self.path_pattern = (
+            re.compile("|".join(path_regexps)) if path_regexps else None
+        )
+
+    def excludes(self, name: str, relative_path: str) -> bool:
+        """
+        Returns True if the directory is pruned.
+
+        :param name: the directory's name
+        :param relative_path: the directory's path relative to the search's
+            start directory (using ``/`` as separator)
+        """
+        return (
+            name in self.names
+            or (
+                self.name_pattern is not None
+                and self.name_pattern.match(name) is not None
+            )
+            or (
+                self.path_pattern is not None
+                and self.path_pattern.match(relative_path) is not None
+            )
+        )
+
+    def __or__(self, other: "PruneList") -> "PruneList":
+        return PruneList(
+            self.names | other.names,
+            self.globs + other.globs,
+            self.patterns + other.patterns,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"PruneList(names={sorted(self.names)}, globs={list(self.globs)},"
+            f" patterns={list(self.patterns)})"
+        )
+
+
+DEFAULT_PRUNE_LIST = PruneList(
+    names=[
+        # version control
+        ".git",
+        ".hg",
+        ".svn",
+        # python
+        "__pycache__",
+        ".eggs",
+        ".mypy_cache",
+        ".nox",
+        ".pytest_cache",
+        ".ruff_cache",
+        ".tox",
+        ".venv",
+        ".ipynb_checkpoints",
+        # javascript
+        "node_modules",
+        # R
+        ".Rproj.user",
+    ],
+    globs=["*.egg-info"],
+)
+"""
+Vendored, generated and tool specific directories, which do not contain
+projects. Use ``prune=True`` to exclude them from a search.
+
+Extend the list with ``DEFAULT_PRUNE_LIST | PruneList(names=["build"])``.
+"""
+
+
+def as_prune_list(prune: typing.Any) -> typing.Optional[PruneList]:
+    """
+    Converts the ``prune`` argument of the search functions:
+
+    * None or False: nothing is pruned
+    * True: :py:data:`DEFAULT_PRUNE_LIST`
+    * a :py:class:`PruneList`
+    * an iterable of strings: names, or glob patterns if they contain any
+      of ``*?[``
+    """
+    if prune is None or prune is False:
+        return None
+    if prune is True:
+        return DEFAULT_PRUNE_LIST
+    if isinstance(prune, PruneList):
+        return prune
+    if isinstance(prune, str):
+        prune = [prune]
+    try:
+        entries = list(prune)
+    except TypeError:
+        raise ValueError(f"cannot convert {type(prune)} to a prune list")
+    globs = [e for e in entries if any(c in e for c in "*?[")]
+    names = [e for e in entries if e not in globs]
+    return PruneList(names=names, globs=globs)
+
+
+class DirectoryFilter:
+    """
+    Decides which directories a search enters.
+
+    * Directories excluded by the prune list are skipped without any
+      filesystem access.
+    * Symbolic links are followed according to ``follow_symlinks``.
+    * Each directory is entered at most once. The directories are identified
+      by the device and inode number, i.e. cyclic symbolic links and
+      directories mounted at several places (e.g. bind mounts) are visited
+      once. This costs one ``stat`` call per directory.
+
+    :param root: the start directory of the search
+    :param follow_symlinks: one of :py:data:`FOLLOW_SYMLINKS_POLICIES`
+    :param prune: directories to skip, see :py:func:`as_prune_list`
+    """
+
+    def __init__(
+        self,
+        root: PathSpec,
+        follow_symlinks: str = "always",
+        prune: typing.Any = None,
+    ):
+        if follow_symlinks not in FOLLOW_SYMLINKS_POLICIES:
+            raise ValueError(
+                f"follow_symlinks must be one of {FOLLOW_SYMLINKS_POLICIES},"
+                f" not `{follow_symlinks}`"
+            )
+        self.follow_symlinks = follow_symlinks
+        self.prune_list = as_prune_list(prune)
+        self.root_prefix = os.path.join(os.fspath(root), "")
+        self.real_root = os.path.realpath(root)
+        self.visited: typing.Set[typing.Tuple[int, int]] = set()
+        # searches can run on several threads
+        self.lock = threading.Lock()
+        root_stat = os.stat(self.real_root)
+        self.visited.add((root_stat.st_dev, root_stat.st_ino))
+
+    def is_pruned(
+        self, dir: typing.Union["os.DirEntry[str]", pathlib.Path]
+    ) -> bool:
+        """
+        Returns True if the directory is excluded by the prune list.
+        """
+        if self.prune_list is None:
+            return False
+        path = os.fspath(dir)
+        if path.startswith(self.root_prefix):
+            path = path.replace(self.root_prefix, "", 1)
+        if os.sep != "/":
+            path = path.replace(os.sep, "/")
+        return self.prune_list.excludes(dir.name, path)
+
+    def is_followed_link(self, path: PathSpec) -> bool:
+        """
+        Applies the ``follow_symlinks`` policy to a symbolic link.
+        """
+        if self.follow_symlinks == "always":
+            return True
+        if self.follow_symlinks == "never":
+            return False
+        target = os.path.realpath(path)
+        return target == self.real_root or target.startswith(
+            os.path.join(self.real_root, "")
+        )
+
+    def enter(
+        self, dir: typing.Union["os.DirEntry[str]", pathlib.Path]
+    ) -> bool:
+        """
+        Returns True if the directory should be entered, i.e. it is not
+        pruned, not a symbolic link excluded by the policy and it was not
+        visited before. Records the directory as visited.
+        """
+        return self.enter_stat(dir) is not None
+
+    def followed_stat(
+        self, dir: typing.Union["os.DirEntry[str]", pathlib.Path]
+    ) -> typing.Optional[os.stat_result]:
+        """
+        Returns the directory's ``stat`` result if it is not pruned and not a
+        symbolic link excluded by the policy, None otherwise. Unlike
+        :py:meth:`enter_stat`, the directories visited are not checked or
+        recorded.
+        """
+        if self.is_pruned(dir):
+            return None
+        if dir.is_symlink() and not self.is_followed_link(os.fspath(dir)):
+            return None
+        try:
+            return dir.stat()
+        except OSError:
+            return None
+
+    def enter_stat(
+        self, dir: typing.Union["os.DirEntry[str]", pathlib.Path]
+    ) -> typing.Optional[os.stat_result]:
+        """
+        Same as :py:meth:`enter`, but returns the directory's ``stat`` result
+        if it is entered, None otherwise.
+        """
+        dir_stat = self.followed_stat(dir)
+        if dir_stat is None:
+            return None
+        dir_id = (dir_stat.st_dev, dir_stat.st_ino)
+        with self.lock:
+            if dir_id in self.visited:
+                return None
+            self.visited.add(dir_id)
+        return dir_stat
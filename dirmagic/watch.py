@@ -0,0 +1,383 @@
+"""
+Keep track of the projects in a directory tree using Linux's inotify
+interface (accessed via :external+python:py:mod:`ctypes`).
+"""
+
+import ctypes
+import ctypes.util
+import os
+import pathlib
+import select
+import struct
+import sys
+import typing
+
+from .core_criteria import evaluate_matches, PathSpec
+from .generic_criteria import as_root_criterion
+from .evaluation import evaluation_context
+from .utilities import as_prune_list, get_start_path
+
+__all__ = ["ProjectEvent", "ProjectWatcher", "watch_projects"]
+
+# constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class ProjectEvent(typing.NamedTuple):
+    """
+    A directory started (``added``) or stopped (``removed``) matching.
+    """
+
+    kind: str
+    "``added`` or ``removed``"
+
+    path: pathlib.Path
+    "the project directory"
+
+
+class _Inotify:
+    """
+    Minimal wrapper of the inotify system calls.
+    """
+
+    def __init__(self) -> None:
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or None, use_errno=True
+        )
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.raise_error("inotify_init1")
+
+    @staticmethod
+    def raise_error(function: str, path: str = "") -> None:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{function}: {os.strerror(errno)}", path)
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd: int = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(path), ctypes.c_uint32(mask)
+        )
+        if wd < 0:
+            self.raise_error("inotify_add_watch", path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        # fails if the directory is gone already
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(
+        self, timeout: typing.Optional[float]
+    ) -> typing.List[typing.Tuple[int, int, str]]:
+        """
+        Waits up to ``timeout`` seconds for events, returns the events
+        ``(watch descriptor, mask, name)`` available.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        events = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, name_length = _EVENT_HEADER.unpack_from(
+                    buffer, offset
+                )
+                name_start = offset + _EVENT_HEADER.size
+                offset = name_start + name_length
+                name = buffer[name_start:offset].rstrip(b"\0")
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ProjectWatcher:
+    """
+    Finds the projects like :py:func:`dirmagic.find_projects` and keeps the
+    set of projects up to date using inotify.
+
+    Each directory searched or tested is watched. When an entry in a
+    directory changes, only this directory is tested again. New directories
+    are searched, the projects in removed directories are dropped.
+
+    .. note::
+
+        Changes to nested entries, like ``.vscode/settings.json``, are not
+        noticed. Symbolically linked directories are not followed. The number
+        of watches is limited by ``/proc/sys/fs/inotify/max_user_watches``.
+
+    Only available on Linux.
+
+    :param path: the directory to search
+    :param criterion: the criterion to test the directories against
+    :param maxdepth: the maximal search depth, unlimited if negative
+    :param prune: directories not searched, see
+        :py:func:`dirmagic.utilities.as_prune_list`
+    """
+
+    def __init__(
+        self,
+        path: PathSpec,
+        criterion: typing.Any,
+        maxdepth: int = -1,
+        prune: typing.Any = None,
+    ):
+        self.criterion = as_root_criterion(criterion)
+        self.root = os.fspath(get_start_path(path))
+        self.maxdepth = maxdepth
+        self.prune_list = as_prune_list(prune)
+        self.inotify = _Inotify()
+        # watched directories and their watch descriptors
+        self.watched: typing.Dict[int, str] = {}
+        self.watch_ids: typing.Dict[str, int] = {}
+        # the directories tested and the search depth they were found with
+        self.dirs: typing.Dict[str, int] = {}
+        self.projects: typing.Dict[str, None] = {}
+        self.initial_events = self.start()
+
+    def start(self) -> typing.List[ProjectEvent]:
+        """
+        Watches the start directory and searches it.
+        """
+        self.watch(self.root)
+        if self.maxdepth == 0:
+            return []
+        return self.search(self.root, self.maxdepth)
+
+    def close(self) -> None:
+        self.inotify.close()
+
+    def __enter__(self) -> "ProjectWatcher":
+        return self
+
+    def __exit__(self, *exc_info: typing.Any) -> None:
+        self.close()
+
+    def current_projects(self) -> typing.List[pathlib.Path]:
+        """
+        The projects found, in the order they were found.
+        """
+        return [pathlib.Path(project) for project in self.projects]
+
+    def watch(self, dir: str) -> None:
+        try:
+            wd = self.inotify.add_watch(dir, _WATCH_MASK)
+        except OSError:
+            # gone already or not a directory anymore
+            return
+        self.watched[wd] = dir
+        self.watch_ids[dir] = wd
+
+    def is_searched(self, dir: str) -> bool:
+        if dir == self.root:
+            return self.maxdepth != 0
+        return dir not in self.projects and self.dirs.get(dir, 1) != 1
+
+    def test(self, dir: str) -> bool:
+        with evaluation_context():
+            return evaluate_matches(self.criterion, pathlib.Path(dir))
+
+    def add_dir(self, dir: str, depth: int) -> typing.List[ProjectEvent]:
+        """
+        Watches and tests a new directory, searches it if not matched.
+        """
+        self.dirs[dir] = depth
+        self.watch(dir)
+        if self.test(dir):
+            self.projects[dir] = None
+            return [ProjectEvent("added", pathlib.Path(dir))]
+        if depth != 1:
+            return self.search(dir, depth - 1)
+        return []
+
+    def search(self, dir: str, depth: int) -> typing.List[ProjectEvent]:
+        """
+        Adds all sub-directories.
+        """
+        try:
+            with os.scandir(dir) as entries:
+                sub_dirs = [
+                    entry.path
+                    for entry in entries
+                    if entry.is_dir(follow_symlinks=False)
+                    and not (
+                        self.prune_list is not None
+                        and self.prune_list.excludes(
+                            entry.name,
+                            os.path.relpath(entry.path, self.root),
+                        )
+                    )
+                ]
+        except OSError:
+            return []
+
+        events = []
+        for sub_dir in sub_dirs:
+            if sub_dir not in self.dirs:
+                events.extend(self.add_dir(sub_dir, depth))
+        return events
+
+    def drop_dirs(
+        self, dir: str, include_dir: bool = True
+    ) -> typing.List[ProjectEvent]:
+        """
+        Stops watching the directories inside ``dir``, the projects found in
+        there are removed.
+        """
+        prefix = os.path.join(dir, "")
+        dropped = [
+            d
+            for d in self.dirs
+            if d.startswith(prefix) or (include_dir and d == dir)
+        ]
+        events = []
+        for d in dropped:
+            del self.dirs[d]
+            wd = self.watch_ids.pop(d, None)
+            if wd is not None:
+                self.inotify.rm_watch(wd)
+                self.watched.pop(wd, None)
+            if d in self.projects:
+                del self.projects[d]
+                events.append(ProjectEvent("removed", pathlib.Path(d)))
+        return events
+
+    def update_dir(self, dir: str) -> typing.List[ProjectEvent]:
+        """
+        Tests the directory again.
+        """
+        is_match = self.test(dir)
+        if is_match == (dir in self.projects):
+            return []
+        if is_match:
+            # projects are not searched for sub-projects
+            events = self.drop_dirs(dir, include_dir=False)
+            self.projects[dir] = None
+            events.append(ProjectEvent("added", pathlib.Path(dir)))
+            return events
+        del self.projects[dir]
+        events = [ProjectEvent("removed", pathlib.Path(dir))]
+        if self.dirs[dir] != 1:
+            events.extend(self.search(dir, self.dirs[dir] - 1))
+        return events
+
+    def handle_event(
+        self, wd: int, mask: int, name: str
+    ) -> typing.List[ProjectEvent]:
+        if mask & IN_Q_OVERFLOW:
+            return self.rescan()
+        dir = self.watched.get(wd)
+        if dir is None:
+            return []
+        if mask & IN_IGNORED:
+            del self.watched[wd]
+            if self.watch_ids.get(dir) == wd:
+                del self.watch_ids[dir]
+            return []
+
+        events = []
+        entry = os.path.join(dir, name)
+        if mask & IN_ISDIR and mask & (IN_DELETE | IN_MOVED_FROM):
+            events.extend(self.drop_dirs(entry))
+        if dir in self.dirs:
+            events.extend(self.update_dir(dir))
+        if (
+            mask & IN_ISDIR
+            and mask & (IN_CREATE | IN_MOVED_TO)
+            and entry not in self.dirs
+            and self.is_searched(dir)
+        ):
+            depth = self.maxdepth if dir == self.root else self.dirs[dir] - 1
+            # the new directory is searched like any other
+            events.extend(self.search(dir, depth))
+        return events
+
+    def rescan(self) -> typing.List[ProjectEvent]:
+        """
+        Searches the whole tree again, e.g. after events were lost.
+        """
+        old_projects = list(self.projects)
+        for wd in self.watched:
+            self.inotify.rm_watch(wd)
+        self.watched.clear()
+        self.watch_ids.clear()
+        self.dirs.clear()
+        self.projects.clear()
+        self.start()
+        return [
+            ProjectEvent("removed", pathlib.Path(project))
+            for project in old_projects
+            if project not in self.projects
+        ] + [
+            ProjectEvent("added", pathlib.Path(project))
+            for project in self.projects
+            if project not in old_projects
+        ]
+
+    def poll(
+        self, timeout: typing.Optional[float] = None
+    ) -> typing.List[ProjectEvent]:
+        """
+        Waits up to ``timeout`` seconds (forever if None) for changes and
+        returns the resulting project events, which can be empty.
+        """
+        events = []
+        for wd, mask, name in self.inotify.read_events(timeout):
+            events.extend(self.handle_event(wd, mask, name))
+        return events
+
+
+def watch_projects(
+    path: PathSpec,
+    criterion: typing.Any,
+    maxdepth: int = -1,
+    prune: typing.Any = None,
+) -> typing.Generator[ProjectEvent, None, None]:
+    """
+    Yields an ``added`` event for each project found initially, then the
+    events for projects added or removed as the tree changes. Runs until
+    the generator is closed.
+
+    See :py:class:`ProjectWatcher` for the parameters and limitations.
+
+    .. code-block:: python
+
+        for event in watch_projects("~/Code", is_python_project):
+            print(event.kind, event.path)
+    """
+    with ProjectWatcher(path, criterion, maxdepth, prune) as watcher:
+        yield from watcher.initial_events
+        while True:
+            yield from watcher.poll()
@@ -0,0 +1,122 @@
+import json
+import pathlib
+import time
+
+import pytest
+
+from dirmagic.adaptive import (
+    disable_adaptive_order,
+    enable_adaptive_order,
+    export_statistics,
+    import_statistics,
+)
+from dirmagic.core_criteria import (
+    AllCriteria,
+    AnyCriteria,
+    CriterionFromTestFun,
+    criterion_key,
+    evaluate,
+    PathSpec,
+    ProjectType,
+    register_test_function,
+)
+from dirmagic.evaluation import evaluation_context
+from dirmagic.generic_criteria import HasDir, HasFile
+from dirmagic.project_types import is_vcs_root
+
+
+@register_test_function
+def slow_rare(dir: PathSpec) -> bool:
+    time.sleep(0.002)
+    return False
+
+
+@register_test_function
+def fast_common(dir: PathSpec) -> bool:
+    return True
+
+
+def make_criterion() -> AnyCriteria:
+    return AnyCriteria(
+        CriterionFromTestFun(slow_rare),
+        CriterionFromTestFun(fast_common),
+    )
+
+
+def test_adaptive_order(tmp_path: pathlib.Path) -> None:
+    declared = make_criterion()
+    criterion = enable_adaptive_order(declared, reorder_every=5)
+    # a copy, the criterion passed in is left alone
+    assert isinstance(criterion, AnyCriteria) and criterion == declared
+    assert declared.statistics is None
+    statistics = criterion.statistics
+    assert statistics is not None
+
+    first_result = criterion.test(tmp_path)
+    assert len(first_result.sub_results) == 2
+    for _ in range(10):
+        assert criterion.test(tmp_path)
+    assert statistics.order == (1, 0)
+    # the slow criterion is not tested anymore
+    assert len(criterion.test(tmp_path).sub_results) == 1
+    # the declared order is kept
+    assert criterion.criteria[0].describe() == "Test Function `slow_rare`"
+
+    exported = json.loads(json.dumps(export_statistics(criterion)))
+    assert list(exported) == [criterion_key(make_criterion())]
+
+    restored = enable_adaptive_order(make_criterion())
+    import_statistics(restored, exported)
+    assert isinstance(restored, AnyCriteria)
+    assert restored.statistics is not None
+    assert restored.statistics.order == (1, 0)
+
+    disable_adaptive_order(criterion)
+    assert criterion.statistics is None
+    assert len(criterion.test(tmp_path).sub_results) == 2
+
+    # statistics of other criteria are ignored, unless the keys are equal
+    other = enable_adaptive_order(
+        AnyCriteria(HasDir("a"), HasDir("b"), HasDir("c"))
+    )
+    import_statistics(other, exported)
+    (other_key,) = export_statistics(other)
+    (exported_statistics,) = exported.values()
+    with pytest.raises(ValueError):
+        import_statistics(other, {other_key: exported_statistics})
+
+
+def test_adaptive_order_all_criteria(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a").touch()
+    criterion = enable_adaptive_order(
+        AllCriteria(HasFile("a"), HasDir("b") | HasDir("c")), reorder_every=11
+    )
+    assert isinstance(criterion, AllCriteria)
+    nested = criterion.criteria[1]
+    assert isinstance(nested, AnyCriteria) and nested.statistics is not None
+
+    for _ in range(12):
+        assert not criterion.test(tmp_path)
+    assert criterion.statistics is not None
+    # `b or c` ends the evaluation, `a` does not
+    assert criterion.statistics.order == (1, 0)
+
+
+def test_adaptive_order_copy(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".git").mkdir()
+    criterion = enable_adaptive_order(is_vcs_root, reorder_every=1)
+    assert isinstance(criterion, ProjectType) and criterion == is_vcs_root
+    assert export_statistics(criterion)
+    # the predefined project type is left alone
+    assert export_statistics(is_vcs_root) == {}
+
+    # the results reused from the memo are not recorded
+    node = criterion.criterion
+    assert isinstance(node, AnyCriteria)
+    with evaluation_context():
+        assert evaluate(node.criteria[0], tmp_path)
+        assert evaluate(criterion, tmp_path)
+    assert export_statistics(criterion)[criterion_key(node)]["tests"] == [0, 0]
+    with evaluation_context():
+        assert evaluate(criterion, tmp_path)
+    assert export_statistics(criterion)[criterion_key(node)]["tests"] == [1, 0]
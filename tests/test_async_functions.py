@@ -0,0 +1,127 @@
+import asyncio
+import concurrent.futures
+import pathlib
+import time
+import typing
+
+import pytest
+
+from dirmagic import (
+    async_find_projects,
+    async_find_root,
+    async_identify_project,
+    async_iter_projects,
+    find_projects,
+)
+from dirmagic.core_criteria import CriterionFromTestFun, PathSpec
+from dirmagic.generic_criteria import HasEntry
+from dirmagic.profiling import Profiler
+from dirmagic.project_types import is_vcs_root
+
+
+@pytest.fixture
+def example_projects(tmp_path: pathlib.Path) -> pathlib.Path:
+    for i in range(3):
+        (tmp_path / f"d{i}" / "a" / ".git").mkdir(parents=True)
+        (tmp_path / f"d{i}" / "b" / "c" / ".git").mkdir(parents=True)
+    (tmp_path / "d1" / ".git").mkdir()
+    return tmp_path
+
+
+def test_async_find_projects(example_projects: pathlib.Path) -> None:
+    expected = find_projects(example_projects, is_vcs_root, maxdepth=-1)
+    assert len(expected) == 5
+
+    for max_concurrency in (1, 4):
+        assert (
+            asyncio.run(
+                async_find_projects(
+                    example_projects,
+                    is_vcs_root,
+                    maxdepth=-1,
+                    max_concurrency=max_concurrency,
+                )
+            )
+            == expected
+        )
+
+    async def first_two() -> typing.List[pathlib.Path]:
+        found = []
+        async for dir in async_iter_projects(
+            example_projects, is_vcs_root, maxdepth=-1
+        ):
+            found.append(dir)
+            if len(found) == 2:
+                break
+        return found
+
+    assert asyncio.run(first_two()) == expected[:2]
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        assert asyncio.run(
+            async_find_projects(
+                example_projects,
+                is_vcs_root,
+                maxdepth=2,
+                executor=executor,
+            )
+        ) == find_projects(example_projects, is_vcs_root, maxdepth=2)
+
+
+def test_async_find_projects_profiler(example_projects: pathlib.Path) -> None:
+    # the executor's threads record in the caller's profiler
+    with Profiler() as profiler:
+        asyncio.run(
+            async_find_projects(example_projects, is_vcs_root, maxdepth=-1)
+        )
+    assert profiler.profiles[is_vcs_root].met == 5
+
+
+def test_async_find_projects_timeout(example_projects: pathlib.Path) -> None:
+    def slow_test(dir: PathSpec) -> bool:
+        time.sleep(0.05)
+        return False
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(
+            async_find_projects(
+                example_projects,
+                CriterionFromTestFun(slow_test),
+                maxdepth=-1,
+                max_concurrency=1,
+                timeout=0.1,
+            )
+        )
+
+
+def test_async_find_root(example_projects: pathlib.Path) -> None:
+    start = example_projects / "d0" / "b" / "c"
+    (start / "src").mkdir()
+
+    assert asyncio.run(async_find_root(start / "src")) == start
+    assert asyncio.run(
+        async_find_root(start / "src", is_vcs_root, return_reason=True)
+    ) == (start, "version control, repository")
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(
+            async_find_root(start, HasEntry("not_there"), limit_parents=2)
+        )
+
+
+def test_async_identify_project(example_projects: pathlib.Path) -> None:
+    with Profiler() as profiler:
+        types = asyncio.run(async_identify_project(example_projects / "d1"))
+    assert types == [
+        ("version control", "git"),
+        ("version control", "repository"),
+    ]
+    # the candidate types are tested using the directory's snapshot
+    assert profiler.operations["listings"] == 1
+    assert profiler.operations["stats"] == 0
+    assert asyncio.run(
+        async_identify_project(
+            example_projects / "d1", [is_vcs_root], max_concurrency=1
+        )
+    ) == [("version control", "repository")]
+    assert asyncio.run(async_identify_project(example_projects)) == []
@@ -1,6 +1,8 @@
 # root criterion features under test
 
+import json
 import pathlib
+import typing
 
 import pytest
 
@@ -9,11 +11,32 @@ from dirmagic import find_root
 from dirmagic.core_criteria import (
     AllCriteria,
     AnyCriteria,
+    Cost,
+    Criterion,
     CriterionFromTestFun,
+    CriterionResult,
+    criterion_key,
+    evaluate,
+    evaluate_matches,
     PathSpec,
+    register_test_function,
+    result_memo,
+)
+from dirmagic.generic_criteria import (
+    HasBasename,
+    HasDir,
+    HasEntry,
+    HasEntryGlob,
+    HasFile,
+)
+from dirmagic.pattern_criteria import AllMatchCriterion, AnyMatchCriterion
+from dirmagic.utilities import (
+    DEFAULT_PRUNE_LIST,
+    PruneList,
+    as_prune_list,
+    get_start_path,
+    list_search_dirs,
 )
-from dirmagic.generic_criteria import HasEntry
-from dirmagic.utilities import get_start_path, list_search_dirs
 
 
 def test_get_start_path(tmp_path: pathlib.Path) -> None:
@@ -61,6 +84,33 @@ def test_list_search_dirs(tmp_path: pathlib.Path) -> None:
     assert search_dirs == [nested_dirs]  # only current dir
 
 
+def test_prune_list() -> None:
+    prune_list = PruneList(
+        names=["node_modules"], globs=["*.egg-info", ".git/objects"]
+    )
+    assert prune_list.excludes("node_modules", "a/node_modules")
+    assert prune_list.excludes("x.egg-info", "x.egg-info")
+    assert prune_list.excludes("objects", "a/b/.git/objects")
+    assert prune_list.excludes("objects", ".git/objects")
+    assert not prune_list.excludes("objects", "a/objects")
+    assert not prune_list.excludes("node_modules2", "node_modules2")
+
+    prune_list = PruneList(patterns=[r"^tmp\d+$", "cache/"])
+    assert prune_list.excludes("tmp12", "tmp12")
+    assert not prune_list.excludes("tmp12", "a/tmp12")
+    assert prune_list.excludes("x", "a/cache/x")
+
+    assert as_prune_list(None) is None
+    assert as_prune_list(True) is DEFAULT_PRUNE_LIST
+    converted = as_prune_list(["build", "*.tmp"])
+    assert converted is not None
+    assert converted.names == {"build"}
+    assert converted.globs == ("*.tmp",)
+    assert (converted | DEFAULT_PRUNE_LIST).excludes(".git", ".git")
+    with pytest.raises(ValueError):
+        as_prune_list(1)
+
+
 def test_not_criteria(tmp_path: pathlib.Path) -> None:
     test_dir = tmp_path
     (test_dir / "my_file").touch()
@@ -172,3 +222,197 @@ def test_testfun_criterion(tmp_path: pathlib.Path) -> None:
 
     with pytest.raises(AssertionError):
         CriterionFromTestFun(fun_description)  # type: ignore[arg-type]
+
+
+def test_criteria_equality() -> None:
+    assert HasFile("a") == HasFile(pathlib.Path("a"))
+    assert HasFile("a") != HasFile("a", contents="x")
+    assert HasFile("a") != HasDir("a")
+    assert hash(HasDir("a") | HasFile("b")) == hash(HasDir("a") | HasFile("b"))
+    assert HasDir("a") | HasFile("b") == HasDir("a") | HasFile("b")
+    assert HasDir("a") | HasFile("b") != HasDir("a") & HasFile("b")
+    assert ~HasDir("a") == ~HasDir("a")
+    assert (
+        dirmagic.project_types.is_git_root
+        == dirmagic.project_types.is_git_root
+    )
+
+    def testfun(dir: PathSpec) -> bool:
+        return True
+
+    assert CriterionFromTestFun(testfun) == CriterionFromTestFun(testfun)
+    assert len({HasFile("a"), HasFile("a"), HasFile("b")}) == 2
+
+
+def test_criterion_hash_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    criterion = HasDir("a") | HasFile("b")
+    expected = hash(criterion)
+    calls = []
+    original_key = AnyCriteria.equality_key
+
+    def counting_key(self: AnyCriteria) -> typing.Tuple[typing.Any, ...]:
+        calls.append(self)
+        return original_key(self)
+
+    monkeypatch.setattr(AnyCriteria, "equality_key", counting_key)
+    assert hash(criterion) == expected
+    assert calls == []
+
+    # changed copies compute their hash again
+    template = HasDir("{0}")
+    hash(template)
+    assert hash(template.expand_pattern("x")) == hash(HasDir("x"))
+
+
+def test_result_memo(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / ".git").mkdir()
+    tested = []
+    original_test = HasDir.test
+
+    def counting_test(self: HasDir, dir: PathSpec) -> CriterionResult:
+        tested.append(self.dirname)
+        return original_test(self, dir)
+
+    monkeypatch.setattr(HasDir, "test", counting_test)
+    git_root = dirmagic.project_types.is_git_root
+    vcs_root = dirmagic.project_types.is_vcs_root
+
+    assert evaluate(git_root, tmp_path) and evaluate(vcs_root, tmp_path)
+    assert tested == [".git", ".git"]
+
+    tested.clear()
+    with result_memo():
+        assert evaluate(git_root, tmp_path)
+        result = evaluate(vcs_root, tmp_path)
+        assert result
+        assert evaluate(HasDir(".git"), tmp_path)
+        assert not evaluate(HasDir(".git"), tmp_path / "..")
+    assert tested == [".git", ".git"]
+    assert result.simple_tree() == vcs_root.test(tmp_path).simple_tree()
+
+
+def test_optimize(tmp_path: pathlib.Path) -> None:
+    expensive = HasFile("DESCRIPTION", contents="^Package: ")
+    criterion = expensive | (HasDir(".git") | HasEntryGlob("*.Rproj"))
+    optimized = criterion.optimize()
+    assert isinstance(optimized, AnyCriteria)
+    assert optimized.criteria == (
+        HasDir(".git"),
+        HasEntryGlob("*.Rproj"),
+        expensive,
+    )
+    assert expensive.estimated_cost() == Cost.CONTENT
+
+    # duplicates, double negation and single criteria
+    assert (HasDir("a") & HasDir("a")).optimize() == HasDir("a")
+    assert (~~HasDir("a")).optimize() == HasDir("a")
+    assert AllCriteria(~HasDir("a"), HasBasename("b")).optimize() == (
+        HasBasename("b") & ~HasDir("a")
+    )
+    mixed = (HasDir("a") | HasDir("b")) & HasDir("c")
+    # the nested or has a higher cost
+    assert mixed.optimize() == HasDir("c") & (HasDir("a") | HasDir("b"))
+
+    project_type = dirmagic.project_types.is_vcs_root.optimize()
+    assert project_type.name == "repository"
+    # the nested project types are kept, the cheaper one comes first
+    assert project_type.criterion == (
+        dirmagic.project_types.is_svn_root | dirmagic.project_types.is_git_root
+    )
+
+    # same results
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / "x.Rproj").mkdir(parents=True)
+    (tmp_path / "c").mkdir()
+    (tmp_path / "c" / "DESCRIPTION").write_text("Package: c\n")
+    for dir in ["a", "b", "c"]:
+        assert bool(criterion.test(tmp_path / dir)) == bool(
+            optimized.test(tmp_path / dir)
+        )
+
+
+def test_matches(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "a.txt").touch()
+    (tmp_path / "b.txt").touch()
+    criteria = [
+        dirmagic.project_types.is_vcs_root,
+        dirmagic.project_types.is_r_package,
+        HasDir(".git") & ~HasFile("a.txt"),
+        HasEntryGlob("*.txt") | HasBasename("x"),
+        AllMatchCriterion(r".*\.txt$", HasFile("{0[0]}")),
+        AnyMatchCriterion(r"(.*)\.txt$", HasFile("{0[1]}.md")),
+        CriterionFromTestFun(lambda dir: True),
+    ]
+    expected = [bool(c.test(tmp_path)) for c in criteria]
+    assert expected == [True, False, False, True, True, False, True]
+
+    def no_test(self: Criterion, dir: PathSpec) -> CriterionResult:
+        raise AssertionError("no result tree expected")
+
+    for criterion_type in (HasDir, HasFile, HasEntryGlob, HasBasename):
+        monkeypatch.setattr(criterion_type, "test", no_test)
+    assert [c.matches(tmp_path) for c in criteria] == expected
+    monkeypatch.undo()
+
+    # the result tree is built when asked for
+    with result_memo():
+        assert evaluate_matches(HasDir(".git"), tmp_path)
+        result = evaluate(HasDir(".git"), tmp_path)
+        assert isinstance(result, CriterionResult)
+        assert result.reason() == "contains the directory `.git`"
+        assert evaluate_matches(HasDir(".git"), tmp_path)
+
+
+def test_compact_criteria(tmp_path: pathlib.Path) -> None:
+    criteria = [
+        HasFile("a"),
+        HasDir("a") | ~HasEntry("b"),
+        AllMatchCriterion(r".*\.txt$", HasFile("{0[0]}")),
+    ]
+    for criterion in criteria:
+        assert not hasattr(criterion, "__dict__")
+
+    (tmp_path / "a.txt").touch()
+    (tmp_path / "b.txt").touch()
+    result = criteria[-1].test(tmp_path)
+    assert len(result.sub_results) == 2
+    for sub_result in result.sub_results:
+        # the expanded criteria keep the names, not the match objects
+        assert isinstance(sub_result.criterion, HasFile)
+        assert sub_result.criterion.filename in ("a.txt", "b.txt")
+        assert sub_result.path is result.path
+
+
+def test_criterion_key() -> None:
+    assert json.loads(
+        criterion_key(dirmagic.project_types.is_python_project)
+    ) == (dirmagic.project_types.is_python_project.to_dict())
+    assert criterion_key(HasDir(".git")) == criterion_key(HasDir(".git"))
+
+    # test functions with the same description are told apart by the names
+    # they are registered under
+    def make_test_function(result: bool) -> typing.Callable[[PathSpec], bool]:
+        def is_project(dir: PathSpec) -> bool:
+            return result
+
+        return is_project
+
+    first = register_test_function(
+        make_test_function(True), "test_scan_index_first"
+    )
+    second = register_test_function(
+        make_test_function(False), "test_scan_index_second"
+    )
+    first_criterion = CriterionFromTestFun(first)
+    second_criterion = CriterionFromTestFun(second)
+    assert first_criterion.describe() == second_criterion.describe()
+    assert criterion_key(first_criterion) != criterion_key(second_criterion)
+
+    # criteria without a stable identity are not indexed
+    with pytest.raises(ValueError):
+        criterion_key(CriterionFromTestFun(lambda dir: True))
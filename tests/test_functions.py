@@ -1,9 +1,25 @@
+import itertools
 import pathlib
+import typing
 
 import pytest
+
+import dirmagic.functions
+from dirmagic.core_criteria import PathSpec
 from dirmagic.generic_criteria import HasEntry
-from dirmagic import find_root, identify_project, find_projects
-from dirmagic.project_types import is_vcs_root
+from dirmagic.profiling import Profiler
+from dirmagic import (
+    find_projects,
+    find_root,
+    find_roots,
+    identify_project,
+    identify_projects,
+    iter_projects,
+    RootFinder,
+    scan_projects,
+)
+from dirmagic.project_types import is_r_package, is_vcs_root
+from dirmagic.utilities import DEFAULT_PRUNE_LIST, PruneList
 
 
 def test_identify_project_function(tmp_path: pathlib.Path) -> None:
@@ -59,3 +75,424 @@ def test_find_root_function(tmp_path: pathlib.Path) -> None:
 
     with pytest.raises(FileNotFoundError):
         find_root(tmp_path / "b", HasEntry("my_file.txt"))
+
+
+def test_find_root_reason_operations(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "DESCRIPTION").write_text("Package: x\n")
+    (tmp_path / "src").mkdir()
+
+    # the reason is taken from the tests finding the root
+    operations = []
+    for return_reason in (False, True):
+        with Profiler() as profiler:
+            find_root(tmp_path / "src", is_r_package, return_reason)
+        operations.append(profiler.operations)
+        with Profiler() as profiler:
+            RootFinder(is_r_package).find_root(tmp_path / "src", return_reason)
+        operations.append(profiler.operations)
+    assert all(o == operations[0] for o in operations)
+    assert operations[0]["bytes_read"] == len("Package: x\n")
+
+
+def test_iter_projects(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / "c" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / "d" / "e" / ".git").mkdir(parents=True)
+    (tmp_path / "f" / ".git").mkdir(parents=True)
+
+    all_found = list(iter_projects(tmp_path, is_vcs_root, maxdepth=-1))
+    # same order as before: the matches of a directory come first
+    assert sorted(all_found[:2]) == [tmp_path / "a", tmp_path / "f"]
+    assert sorted(all_found[2:]) == [
+        tmp_path / "b" / "c",
+        tmp_path / "b" / "d" / "e",
+    ]
+    assert all_found == find_projects(tmp_path, is_vcs_root, maxdepth=-1)
+
+    assert (
+        list(itertools.islice(iter_projects(tmp_path, is_vcs_root, -1), 3))
+        == all_found[:3]
+    )
+    assert list(iter_projects(tmp_path, is_vcs_root, maxdepth=0)) == []
+
+
+def test_iter_projects_deep_tree(tmp_path: pathlib.Path) -> None:
+    deep_dir = tmp_path.joinpath(*(["d"] * 200))
+    (deep_dir / ".git").mkdir(parents=True)
+
+    assert list(iter_projects(tmp_path, is_vcs_root, maxdepth=-1)) == [
+        deep_dir
+    ]
+    assert find_projects(tmp_path, is_vcs_root, maxdepth=199) == []
+
+
+def test_find_projects_parallel(tmp_path: pathlib.Path) -> None:
+    for i in range(5):
+        for j in range(4):
+            (tmp_path / f"d{i}" / f"s{j}").mkdir(parents=True)
+        (tmp_path / f"d{i}" / "s1" / ".git").mkdir()
+        (tmp_path / f"d{i}" / "s3" / "x" / ".git").mkdir(parents=True)
+    (tmp_path / "d2" / ".git").mkdir()
+
+    sequential = find_projects(tmp_path, is_vcs_root, maxdepth=-1)
+    assert len(sequential) == 9
+    assert tmp_path / "d2" in sequential
+    assert tmp_path / "d2" / "s1" not in sequential
+
+    for workers in (1, 2, 8):
+        assert (
+            find_projects(tmp_path, is_vcs_root, maxdepth=-1, workers=workers)
+            == sequential
+        )
+    assert find_projects(
+        tmp_path, is_vcs_root, maxdepth=2, workers=4
+    ) == find_projects(tmp_path, is_vcs_root, maxdepth=2)
+
+    assert (
+        list(
+            itertools.islice(
+                iter_projects(tmp_path, is_vcs_root, -1, workers=4), 2
+            )
+        )
+        == sequential[:2]
+    )
+    assert find_projects(tmp_path, is_vcs_root, maxdepth=0, workers=4) == []
+
+
+def test_find_projects_symlinks(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "root" / "a" / "b").mkdir(parents=True)
+    (tmp_path / "outside" / "p" / ".git").mkdir(parents=True)
+    root = tmp_path / "root"
+    # a cycle and a link pointing outside the search directory
+    (root / "a" / "b" / "cycle").symlink_to(root / "a")
+    (root / "a" / "link").symlink_to(tmp_path / "outside")
+
+    assert find_projects(root, is_vcs_root, maxdepth=-1) == [
+        root / "a" / "link" / "p"
+    ]
+    assert find_projects(
+        root, is_vcs_root, maxdepth=-1, workers=2
+    ) == find_projects(root, is_vcs_root, maxdepth=-1)
+    assert (
+        find_projects(
+            root, is_vcs_root, maxdepth=-1, follow_symlinks="within-root"
+        )
+        == []
+    )
+    assert (
+        find_projects(root, is_vcs_root, maxdepth=-1, follow_symlinks="never")
+        == []
+    )
+
+    # a project reachable twice is reported once
+    (root / "c" / ".git").mkdir(parents=True)
+    (root / "a" / "b" / "c_link").symlink_to(root / "c")
+    assert find_projects(
+        root, is_vcs_root, maxdepth=-1, follow_symlinks="within-root"
+    ) == [root / "c"]
+
+    with pytest.raises(ValueError):
+        find_projects(root, is_vcs_root, follow_symlinks="sometimes")
+
+
+def test_find_projects_prune(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "node_modules" / "x" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / "build" / "y" / ".git").mkdir(parents=True)
+    (tmp_path / "c" / "z.egg-info" / ".git").mkdir(parents=True)
+
+    assert len(find_projects(tmp_path, is_vcs_root, maxdepth=-1)) == 4
+    assert sorted(
+        find_projects(tmp_path, is_vcs_root, maxdepth=-1, prune=True)
+    ) == [tmp_path / "a", tmp_path / "b" / "build" / "y"]
+    assert find_projects(
+        tmp_path, is_vcs_root, maxdepth=-1, prune=["build", "node_*", "c"]
+    ) == [tmp_path / "a"]
+    assert find_projects(
+        tmp_path,
+        is_vcs_root,
+        maxdepth=-1,
+        workers=2,
+        prune=DEFAULT_PRUNE_LIST | PruneList(globs=["b/build"]),
+    ) == [tmp_path / "a"]
+    # pruning the project directory itself
+    assert find_projects(tmp_path, is_vcs_root, prune=["a"]) == []
+
+
+def test_find_projects_listings(tmp_path: pathlib.Path) -> None:
+    for name in ("a/b/c", "a/d", "e/.git"):
+        (tmp_path / name).mkdir(parents=True)
+
+    # each directory is listed once, the tested ones when testing them
+    for workers in (None, 4):
+        # the worker threads record in the caller's profiler
+        with Profiler() as profiler:
+            assert find_projects(
+                tmp_path, is_vcs_root, maxdepth=-1, workers=workers
+            ) == [tmp_path / "e"]
+        assert profiler.operations["listings"] == 6
+        assert profiler.profiles[is_vcs_root].calls == 5
+        assert profiler.profiles[is_vcs_root].met == 1
+    with Profiler() as profiler:
+        projects = scan_projects(tmp_path, maxdepth=-1)
+    assert [dir for dir, _ in projects] == [tmp_path / "e"]
+    assert profiler.operations["listings"] == 6
+
+
+def test_find_projects_process_pool(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for i in range(4):
+        (tmp_path / f"d{i}" / "a" / ".git").mkdir(parents=True)
+        deep_dir = tmp_path.joinpath(f"d{i}", *(["s"] * 6))
+        (deep_dir / ".git").mkdir(parents=True)
+        (deep_dir.parent / ".git").touch()
+    (tmp_path / "d2" / ".git").mkdir()
+    (tmp_path / "d3" / "cycle").symlink_to(tmp_path)
+    (tmp_path / "d3" / "project_link").symlink_to(tmp_path / "d0" / "a")
+
+    sequential = find_projects(tmp_path, is_vcs_root, maxdepth=-1)
+    assert len(sequential) == 7
+
+    # split the subtrees into tiny tasks
+    monkeypatch.setattr(dirmagic.functions, "_PROCESS_TASK_MAX_DIRS", 2)
+    assert (
+        find_projects(
+            tmp_path, is_vcs_root, maxdepth=-1, workers=2, pool="process"
+        )
+        == sequential
+    )
+    assert find_projects(
+        tmp_path, is_vcs_root, maxdepth=3, workers=2, pool="process"
+    ) == find_projects(tmp_path, is_vcs_root, maxdepth=3)
+
+    with pytest.raises(ValueError):
+        find_projects(tmp_path, is_vcs_root, workers=2, pool="cluster")
+
+
+def test_find_projects_process_pool_symlinks(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # both directories link to each other: the directory listed first is
+    # searched via its real path, the other one as well
+    for name in ("x/p", "x/q", "y/r", "y/s"):
+        (tmp_path / name / ".git").mkdir(parents=True)
+    (tmp_path / "x" / "link").symlink_to(tmp_path / "y")
+    (tmp_path / "y" / "link").symlink_to(tmp_path / "x")
+
+    sequential = find_projects(tmp_path, is_vcs_root, maxdepth=-1)
+    assert sorted(p.relative_to(tmp_path).parts[0] for p in sequential) == [
+        "x",
+        "x",
+        "y",
+        "y",
+    ]
+    for max_dirs in (1, 2, 100):
+        monkeypatch.setattr(
+            dirmagic.functions, "_PROCESS_TASK_MAX_DIRS", max_dirs
+        )
+        assert (
+            find_projects(
+                tmp_path, is_vcs_root, maxdepth=-1, workers=2, pool="process"
+            )
+            == sequential
+        )
+
+
+def test_find_projects_thread_pool_symlinks(tmp_path: pathlib.Path) -> None:
+    # the same paths as for the sequential search, see the process pool
+    for name in ("x/p", "x/q", "y/r", "y/s"):
+        (tmp_path / name / ".git").mkdir(parents=True)
+    (tmp_path / "x" / "link").symlink_to(tmp_path / "y")
+    (tmp_path / "y" / "link").symlink_to(tmp_path / "x")
+
+    sequential = find_projects(tmp_path, is_vcs_root, maxdepth=-1)
+    for workers in (1, 2, 8):
+        assert (
+            find_projects(tmp_path, is_vcs_root, maxdepth=-1, workers=workers)
+            == sequential
+        )
+
+
+def test_iter_projects_thread_pool_pending(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for i in range(50):
+        (tmp_path / f"d{i:02}" / "p" / ".git").mkdir(parents=True)
+    searched = []
+    original_test_sub_dirs = dirmagic.functions._test_sub_dirs
+
+    def counting_test_sub_dirs(
+        search_dir: str, *args: typing.Any
+    ) -> typing.Any:
+        searched.append(search_dir)
+        return original_test_sub_dirs(search_dir, *args)
+
+    monkeypatch.setattr(
+        dirmagic.functions, "_test_sub_dirs", counting_test_sub_dirs
+    )
+    first = next(iter_projects(tmp_path, is_vcs_root, -1))
+    assert list(
+        itertools.islice(
+            iter_projects(tmp_path, is_vcs_root, -1, workers=1), 1
+        )
+    ) == [first]
+    # the start directory and a few directories ahead, not all 50
+    assert len(searched) <= 2 + 4
+    assert searched[1] == str(first.parent)
+
+
+def test_identify_project_pool(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "setup.py").touch()
+    expected = identify_project(tmp_path)
+    assert len(expected) == 3
+
+    assert identify_project(tmp_path, workers=4) == expected
+    assert identify_project(tmp_path, workers=2, pool="process") == expected
+
+
+def test_scan_projects(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "a" / "setup.py").touch()
+    (tmp_path / "a" / "pkg" / "setup.py").parent.mkdir()
+    (tmp_path / "a" / "pkg" / "setup.py").touch()
+    (tmp_path / "b" / "c" / ".idea").mkdir(parents=True)
+    (tmp_path / "d").mkdir()
+
+    assert scan_projects(tmp_path, maxdepth=-1) == [
+        (tmp_path / dir, identify_project(tmp_path / dir))
+        for dir in ["a", "b/c"]
+    ]
+
+    nested = scan_projects(tmp_path, maxdepth=-1, descend_into_matches=True)
+    assert sorted(dir for dir, _ in nested) == [
+        tmp_path / "a",
+        tmp_path / "a" / "pkg",
+        tmp_path / "b" / "c",
+    ]
+    assert dict(nested)[tmp_path / "a" / "pkg"] == [
+        ("packaging", "python package")
+    ]
+
+    assert scan_projects(tmp_path, [is_vcs_root], maxdepth=-1) == [
+        (tmp_path / "a", [("version control", "repository")])
+    ]
+    assert scan_projects(tmp_path, maxdepth=0) == []
+
+
+def test_root_finder(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "c").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file").touch()
+
+    tests = []
+    original_matches = HasEntry.matches
+
+    def counting_matches(self: HasEntry, dir: PathSpec) -> bool:
+        tests.append(dir)
+        return original_matches(self, dir)
+
+    monkeypatch.setattr(HasEntry, "matches", counting_matches)
+
+    root_finder = RootFinder(HasEntry(".git"))
+    assert root_finder.find_root(tmp_path / "a" / "b" / "file") == (
+        tmp_path / "a"
+    )
+    assert len(tests) == 2
+    assert root_finder.find_root(tmp_path / "a" / "b" / "c") == tmp_path / "a"
+    assert root_finder.find_root(tmp_path / "a" / "b") == tmp_path / "a"
+    # only c is new
+    assert len(tests) == 3
+
+    root_finder.invalidate(tmp_path / "a" / "b")
+    (tmp_path / "a" / "b" / ".git").mkdir()
+    assert root_finder.find_root(tmp_path / "a" / "b" / "c", True) == (
+        tmp_path / "a" / "b",
+        "contains the entry `.git`",
+    )
+
+    root_finder.invalidate()
+    assert root_finder.results == {}
+
+    # expired results are tested again
+    root_finder = RootFinder(HasEntry(".git"), ttl=0)
+    root_finder.find_root(tmp_path / "a")
+    root_finder.find_root(tmp_path / "a")
+    assert tests[-2:] == [tmp_path / "a", tmp_path / "a"]
+
+
+def test_find_roots(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "c").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file").touch()
+    (tmp_path / "d").mkdir()
+
+    tests = []
+    original_matches = HasEntry.matches
+
+    def counting_matches(self: HasEntry, dir: PathSpec) -> bool:
+        tests.append(dir)
+        return original_matches(self, dir)
+
+    monkeypatch.setattr(HasEntry, "matches", counting_matches)
+
+    paths = [
+        str(tmp_path / "a" / "b" / "c"),
+        str(tmp_path / "a" / "b" / "file"),
+        str(tmp_path / "a" / "b" / "deleted" / "file"),
+        str(tmp_path / "a"),
+    ]
+    assert find_roots(iter(paths), HasEntry(".git")) == {
+        path: tmp_path / "a" for path in paths
+    }
+    # c, b, a
+    assert len(tests) == 3
+
+    roots = find_roots([tmp_path / "d", tmp_path / "a"], HasEntry(".git"))
+    assert roots[tmp_path / "a"] == tmp_path / "a"
+    assert roots[tmp_path / "d"] is None
+
+
+def test_identify_projects(tmp_path: pathlib.Path) -> None:
+    paths = []
+    for i in range(20):
+        (tmp_path / f"d{i}").mkdir()
+        paths.append(tmp_path / f"d{i}")
+    for i in range(0, 20, 2):
+        (tmp_path / f"d{i}" / ".git").mkdir()
+    paths.append(tmp_path / "missing")
+
+    consumed = []
+
+    def path_stream() -> typing.Iterator[pathlib.Path]:
+        for path in paths:
+            consumed.append(path)
+            yield path
+
+    results = identify_projects(path_stream(), [is_vcs_root], max_pending=3)
+    first_result = next(results)
+    # backpressure: only a few paths are read ahead
+    assert len(consumed) <= 4
+    all_results = {first_result.path: first_result}
+    all_results.update((r.path, r) for r in results)
+    assert sorted(all_results) == sorted(paths)
+
+    for i in range(20):
+        result = all_results[tmp_path / f"d{i}"]
+        assert result.error is None
+        assert result.types == (
+            [("version control", "repository")] if i % 2 == 0 else []
+        )
+    assert isinstance(all_results[tmp_path / "missing"].error, OSError)
+
+    assert [
+        r[:2]
+        for r in identify_projects(
+            [tmp_path / "d0"], workers=2, pool="process"
+        )
+    ] == [(tmp_path / "d0", identify_project(tmp_path / "d0"))]
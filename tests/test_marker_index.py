@@ -0,0 +1,57 @@
+import pathlib
+
+from dirmagic import identify_project, project_types
+from dirmagic.core_criteria import ProjectType
+from dirmagic.functions import _project_types_to_test
+from dirmagic.generic_criteria import (
+    HasBasename,
+    HasDir,
+    HasEntry,
+    HasEntryGlob,
+    HasFile,
+    HasFilePattern,
+)
+from dirmagic.marker_index import MarkerIndex, marker_index
+
+
+def test_markers() -> None:
+    assert HasFile("setup.py").markers() == frozenset({"setup.py"})
+    assert HasFile("recipes/meta.yaml").markers() == frozenset({"recipes"})
+    assert HasDir(".git").markers() == frozenset({".git"})
+    assert HasEntry("./a").markers() == frozenset({"a"})
+    assert HasEntry("..").markers() is None
+    assert HasEntry("/etc").markers() is None
+    assert HasFile("{0}.txt").markers() is None
+    assert HasFilePattern("[.]Rproj$").markers() is None
+    assert HasEntryGlob("*.Rproj").markers() is None
+    assert HasBasename("testthat").markers() is None
+
+    assert (HasFile("a") | HasDir("b")).markers() == frozenset({"a", "b"})
+    assert (HasFile("a") | HasBasename("b")).markers() is None
+    assert (HasFile("a/x") & HasFile("b")).markers() == frozenset({"a"})
+    assert (HasBasename("b") & HasFile("b")).markers() == frozenset({"b"})
+    assert (~HasFile("a")).markers() is None
+    assert project_types.is_vcs_root.markers() == frozenset({".git", ".svn"})
+
+
+def test_marker_index(tmp_path: pathlib.Path) -> None:
+    all_types = _project_types_to_test(None)
+    index = MarkerIndex(all_types)
+    always = {
+        project_type.name
+        for project_type in index.candidates([])
+        if isinstance(project_type, ProjectType)
+    }
+    assert always == {"RStudio/Posit", "testthat project"}
+    assert project_types.is_git_root in index.candidates([".GIT"])
+    assert project_types.is_conda_feedstock in index.candidates(["recipes"])
+    assert marker_index(tuple(all_types)) is marker_index(tuple(all_types))
+
+    (tmp_path / "testthat").mkdir()
+    (tmp_path / "testthat" / "DESCRIPTION").write_text("Package: x\n")
+    (tmp_path / "testthat" / "x.Rproj").write_text("Version: 1.0\n")
+    assert identify_project(tmp_path / "testthat") == [
+        ("IDE", "RStudio/Posit"),
+        ("misc", "testthat project"),
+        ("packaging", "R package"),
+    ]
@@ -0,0 +1,122 @@
+import concurrent.futures
+import pathlib
+import threading
+import time
+import typing
+
+import pytest
+
+from dirmagic import find_projects
+from dirmagic.core_criteria import (
+    AllCriteria,
+    AnyCriteria,
+    CriterionFromTestFun,
+    PathSpec,
+    evaluate,
+)
+from dirmagic.evaluation import evaluation_context
+from dirmagic.generic_criteria import HasBasename, HasFile
+from dirmagic.parallel import active_parallel_evaluation, parallel_evaluation
+
+
+def slow_probe(
+    result: bool, calls: typing.List[str], delay: float = 0.1
+) -> CriterionFromTestFun:
+    def probe(dir: PathSpec) -> bool:
+        time.sleep(delay)
+        calls.append(threading.current_thread().name)
+        return result
+
+    return CriterionFromTestFun(probe)
+
+
+def test_parallel_evaluation(tmp_path: pathlib.Path) -> None:
+    calls: typing.List[str] = []
+    criterion = AnyCriteria(
+        slow_probe(False, calls),
+        slow_probe(True, calls),
+        slow_probe(False, calls),
+        slow_probe(True, calls, delay=0.0),
+    )
+    sequential = criterion.test(tmp_path)
+    assert len(calls) == 2
+
+    calls.clear()
+    with parallel_evaluation(max_workers=4) as evaluation:
+        assert active_parallel_evaluation() is evaluation
+        result = criterion.test(tmp_path)
+        assert criterion.matches(tmp_path)
+    assert active_parallel_evaluation() is None
+    assert any(name.startswith("dirmagic-evaluation") for name in calls)
+    # the first decisive result in the declared order
+    assert result.reason() == sequential.reason()
+    assert len(result.sub_results) == 2
+
+    # the probes run at the same time: they meet at the barrier
+    barrier = threading.Barrier(2, timeout=10)
+
+    def meeting_probe(result: bool) -> CriterionFromTestFun:
+        def probe(dir: PathSpec) -> bool:
+            barrier.wait()
+            return result
+
+        return CriterionFromTestFun(probe)
+
+    with parallel_evaluation(max_workers=2):
+        assert AnyCriteria(meeting_probe(False), meeting_probe(True)).matches(
+            tmp_path
+        )
+    assert not barrier.broken
+
+
+def test_parallel_evaluation_cap(tmp_path: pathlib.Path) -> None:
+    calls: typing.List[str] = []
+    criterion = AllCriteria(
+        HasBasename(tmp_path.name),
+        slow_probe(True, calls),
+        slow_probe(False, calls),
+        slow_probe(True, calls),
+        slow_probe(True, calls),
+    )
+    with parallel_evaluation(max_workers=2):
+        assert not criterion.matches(tmp_path)
+    # the probes after the decisive one weren't started or were cancelled
+    assert len(calls) < 4
+
+    with pytest.raises(ValueError):
+        with parallel_evaluation(max_workers=0):
+            pass
+
+
+def test_parallel_evaluation_nested(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a.txt").touch()
+    calls: typing.List[str] = []
+    inner = AllCriteria(slow_probe(True, calls), slow_probe(True, calls))
+    criterion = AnyCriteria(slow_probe(False, calls), inner & HasFile("a.txt"))
+    with parallel_evaluation(max_workers=1), evaluation_context():
+        assert evaluate(criterion, tmp_path)
+        # the memo is shared with the worker threads
+        calls.clear()
+        assert evaluate(inner, tmp_path)
+        assert calls == []
+
+
+def test_parallel_evaluation_shared_executor(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a").mkdir()
+    calls: typing.List[str] = []
+    criterion = AnyCriteria(slow_probe(False, calls), slow_probe(True, calls))
+
+    # the walker's threads use the evaluation of the caller
+    with parallel_evaluation(max_workers=2):
+        assert find_projects(tmp_path, criterion) == [tmp_path / "a"]
+    assert any(name.startswith("dirmagic-evaluation") for name in calls)
+
+    # the only thread of the executor waits for the probes: they are tested
+    # by the waiting thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+
+        def test_on_executor() -> bool:
+            with parallel_evaluation(max_workers=2, executor=executor):
+                return criterion.matches(tmp_path)
+
+        assert executor.submit(test_on_executor).result(timeout=10)
@@ -1,16 +1,24 @@
+import inspect
 import pathlib
 import re
+import sys
+import typing
 
 import pytest
 
+import dirmagic.pattern_criteria
+from dirmagic.core_criteria import from_dict
 from dirmagic.generic_criteria import HasDir, HasFile
 from dirmagic.pattern_criteria import (
     AllMatchCriterion,
     AnyMatchCriterion,
+    IsIn,
     MatchesPattern,
     SpyCriterion,
     SuffixIsIn,
+    iter_matching_entries,
 )
+from dirmagic.utilities import DirectoryFilter
 
 
 def test_match_format() -> None:
@@ -49,6 +57,14 @@ def test_match_format() -> None:
     }
 
 
+def test_name_lists_equality() -> None:
+    # the order of the names doesn't matter
+    assert IsIn("{0}", ["a", "b"]) == IsIn("{0}", ["b", "a"])
+    assert hash(IsIn("{0}", ["a", "b"])) == hash(IsIn("{0}", ["b", "a"]))
+    assert SuffixIsIn("{0}", [".c", ".h"]) == SuffixIsIn("{0}", [".h", ".c"])
+    assert SuffixIsIn("{0}", [".c"]) != SuffixIsIn("{0}", [".c", ".h"])
+
+
 @pytest.fixture
 def example_fs_structure(tmp_path: pathlib.Path) -> pathlib.Path:
     (tmp_path / "a/b/c/").mkdir(parents=True)
@@ -197,3 +213,194 @@ def test_nested_loops(
     ).test(tmp_path)
     assert t
     assert len(capsys.readouterr().out.splitlines()) == 16
+
+
+def test_iter_matching_entries_symlinks(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "c.txt").touch()
+    (tmp_path / "a" / "b" / "cycle").symlink_to(tmp_path / "a")
+    txt_pattern = re.compile(r".*\.txt$")
+
+    assert [m[0] for m in iter_matching_entries(tmp_path, txt_pattern)] == [
+        "a/b/c.txt"
+    ]
+    assert AllMatchCriterion(r".*\.txt$", HasFile("{0[0]}")).test(tmp_path)
+
+    # the linked directory is searched once, either via the link or not
+    (tmp_path / "link").symlink_to(tmp_path / "a" / "b")
+    assert [m[0] for m in iter_matching_entries(tmp_path, txt_pattern)] == [
+        "link/c.txt"
+    ]
+    assert [
+        m[0]
+        for m in iter_matching_entries(
+            tmp_path, txt_pattern, follow_symlinks="never"
+        )
+    ] == ["a/b/c.txt"]
+
+
+def test_iter_matching_entries_prune(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").touch()
+    (tmp_path / "src" / "__pycache__").mkdir()
+    (tmp_path / "src" / "__pycache__" / "a.pyc").touch()
+    (tmp_path / "__pycache__").touch()  # a file, never pruned
+    pattern = re.compile(r"(a\..*|__pycache__)$")
+
+    assert sorted(
+        m.string for m in iter_matching_entries(tmp_path, pattern)
+    ) == [
+        "__pycache__",
+        "src/__pycache__",
+        "src/a.py",
+    ]
+    assert [
+        m.string for m in iter_matching_entries(tmp_path, pattern, prune=True)
+    ] == ["__pycache__", "src/a.py"]
+
+
+def test_iter_matching_entries_filter(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "src").mkdir()
+    (tmp_path / "a.py").touch()
+    pattern = re.compile(r"\.py$")
+    filters = []
+
+    def counting_filter(*args: typing.Any) -> DirectoryFilter:
+        filters.append(args)
+        return DirectoryFilter(*args)
+
+    monkeypatch.setattr(
+        dirmagic.pattern_criteria, "DirectoryFilter", counting_filter
+    )
+    # the start path isn't resolved for a single directory listed
+    assert AnyMatchCriterion(r"^.*\.py$", HasFile("{0[0]}"), maxdepth=1).test(
+        tmp_path
+    )
+    assert filters == []
+    assert [m.string for m in iter_matching_entries(tmp_path, pattern)] == [
+        "a.py"
+    ]
+    assert len(filters) == 1
+
+    with pytest.raises(ValueError):
+        list(iter_matching_entries(tmp_path, pattern, follow_symlinks="x"))
+
+
+def test_iter_matching_entries_deep(tmp_path: pathlib.Path) -> None:
+    depth = 150
+    dir = tmp_path
+    (dir / "x.txt").touch()
+    for _ in range(depth):
+        dir = dir / "d"
+        dir.mkdir()
+        (dir / "x.txt").touch()
+    pattern = re.compile(r"x\.txt$")
+
+    # the search doesn't nest a frame per directory level
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(inspect.stack()) + 50)
+    try:
+        found = [m.string for m in iter_matching_entries(tmp_path, pattern)]
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+    assert len(found) == depth + 1
+    assert found[:2] == ["x.txt", "d/x.txt"]
+    assert found == sorted(found, key=len)
+    assert [
+        m.string for m in iter_matching_entries(tmp_path, pattern, maxdepth=2)
+    ] == ["x.txt", "d/x.txt"]
+    assert [
+        m.string
+        for m in iter_matching_entries(
+            tmp_path, pattern, subpath=pathlib.Path("d/d"), maxdepth=1
+        )
+    ] == ["d/d/x.txt"]
+
+
+def test_match_criteria_bounds(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "src" / "lib").mkdir(parents=True)
+    (tmp_path / "src" / "a.c").write_text("int a;")
+    (tmp_path / "src" / "lib" / "b.c").touch()
+    (tmp_path / "x.Rproj").mkdir()
+    pattern = r".*\.(c|Rproj)$"
+
+    def found(**bounds: typing.Any) -> typing.List[str]:
+        return [
+            m.string
+            for m in AllMatchCriterion(
+                pattern, HasFile("{0[0]}"), **bounds
+            ).iter_matches(tmp_path)
+        ]
+
+    assert found() == ["x.Rproj", "src/a.c", "src/lib/b.c"]
+    assert found(maxdepth=1) == ["x.Rproj"]
+    assert found(entry_type="file") == ["src/a.c", "src/lib/b.c"]
+    assert found(entry_type="dir") == ["x.Rproj"]
+    assert found(subdir="src", maxdepth=1) == ["src/a.c"]
+    assert found(subdir="missing") == []
+
+    # only the top level C files declare an int
+    criterion = AllMatchCriterion(
+        r".*\.c$", HasFile("{0[0]}", contents="int"), subdir="src"
+    )
+    assert not criterion.test(tmp_path)
+    top_level = AllMatchCriterion(
+        r".*\.c$",
+        HasFile("{0[0]}", contents="int"),
+        maxdepth=1,
+        subdir="src",
+        entry_type="file",
+    )
+    result = top_level.test(tmp_path)
+    assert result
+    assert top_level.describe().endswith(
+        "(files only, inside `src`, at most 1 level deep)"
+    )
+    assert "(files only, inside `src`" in result.simple_tree()
+    assert top_level != criterion
+    assert top_level.optimize() == top_level
+    assert from_dict(top_level.to_dict()) == top_level
+    assert top_level.estimated_cost() < criterion.estimated_cost()
+
+    assert not AnyMatchCriterion(
+        r".*\.Rproj$", HasDir("{0[0]}"), entry_type="file"
+    ).test(tmp_path)
+
+    with pytest.raises(ValueError):
+        AnyMatchCriterion(".*", HasFile("{0[0]}"), entry_type="link")
+    with pytest.raises(ValueError):
+        AnyMatchCriterion(".*", HasFile("{0[0]}"), subdir=str(tmp_path))
+
+
+def test_templates_without_copy(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "a.txt").touch()
+    m = re.search(r"(.*)\.txt$", "a.txt")
+    assert m is not None
+    criteria = [
+        HasFile("{0[0]}"),
+        HasDir("{0[1]}"),
+        SuffixIsIn("{0[0]}", [".txt"]),
+        MatchesPattern("{0[1]}", "^a$"),
+    ]
+    expanded = [c.expand_pattern(m) for c in criteria]
+    assert [c.describe() for c in expanded] == [
+        "has a file `a.txt`",
+        "contains the directory `a`",
+        "the suffix of `a.txt` is in ['.txt']",
+        "`a` matches `^a$`",
+    ]
+    expected = [c.matches(tmp_path) for c in expanded]
+    assert expected == [True, False, True, True]
+
+    def no_copy(*args: object) -> None:
+        raise AssertionError("no copy expected")
+
+    monkeypatch.setattr("copy.copy", no_copy)
+    monkeypatch.setattr("dirmagic.core_criteria._shallow_copy", no_copy)
+    assert [c.matches(tmp_path, m) for c in criteria] == expected
+    # the templates are kept
+    assert criteria[0] == HasFile("{0[0]}")
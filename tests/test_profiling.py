@@ -0,0 +1,59 @@
+import json
+import pathlib
+
+from dirmagic import identify_project
+from dirmagic.core_criteria import evaluate
+from dirmagic.generic_criteria import HasDir, HasFile
+from dirmagic.profiling import active_profiler, Profiler
+from dirmagic.project_types import is_git_root, is_r_package
+
+
+def test_profiler(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "DESCRIPTION").write_text("Package: x\n")
+
+    assert active_profiler() is None
+    with Profiler() as profiler:
+        assert active_profiler() is profiler
+        assert ("version control", "git") in identify_project(tmp_path)
+    assert active_profiler() is None
+
+    git_profile = profiler.profiles[is_git_root]
+    assert git_profile.calls == 1
+    # reused by is_vcs_root
+    assert git_profile.cache_hits == 1
+    assert git_profile.met == 2
+    # the directory is listed once, before testing the candidate types
+    assert profiler.operations["listings"] == 1
+
+    r_profile = profiler.profiles[is_r_package]
+    assert r_profile.operations["bytes_read"] == len("Package: x\n")
+    assert r_profile.met == 1
+
+    records = json.loads(json.dumps(profiler.export()))
+    assert records[0]["seconds"] >= records[-1]["seconds"]
+    assert {"criterion", "calls", "stats", "listings"} <= set(records[0])
+    table = profiler.table().splitlines()
+    assert table[0].split()[:2] == ["seconds", "calls"]
+    assert len(table) == len(records) + 1
+
+    # without snapshots, the operations are counted by the criteria
+    with Profiler() as profiler:
+        evaluate(HasFile("x") | HasDir(".git"), tmp_path)
+    assert profiler.profiles[HasFile("x")].operations["stats"] == 1
+    assert profiler.profiles[HasDir(".git")].operations["stats"] == 1
+
+
+def test_profiler_workers(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".git").mkdir()
+    (tmp_path / "DESCRIPTION").write_text("Package: x\n")
+    with Profiler() as profiler:
+        types = identify_project(tmp_path, workers=4)
+    assert ("version control", "git") in types
+    assert profiler.profiles[is_git_root].met >= 1
+    # the workers share the snapshot of the directory
+    assert profiler.operations["listings"] == 1
+    assert profiler.operations["stats"] == 0
+    # the operations on the workers are counted
+    r_profile = profiler.profiles[is_r_package]
+    assert r_profile.operations["bytes_read"] == len("Package: x\n")
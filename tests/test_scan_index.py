@@ -0,0 +1,81 @@
+import os
+import pathlib
+
+import pytest
+
+from dirmagic import find_projects
+from dirmagic.core_criteria import (
+    CriterionFromTestFun,
+    PathSpec,
+    register_test_function,
+)
+from dirmagic.project_types import is_vcs_root
+from dirmagic.scan_index import ScanIndex, default_index_path
+
+
+def test_scan_index(tmp_path: pathlib.Path) -> None:
+    root = tmp_path / "root"
+    (root / "a" / ".git").mkdir(parents=True)
+    (root / "b" / "c" / ".git").mkdir(parents=True)
+    (root / "b" / "d").mkdir(parents=True)
+
+    tested = []
+
+    def has_git(dir: PathSpec) -> bool:
+        tested.append(pathlib.Path(dir).name)
+        return (pathlib.Path(dir) / ".git").exists()
+
+    criterion = CriterionFromTestFun(
+        register_test_function(has_git, "test_scan_index_has_git")
+    )
+    expected = find_projects(root, criterion, maxdepth=-1)
+    tested.clear()
+
+    with ScanIndex(tmp_path / "index.sqlite") as index:
+        assert find_projects(root, criterion, maxdepth=-1, index=index) == (
+            expected
+        )
+        assert sorted(tested) == ["a", "b", "c", "d"]
+        assert index.cached_projects(root, criterion) == [
+            root / "a",
+            root / "b" / "c",
+        ]
+        assert index.cached_result(root / "b", criterion) is False
+        assert index.cached_result(root / "b", is_vcs_root) is None
+        assert index.cached_projects(root, is_vcs_root) == []
+
+        # nothing changed, nothing is tested
+        tested.clear()
+        assert find_projects(root, criterion, maxdepth=-1, index=index) == (
+            expected
+        )
+        assert tested == []
+
+    # the index persists, only modified directories are tested again
+    (root / "b" / "d" / ".git").mkdir()
+    os.rmdir(root / "b" / "c" / ".git")
+    os.rmdir(root / "b" / "c")
+    with ScanIndex(tmp_path / "index.sqlite") as index:
+        assert find_projects(root, criterion, maxdepth=-1, index=index) == [
+            root / "a",
+            root / "b" / "d",
+        ]
+        # b lost the sub-directory c, d got a new entry
+        assert sorted(tested) == ["b", "d"]
+        assert index.cached_projects(root, criterion) == [
+            root / "a",
+            root / "b" / "d",
+        ]
+
+        with pytest.raises(ValueError):
+            find_projects(root, criterion, workers=2, index=index)
+
+        index.clear()
+        assert index.cached_projects(root, criterion) == []
+
+
+def test_default_index_path(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", "/some/cache")
+    assert default_index_path() == pathlib.Path(
+        "/some/cache/dirmagic/scan_index.sqlite"
+    )
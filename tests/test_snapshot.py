@@ -0,0 +1,108 @@
+import os
+import pathlib
+
+import pytest
+
+from dirmagic.generic_criteria import (
+    HasDir,
+    HasEntry,
+    HasEntryGlob,
+    HasFile,
+    HasFilePattern,
+)
+from dirmagic.snapshot import (
+    DirectorySnapshot,
+    get_snapshot,
+    snapshot_cache,
+)
+
+
+def test_directory_snapshot(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "file").write_text("hello\n")
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir_link").symlink_to(tmp_path / "dir")
+    (tmp_path / "broken_link").symlink_to(tmp_path / "missing")
+
+    snapshot = DirectorySnapshot(tmp_path)
+    assert sorted(snapshot.names()) == [
+        "broken_link",
+        "dir",
+        "dir_link",
+        "file",
+    ]
+    assert snapshot.is_file("file") and not snapshot.is_dir("file")
+    assert snapshot.is_dir("dir_link")
+    assert not snapshot.exists("broken_link")
+    assert not snapshot.exists("missing")
+    assert snapshot.stat("file").st_size == 6
+    assert sorted(snapshot.glob("dir*")) == ["dir", "dir_link"]
+    with pytest.raises(FileNotFoundError):
+        snapshot.stat("missing")
+
+    with pytest.raises(OSError):
+        DirectorySnapshot(tmp_path / "file")
+
+
+def test_snapshot_cache(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "file").write_text("Package: x\n")
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "sub_file").touch()
+    (tmp_path / "broken_link").symlink_to(tmp_path / "missing")
+
+    criteria = [
+        HasFile("file"),
+        HasFile("file", contents="^Package: "),
+        HasFile("file", contents="^Version: "),
+        HasFile("dir"),
+        HasFile("dir/sub_file"),
+        HasFile(pathlib.Path("dir", "sub_file")),
+        HasDir("dir"),
+        HasDir("file"),
+        HasEntry("broken_link"),
+        HasEntry("dir/"),
+        HasEntry("."),
+        HasEntryGlob("f*"),
+        HasEntryGlob("*/sub_*"),
+        HasEntryGlob("x*"),
+        HasFilePattern("^f"),
+        HasFilePattern("^d"),
+    ]
+    expected = [bool(c.test(tmp_path)) for c in criteria]
+    assert get_snapshot(tmp_path) is None
+
+    with snapshot_cache():
+        assert [bool(c.test(tmp_path)) for c in criteria] == expected
+        snapshot = get_snapshot(tmp_path)
+        assert snapshot is not None
+        assert get_snapshot(tmp_path) is snapshot
+        with snapshot_cache():
+            assert get_snapshot(tmp_path) is snapshot
+        # the snapshot does not see changes
+        os.remove(tmp_path / "file")
+        assert HasFile("file").test(tmp_path)
+        assert get_snapshot(tmp_path / "missing") is None
+
+    assert not HasFile("file").test(tmp_path)
+    assert get_snapshot(tmp_path) is None
+
+
+def test_snapshot_case_variants(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    (tmp_path / "Setup.py").touch()
+    snapshot = DirectorySnapshot(tmp_path)
+    # the filesystem decides, case-sensitive here
+    case_sensitive = not (tmp_path / "setup.py").exists()
+    assert snapshot.is_file("setup.py") != case_sensitive
+    assert HasFile("setup.py").matches(tmp_path) != case_sensitive
+
+    # a case-insensitive filesystem
+    lstat = os.lstat
+    monkeypatch.setattr(
+        os,
+        "lstat",
+        lambda path: lstat(os.path.join(tmp_path, "Setup.py")),
+    )
+    assert snapshot.is_file("setup.py")
+    assert snapshot.exists("SETUP.PY")
+    assert not snapshot.exists("setup.cfg")
@@ -0,0 +1,127 @@
+import json
+import pathlib
+import pickle
+import re
+
+import pytest
+
+import dirmagic.generic_criteria
+import dirmagic.project_types
+from dirmagic.core_criteria import (
+    CriterionFromTestFun,
+    from_dict,
+    ProjectType,
+    register_test_function,
+)
+from dirmagic.generic_criteria import HasBasename, HasDir, HasFile
+from dirmagic.pattern_criteria import (
+    AnyMatchCriterion,
+    FileTest,
+    MatchesPattern,
+)
+from dirmagic.spec import compile_spec, load_criterion
+
+
+def test_to_dict() -> None:
+    assert (HasDir(".git") | HasBasename("src")).to_dict() == {
+        "type": "AnyCriteria",
+        "criteria": [
+            {"type": "HasDir", "dirname": ".git"},
+            {"type": "HasBasename", "basename": "src"},
+        ],
+    }
+    assert HasFile(pathlib.Path("a") / "b").to_dict()["filename"] == "a/b"
+
+    for project_type in vars(dirmagic.project_types).values():
+        if isinstance(project_type, ProjectType):
+            data = json.loads(json.dumps(project_type.to_dict()))
+            assert from_dict(data) == project_type
+
+    with pytest.raises(ValueError):
+        from_dict({"type": "NoSuchCriterion"})
+    with pytest.raises(TypeError):
+        CriterionFromTestFun(lambda dir: True).to_dict()
+    with pytest.raises(TypeError):
+        # the flags are not part of the pattern string
+        MatchesPattern("{0}", re.compile("a", re.IGNORECASE)).to_dict()
+    assert MatchesPattern("{0}", "(?i)a").to_dict()["pattern"] == "(?i)a"
+    any_match = AnyMatchCriterion(
+        re.compile("a", re.IGNORECASE), HasFile("{0[0]}")
+    )
+    with pytest.raises(TypeError):
+        any_match.to_dict()
+    assert any_match.optimize() == any_match
+    has_contents = HasFile("a", contents=re.compile("^a"))  # type: ignore
+    assert from_dict(has_contents.to_dict()) == HasFile("a", contents="^a")
+    with pytest.raises(TypeError):
+        HasFile("a", contents=re.compile("a", re.I)).to_dict()  # type: ignore
+
+
+def test_from_dict_subclass_names() -> None:
+    class HasDir(dirmagic.generic_criteria.HasDir):
+        pass
+
+    data = HasDir(".git").to_dict()
+    assert data["type"] == f"{__name__}.{HasDir.__qualname__}"
+    assert type(from_dict(data)) is HasDir
+    assert type(from_dict({"type": "HasDir", "dirname": ".git"})) is (
+        dirmagic.generic_criteria.HasDir
+    )
+
+
+def test_registered_test_functions(tmp_path: pathlib.Path) -> None:
+    always = register_test_function(lambda dir: True, "test_spec_always")
+    criterion = CriterionFromTestFun(always) & FileTest("a", "not_empty")
+    assert from_dict(criterion.to_dict()) == criterion
+    # lambdas are pickled by name
+    assert pickle.loads(pickle.dumps(criterion)) == criterion
+
+    (tmp_path / "a").write_text("a")
+    assert criterion.test(tmp_path)
+    (tmp_path / "a").write_text("")
+    assert not criterion.test(tmp_path)
+
+
+def test_load_criterion(tmp_path: pathlib.Path) -> None:
+    spec = {"a/b.xml": "not_empty", "src/*.c": "not_empty", "build": False}
+    criterion = load_criterion(spec)
+    assert load_criterion(json.dumps(spec, indent=2)) is criterion
+    assert compile_spec(spec) is not criterion
+    assert compile_spec(spec) == criterion
+
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "b.xml").write_text("<b/>")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "x.c").touch()
+    assert not criterion.test(tmp_path)
+    (tmp_path / "src" / "y.c").write_text("int y;")
+    assert criterion.test(tmp_path)
+    (tmp_path / "build").mkdir()
+    assert not criterion.test(tmp_path)
+
+    # the glob is searched for inside `src` only
+    glob_criterion = compile_spec({"src/*.c": "not_empty"})
+    assert isinstance(glob_criterion, AnyMatchCriterion)
+    assert glob_criterion.subdir == "src"
+
+    # the boolean globs are matched like the globs with tests
+    mixed_criterion = compile_spec({"src/*.c": "not_empty", "*.c": True})
+    assert mixed_criterion.test(tmp_path)
+    assert not compile_spec({"*.c": False}).test(tmp_path)
+    assert compile_spec({"src/*.h": False}).test(tmp_path)
+
+    assert load_criterion(HasDir(".git").to_dict()) == HasDir(".git")
+    with pytest.raises(ValueError):
+        load_criterion({"a": 1})
+    with pytest.raises(KeyError):
+        compile_spec({"a": "no_such_test_function"})
+
+    # registered test functions are loaded by their names
+    is_file = register_test_function(pathlib.Path.is_file, "test_spec_is_file")
+    assert load_criterion({"a/b.xml": is_file}) is load_criterion(
+        {"a/b.xml": "test_spec_is_file"}
+    )
+    with pytest.raises(ValueError):
+        load_criterion({"a/b.xml": lambda path: True})
+    with pytest.raises(ValueError):
+        load_criterion({"type": "HasDir", "dirname": pathlib.Path(".git")})
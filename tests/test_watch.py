@@ -0,0 +1,90 @@
+import pathlib
+import shutil
+import sys
+import typing
+
+import pytest
+
+from dirmagic.project_types import is_vcs_root
+from dirmagic.watch import ProjectEvent, ProjectWatcher, watch_projects
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="inotify is Linux only"
+)
+
+
+def poll_all(watcher: ProjectWatcher) -> typing.List[ProjectEvent]:
+    # collect the events until things settle down
+    events: typing.List[ProjectEvent] = []
+    while True:
+        new_events = watcher.poll(timeout=0.2)
+        if not new_events:
+            return events
+        events.extend(new_events)
+
+
+def test_project_watcher(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / "c").mkdir(parents=True)
+
+    with ProjectWatcher(tmp_path, is_vcs_root, maxdepth=-1) as watcher:
+        assert watcher.initial_events == [
+            ProjectEvent("added", tmp_path / "a")
+        ]
+
+        # a new project in a directory searched
+        (tmp_path / "b" / "c" / ".git").mkdir()
+        assert poll_all(watcher) == [
+            ProjectEvent("added", tmp_path / "b" / "c")
+        ]
+
+        # a new directory tree
+        (tmp_path / "d" / "e" / ".git").mkdir(parents=True)
+        poll_all(watcher)
+        assert watcher.current_projects() == [
+            tmp_path / "a",
+            tmp_path / "b" / "c",
+            tmp_path / "d" / "e",
+        ]
+
+        # a project containing projects
+        (tmp_path / "b" / ".git").mkdir()
+        assert poll_all(watcher) == [
+            ProjectEvent("removed", tmp_path / "b" / "c"),
+            ProjectEvent("added", tmp_path / "b"),
+        ]
+        (tmp_path / "b" / ".git").rmdir()
+        assert poll_all(watcher) == [
+            ProjectEvent("removed", tmp_path / "b"),
+            ProjectEvent("added", tmp_path / "b" / "c"),
+        ]
+
+        # removed and renamed directories
+        shutil.rmtree(tmp_path / "d")
+        assert poll_all(watcher) == [
+            ProjectEvent("removed", tmp_path / "d" / "e")
+        ]
+        (tmp_path / "a").rename(tmp_path / "f")
+        assert sorted(poll_all(watcher)) == [
+            ProjectEvent("added", tmp_path / "f"),
+            ProjectEvent("removed", tmp_path / "a"),
+        ]
+
+
+def test_project_watcher_maxdepth(tmp_path: pathlib.Path) -> None:
+    with ProjectWatcher(tmp_path, is_vcs_root, maxdepth=1) as watcher:
+        assert watcher.initial_events == []
+        (tmp_path / "a" / "b" / ".git").mkdir(parents=True)
+        (tmp_path / "c" / ".git").mkdir(parents=True)
+        poll_all(watcher)
+        assert watcher.current_projects() == [tmp_path / "c"]
+
+
+def test_watch_projects(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "a" / ".git").mkdir(parents=True)
+    events = watch_projects(tmp_path, is_vcs_root, prune=True)
+    assert next(events) == ProjectEvent("added", tmp_path / "a")
+    (tmp_path / "node_modules" / ".git").mkdir(parents=True)
+    (tmp_path / "b" / ".git").mkdir(parents=True)
+    assert next(events) == ProjectEvent("added", tmp_path / "b")
+    events.close()